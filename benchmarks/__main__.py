@@ -0,0 +1,146 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from differ_for_code import differ
+
+from benchmarks.corpus import generate_pair
+
+# metrics compared with the baseline (smaller is better)
+METRICS = [
+    "diff_seconds",
+    "distance_seconds",
+    "similarity_seconds",
+    "visualize_seconds",
+    "peak_memory_bytes",
+]
+
+
+def main(args: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="benchmark of differ_for_code")
+    parser.add_argument("--lines", default="10,100,1000,10000", help="comma separated numbers of lines (up to 100000)")
+    parser.add_argument("--edit-rate", default="0.05", help="comma separated ratios of the edited lines")
+    parser.add_argument("--repeat-ratio", default="0.1", help="comma separated ratios of the repeated lines")
+    parser.add_argument("--replace-mix", default="0.5", help="comma separated ratios of LINE_REPLACE among the replaces")
+    parser.add_argument("--algorithm", default="ratcliff")
+    parser.add_argument("--repeat", type=int, default=3, help="the best time of the repeats is recorded")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the result as JSON")
+    parser.add_argument("--baseline", help="JSON of the previous result to compare")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed ratio of the regression from the baseline")
+    options = parser.parse_args(args)
+
+    cases = []
+    for lines in __parse_list(options.lines, int):
+        for edit_rate in __parse_list(options.edit_rate, float):
+            for repeat_ratio in __parse_list(options.repeat_ratio, float):
+                for replace_mix in __parse_list(options.replace_mix, float):
+                    case = run_case(lines, edit_rate, repeat_ratio, replace_mix, options.algorithm, options.repeat, options.seed)
+                    print(
+                        f"{case['name']}: diff {case['diff_seconds']:.4f}s ({case['diff_lines_per_second']:.0f} lines/s), "
+                        f"distance {case['distance_seconds']:.4f}s, similarity {case['similarity_seconds']:.4f}s, "
+                        f"visualize {case['visualize_seconds']:.4f}s, peak memory {case['peak_memory_bytes']} bytes",
+                        file=sys.stderr)
+                    cases.append(case)
+
+    result = {
+        "python": platform.python_version(),
+        "algorithm": options.algorithm,
+        "cases": cases,
+    }
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, result, options.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+def run_case(
+    lines: int,
+    edit_rate: float,
+    repeat_ratio: float,
+    replace_mix: float,
+    algorithm: str,
+    repeat: int,
+    seed: int) -> Dict[str, Any]:
+
+    before, after = generate_pair(lines, edit_rate, repeat_ratio, replace_mix, seed)
+    total_lines = len(before) + len(after)
+    total_tokens = sum(len(line_tokens) for line_tokens in before) + sum(len(line_tokens) for line_tokens in after)
+
+    result = differ.diff(before, after, algorithm=algorithm)
+    diff_seconds = __best_time(lambda: differ.diff(before, after, algorithm=algorithm), repeat)
+
+    def visualize():
+        with contextlib.redirect_stdout(io.StringIO()):
+            result.visualize()
+
+    # peak memory is measured separately because tracemalloc slows down
+    tracemalloc.start()
+    differ.diff(before, after, algorithm=algorithm)
+    _, peak_memory_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "name": f"lines={lines},edit_rate={edit_rate},repeat_ratio={repeat_ratio},replace_mix={replace_mix}",
+        "lines": lines,
+        "edit_rate": edit_rate,
+        "repeat_ratio": repeat_ratio,
+        "replace_mix": replace_mix,
+        "diffs": len(result.diffs),
+        "contain_bulk_replace": result.contain_bulk_replace,
+        "diff_seconds": diff_seconds,
+        "diff_lines_per_second": total_lines / diff_seconds if diff_seconds > 0 else 0,
+        "diff_tokens_per_second": total_tokens / diff_seconds if diff_seconds > 0 else 0,
+        "distance_seconds": __best_time(result.get_distance, repeat),
+        "similarity_seconds": __best_time(result.get_similarity, repeat),
+        "visualize_seconds": __best_time(visualize, repeat),
+        "peak_memory_bytes": peak_memory_bytes,
+    }
+
+
+def compare(baseline: Dict[str, Any], result: Dict[str, Any], threshold: float) -> List[str]:
+    # metrics which are worse than the baseline by more than the threshold
+    baseline_cases = { case["name"]: case for case in baseline["cases"] }
+    regressions = []
+    for case in result["cases"]:
+        baseline_case = baseline_cases.get(case["name"])
+        if baseline_case is None:
+            continue
+        for metric in METRICS:
+            if metric not in baseline_case:
+                continue
+            if case[metric] > baseline_case[metric] * (1 + threshold):
+                regressions.append(f"{case['name']} {metric}: {baseline_case[metric]} -> {case[metric]}")
+    return regressions
+
+
+def __best_time(function: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def __parse_list(value: str, type: Callable[[str], Any]) -> List[Any]:
+    return [ type(item) for item in value.split(",") if item != "" ]
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
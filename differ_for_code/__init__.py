@@ -1,5 +1,9 @@
+import sys
+import time
+from array import array
 from enum import Enum
-from typing import Any, List, Optional
+from typing import (Any, BinaryIO, Dict, Iterable, Iterator, List,
+                    Optional, Sequence, TextIO, Tuple, Union)
 
 from differ_for_code import visualizer
 
@@ -11,18 +15,50 @@ class DiffType(Enum):
     REPLACE = "replace"
     BULK_REPLACE = "bulk_replace"
     LINE_REPLACE = "line_replace"
+    MOVE = "move"
 
 
 class DiffBase:
 
+    __slots__ = ("label", "before", "after")
+
     def __init__(self, label: DiffType, before: Any, after: Any):
         self.label = label
         self.before = before
         self.after = after
 
 
+    def __eq__(self, other: Any) -> bool:
+        if type(self) != type(other):
+            return False
+        # compare all attributes defined by __slots__ of the class and its parents
+        return all(
+            getattr(self, name) == getattr(other, name)
+            for cls in type(self).__mro__
+            for name in getattr(cls, "__slots__", ())
+        )
+
+
+    def __hash__(self) -> int:
+        # consistent with __eq__ (the lists of the tokens are hashed as tuples)
+        return hash((type(self),) + tuple(
+            DiffBase.__hashable(getattr(self, name))
+            for cls in type(self).__mro__
+            for name in getattr(cls, "__slots__", ())
+        ))
+
+
+    @staticmethod
+    def __hashable(value: Any) -> Any:
+        if isinstance(value, list):
+            return tuple(DiffBase.__hashable(item) for item in value)
+        return value
+
+
 class LineDiff(DiffBase):
 
+    __slots__ = ("before_line_number", "after_line_number")
+
     def __init__(
         self,
         label: DiffType,
@@ -80,6 +116,8 @@ class LineDiff(DiffBase):
 
 class BulkReplace(DiffBase):
 
+    __slots__ = ("before_line_start_number", "before_line_end_number", "after_line_start_number", "after_line_end_number")
+
     def __init__(
         self,
         before_lined_tokens: List[List[str]],
@@ -119,8 +157,27 @@ class BulkReplace(DiffBase):
         return BulkReplace(before_lined_tokens, after_lined_tokens, before_line_start_number, after_line_start_number)
 
 
+# A block of lines deleted from before and inserted into after (see differ_for_code.moves)
+# the lines are also in the DELETE/INSERT/BULK_REPLACE diffs, so a BlockMove is kept in DiffResult.moves, not in DiffResult.diffs
+class BlockMove(BulkReplace):
+
+    __slots__ = ()
+
+    def __init__(
+        self,
+        before_lined_tokens: List[List[str]],
+        after_lined_tokens: List[List[str]],
+        before_line_number_start: int,
+        after_line_number_start: int):
+
+        super().__init__(before_lined_tokens, after_lined_tokens, before_line_number_start, after_line_number_start)
+        self.label = DiffType.MOVE
+
+
 class LineReplace(DiffBase):
 
+    __slots__ = ("before_line_number", "after_line_number")
+
     def __init__(
         self,
         before_line_token_diffs: List['TokenDiff'],
@@ -158,6 +215,8 @@ class LineReplace(DiffBase):
 
 class TokenDiff(DiffBase):
 
+    __slots__ = ("before_column_start_number", "before_column_end_number", "after_column_start_number", "after_column_end_number")
+
     def __init__(
         self,
         label: DiffType,
@@ -214,104 +273,319 @@ class TokenDiff(DiffBase):
         return TokenDiff(DiffType.DELETE, token, None, before_column_start_number, after_column_start_number)
 
 
+# Compact storage of diffs
+# labels, line numbers and token columns are stored in parallel arrays,
+# and LineDiff/BulkReplace/LineReplace/TokenDiff are created only when they are accessed
+# NOTE: tokens are not copied, this refers to the token lists given to differ.diff
+class CompactDiffs(Sequence[DiffBase]):
+
+    LABELS = list(DiffType)
+    # label -> index in LABELS (the code stored in the arrays)
+    LABEL_CODES = { label: code for code, label in enumerate(LABELS) }
+
+    def __init__(
+        self,
+        before_lined_tokens: Sequence[List[str]],
+        after_lined_tokens: Sequence[List[str]]):
+
+        self.before_lined_tokens = before_lined_tokens
+        self.after_lined_tokens = after_lined_tokens
+
+        # for each diff
+        self.labels = array("b")
+        # line number (LineDiff/LineReplace) or start line number (BulkReplace)
+        self.before_line_numbers = array("i")
+        self.after_line_numbers = array("i")
+        # end line number (BulkReplace), or the position of the first token in the token arrays (LineReplace)
+        # 1 if before is not the same as after (LineDiff of EQUAL, e.g. differ.diff(..., normalizer=...))
+        self.before_line_ends = array("i")
+        self.after_line_ends = array("i")
+
+        # for each token of LineReplace (tokens of before, then tokens of after)
+        self.token_labels = array("b")
+        self.token_before_column_numbers = array("i")
+        self.token_after_column_numbers = array("i")
+        # position -> token of the other side, only for EQUAL TokenDiffs whose before is not the same as after
+        self.token_partners: Dict[int, str] = {}
+
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return [ self.__view(i) for i in range(*index.indices(len(self))) ]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("diff index out of range")
+        return self.__view(index)
+
+
+    def __iter__(self) -> Iterator[DiffBase]:
+        for index in range(len(self)):
+            yield self.__view(index)
+
+
+    def append(self, diff: DiffBase):
+        self.labels.append(CompactDiffs.LABEL_CODES[diff.label])
+        if type(diff) == BulkReplace:
+            self.before_line_numbers.append(diff.before_line_start_number)
+            self.after_line_numbers.append(diff.after_line_start_number)
+            self.before_line_ends.append(diff.before_line_end_number)
+            self.after_line_ends.append(diff.after_line_end_number)
+        elif type(diff) == LineDiff:
+            self.before_line_numbers.append(diff.before_line_number)
+            self.after_line_numbers.append(diff.after_line_number)
+            self.before_line_ends.append(1 if diff.label == DiffType.EQUAL and diff.before is not diff.after and diff.before != diff.after else 0)
+            self.after_line_ends.append(0)
+        elif type(diff) == LineReplace:
+            self.before_line_numbers.append(diff.before_line_number)
+            self.after_line_numbers.append(diff.after_line_number)
+            # the tokens are the tokens of the lines in order, so only the labels and the columns are stored
+            self.before_line_ends.append(len(self.token_labels))
+            self.after_line_ends.append(len(self.token_labels) + len(diff.before))
+            for index, token_diff in enumerate(diff.before + diff.after):
+                if token_diff.label == DiffType.EQUAL and token_diff.before != token_diff.after:
+                    self.token_partners[len(self.token_labels)] = token_diff.after if index < len(diff.before) else token_diff.before
+                self.token_labels.append(CompactDiffs.LABEL_CODES[token_diff.label])
+                self.token_before_column_numbers.append(token_diff.before_column_start_number)
+                self.token_after_column_numbers.append(token_diff.after_column_start_number)
+        else:
+            raise Exception("unknown diff type")
+
+
+    def extend(self, diffs: List[DiffBase]):
+        for diff in diffs:
+            self.append(diff)
+
+
+    def count_distance(self) -> Tuple[int, int]:
+        # (distance, total) without creating the views
+        distance = 0
+        total = 0
+        token_position = 0
+        for index in range(len(self)):
+            label = CompactDiffs.LABELS[self.labels[index]]
+            if label == DiffType.BULK_REPLACE:
+                length = sum(len("".join(line_tokens)) for line_tokens in self.before_lined_tokens[self.before_line_numbers[index]:self.before_line_ends[index]])
+                length += sum(len("".join(line_tokens)) for line_tokens in self.after_lined_tokens[self.after_line_numbers[index]:self.after_line_ends[index]])
+                distance += length
+                total += length
+            elif label == DiffType.LINE_REPLACE:
+                for token_diffs_label, tokens in [
+                    (DiffType.DELETE, self.before_lined_tokens[self.before_line_numbers[index]]),
+                    (DiffType.INSERT, self.after_lined_tokens[self.after_line_numbers[index]]) ]:
+                    for token in tokens:
+                        if CompactDiffs.LABELS[self.token_labels[token_position]] == token_diffs_label:
+                            distance += len(token)
+                        total += len(token)
+                        token_position += 1
+            else:
+                if label in [ DiffType.DELETE, DiffType.EQUAL ]:
+                    length = len("".join(self.before_lined_tokens[self.before_line_numbers[index]]))
+                    total += length
+                    if label == DiffType.DELETE:
+                        distance += length
+                if label in [ DiffType.INSERT, DiffType.EQUAL ]:
+                    length = len("".join(self.after_lined_tokens[self.after_line_numbers[index]]))
+                    total += length
+                    if label == DiffType.INSERT:
+                        distance += length
+        return (distance, total)
+
+
+    def __view(self, index: int) -> DiffBase:
+        label = CompactDiffs.LABELS[self.labels[index]]
+        before_line_number = self.before_line_numbers[index]
+        after_line_number = self.after_line_numbers[index]
+
+        if label == DiffType.BULK_REPLACE:
+            return BulkReplace.bulk_replace(
+                self.before_lined_tokens[before_line_number:self.before_line_ends[index]],
+                self.after_lined_tokens[after_line_number:self.after_line_ends[index]],
+                before_line_number,
+                after_line_number)
+
+        elif label == DiffType.LINE_REPLACE:
+            before_tokens = self.before_lined_tokens[before_line_number]
+            after_tokens = self.after_lined_tokens[after_line_number]
+            before_token_position = self.before_line_ends[index]
+            after_token_position = self.after_line_ends[index]
+            before_line_token_diffs = [
+                self.__token_view(before_token_position + token_index, token, True)
+                for token_index, token in enumerate(before_tokens)
+            ]
+            after_line_token_diffs = [
+                self.__token_view(after_token_position + token_index, token, False)
+                for token_index, token in enumerate(after_tokens)
+            ]
+            return LineReplace.line_replace(before_line_token_diffs, after_line_token_diffs, before_line_number, after_line_number)
+
+        elif label == DiffType.EQUAL:
+            if self.before_line_ends[index] == 1:
+                return LineDiff(DiffType.EQUAL, self.before_lined_tokens[before_line_number], self.after_lined_tokens[after_line_number], before_line_number, after_line_number)
+            # contents of before/after is equal if EQUAL
+            return LineDiff.equal_line(self.after_lined_tokens[after_line_number], before_line_number, after_line_number)
+        elif label == DiffType.INSERT:
+            return LineDiff.insert_line(self.after_lined_tokens[after_line_number], before_line_number, after_line_number)
+        else:
+            return LineDiff.delete_line(self.before_lined_tokens[before_line_number], before_line_number, after_line_number)
+
+
+    def __token_view(self, position: int, token: str, is_before: bool) -> 'TokenDiff':
+        label = CompactDiffs.LABELS[self.token_labels[position]]
+        before_column_start_number = self.token_before_column_numbers[position]
+        after_column_start_number = self.token_after_column_numbers[position]
+        if label == DiffType.EQUAL:
+            partner = self.token_partners.get(position)
+            if partner is None:
+                return TokenDiff.equal_token(token, before_column_start_number, after_column_start_number)
+            elif is_before:
+                return TokenDiff(DiffType.EQUAL, token, partner, before_column_start_number, after_column_start_number)
+            else:
+                return TokenDiff(DiffType.EQUAL, partner, token, before_column_start_number, after_column_start_number)
+        elif is_before:
+            return TokenDiff.delete_token(token, before_column_start_number, after_column_start_number)
+        else:
+            return TokenDiff.insert_token(token, before_column_start_number, after_column_start_number)
+
+
 class DiffResult:
 
-    def __init__(self, diffs: List[DiffBase], contain_bulk_replace: bool):
+    def __init__(self, diffs: Sequence[DiffBase], contain_bulk_replace: bool):
         self.diffs = diffs
         self.contain_bulk_replace = contain_bulk_replace
+        # DiffStats if the statistics are collected (differ.diff(..., stats=True))
+        self.stats = None
+        # BlockMoves if the moves are detected (differ.diff(..., moves=True))
+        self.moves: List[BlockMove] = []
 
 
     def __str__(self):
-        res = ""
-        for diff in self.diffs:
-            res += f"{diff}\n"
+        res = "".join([ f"{diff}\n" for diff in self.diffs ])
         res = res.strip()
         return res
 
 
-    def visualize(self):
-        for diff in self.diffs:
+    def __eq__(self, other: Any) -> bool:
+        if type(self) != type(other):
+            return False
+        return (self.contain_bulk_replace == other.contain_bulk_replace
+            and self.moves == other.moves
+            and len(self.diffs) == len(other.diffs)
+            and all(diff == other_diff for diff, other_diff in zip(self.diffs, other.diffs)))
+
+
+    def __hash__(self) -> int:
+        # consistent with __eq__ (the same diffs give the same hash whether compact or not)
+        return hash((self.contain_bulk_replace, tuple(self.moves), tuple(self.diffs)))
+
+
+    @staticmethod
+    def from_iter(diffs: Iterable[DiffBase], store: Optional[CompactDiffs] = None) -> 'DiffResult':
+        # collect the diffs (e.g. differ.iter_diff) into a list or the given compact storage
+        result = [] if store is None else store
+        contains_bulk_replace = False
+        for diff in diffs:
             if type(diff) == BulkReplace:
-                before_str = "\n".join([ "".join(line_tokens) for line_tokens in diff.before ])
-                visualizer.print_delete(before_str)
-                print()
-                after_str = "\n".join([ "".join(line_tokens) for line_tokens in diff.after ])
-                visualizer.print_insert(after_str)
-                print()
-            elif type(diff) == LineDiff:
-                if diff.label == DiffType.INSERT:
-                    visualizer.print_insert("".join(diff.after))
-                elif diff.label == DiffType.DELETE:
-                    visualizer.print_delete("".join(diff.before))
-                else:
-                    visualizer.print_normal("".join(diff.before))
-                print()
-            elif type(diff) == LineReplace:
-                for token_diff in diff.before:
-                    if token_diff.label == DiffType.DELETE:
-                        visualizer.print_replace(token_diff.before)
-                    else:
-                        visualizer.print_delete(token_diff.before)
-                print()
-                for token_diff in diff.after:
-                    if token_diff.label == DiffType.INSERT:
-                        visualizer.print_replace(token_diff.after)
-                    else:
-                        visualizer.print_insert(token_diff.after)
-                print()
-            else:
-                raise Exception("unknown diff type")
-    
+                contains_bulk_replace = True
+            result.append(diff)
+        return DiffResult(result, contains_bulk_replace)
 
-    def get_distance(self) -> int:
-        distance = 0
-        for diff in self.diffs:
-            if type(diff) == LineDiff:
-                if diff.label == DiffType.DELETE:
-                    distance += len("".join(diff.before))
-                elif diff.label == DiffType.INSERT:
-                    distance += len("".join(diff.after))
-            elif diff.label == DiffType.BULK_REPLACE:
-                distance += sum(len("".join(line_tokens)) for line_tokens in diff.before)
-                distance += sum(len("".join(line_tokens)) for line_tokens in diff.after)
-            elif diff.label == DiffType.LINE_REPLACE:
-                distance += sum([
-                    len(token_diff.before)
-                    for token_diff in diff.before
-                    if token_diff.label == DiffType.DELETE
-                ])
-                distance += sum([
-                    len(token_diff.after)
-                    for token_diff in diff.after
-                    if token_diff.label == DiffType.INSERT
-                ])
 
+    def dump(self, fp: BinaryIO, format: str = "binary"):
+        # append this result to the file as one record (format is "binary" or "jsonl")
+        from differ_for_code import serialize
+        serialize.dump(self, fp, format)
+
+
+    @staticmethod
+    def load(fp: BinaryIO, format: str = "binary") -> Optional['DiffResult']:
+        # read one record from the current position of the file (None at the end of the file)
+        from differ_for_code import serialize
+        return serialize.load(fp, format)
+
+
+    def visualize(self):
+        DiffResult.visualize_diffs(self.diffs)
+
+
+    @staticmethod
+    def visualize_diffs(diffs: Iterable[DiffBase]):
+        from differ_for_code import renderer
+        renderer.render(diffs, sys.stdout, "ansi")
+
+
+    def render(self, stream: Optional[TextIO] = None, format: str = "ansi") -> Optional[str]:
+        # format is "ansi", "plain" or "html"
+        # returns the rendered string if stream is None
+        from differ_for_code import renderer
+        return renderer.render(self.diffs, stream, format)
+    
+
+    # exclude_moves: the moved lines are not counted in the distance (they are counted in the total)
+    def get_distance(self, exclude_moves: bool = False) -> int:
+        distance, _ = self.__count_distance(exclude_moves)
         return distance
 
 
-    def get_similarity(self) -> float:
+    def get_similarity(self, exclude_moves: bool = False) -> float:
+        distance, total = self.__count_distance(exclude_moves)
+        if total == 0:
+            # no diff
+            return 1
+        else:
+            return 1. - distance / total
+
+
+    def __count_distance(self, exclude_moves: bool) -> Tuple[int, int]:
+        start = time.perf_counter() if self.stats is not None else 0
+        distance, total = DiffResult.count_distance(self.diffs)
+        if exclude_moves:
+            # the moved lines are counted as deleted and inserted
+            for move in self.moves:
+                distance -= sum(len("".join(line_tokens)) for line_tokens in move.before)
+                distance -= sum(len("".join(line_tokens)) for line_tokens in move.after)
+        if self.stats is not None:
+            self.stats.add_phase("score", time.perf_counter() - start)
+        return (distance, total)
+
+
+    @staticmethod
+    def count_distance(diffs: Iterable[DiffBase]) -> Tuple[int, int]:
+        # (distance, total) in one pass, so that diffs can be a stream (e.g. differ.iter_diff)
+        if isinstance(diffs, CompactDiffs):
+            return diffs.count_distance()
+
+        distance = 0
         total = 0
-        for diff in self.diffs:
-            if type(diff) == LineDiff:  
+        for diff in diffs:
+            if type(diff) == LineDiff:
                 if diff.label in [ DiffType.DELETE, DiffType.EQUAL ]:
-                    total += len("".join(diff.before))
+                    length = len("".join(diff.before))
+                    total += length
+                    if diff.label == DiffType.DELETE:
+                        distance += length
                 if diff.label in [ DiffType.INSERT, DiffType.EQUAL ]:
-                    total += len("".join(diff.after))
+                    length = len("".join(diff.after))
+                    total += length
+                    if diff.label == DiffType.INSERT:
+                        distance += length
             elif diff.label == DiffType.BULK_REPLACE:
-                total += sum(len("".join(line_tokens)) for line_tokens in diff.before)
-                total += sum(len("".join(line_tokens)) for line_tokens in diff.after)
+                length = sum(len("".join(line_tokens)) for line_tokens in diff.before)
+                length += sum(len("".join(line_tokens)) for line_tokens in diff.after)
+                distance += length
+                total += length
             elif diff.label == DiffType.LINE_REPLACE:
-                total += sum([
-                    len(token_diff.before)
-                    for token_diff in diff.before
-                ])
-                total += sum([
-                    len(token_diff.after)
-                    for token_diff in diff.after
-                ])
-        
-        if total == 0:
-            # no diff
-            return 1
-        else:
-            return 1. - self.get_distance() / total
+                for token_diff in diff.before:
+                    total += len(token_diff.before)
+                    if token_diff.label == DiffType.DELETE:
+                        distance += len(token_diff.before)
+                for token_diff in diff.after:
+                    total += len(token_diff.after)
+                    if token_diff.label == DiffType.INSERT:
+                        distance += len(token_diff.after)
+
+        return (distance, total)
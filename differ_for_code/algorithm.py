@@ -0,0 +1,316 @@
+from bisect import bisect_left
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Sequence, Tuple
+
+# names of the algorithms for the line-level matching
+# ratcliff: difflib.SequenceMatcher (Ratcliff-Obershelp with autojunk heuristic)
+# myers: Myers' O(ND) difference algorithm (linear space) with a cost limit
+# patience: patience diff (unique lines as anchors) falling back to myers
+# histogram: histogram diff (lowest occurrence lines as anchors) falling back to myers
+ALGORITHMS = ("ratcliff", "myers", "patience", "histogram")
+
+# lines which appear more than this in a region are not used as anchors by histogram
+HISTOGRAM_MAX_CHAIN = 64
+
+# the search for the middle snake of a region gives up after this many edits
+# and the region is diffed by patience, or split at the furthest reaching point if there is no unique line
+MYERS_MAX_COST = 256
+
+
+# Calculate opcodes in the same format as SequenceMatcher.get_opcodes()
+def get_opcodes(
+    a: Sequence[Any],
+    b: Sequence[Any],
+    algorithm: str = "ratcliff") -> List[Tuple[str, int, int, int, int]]:
+
+    if algorithm == "ratcliff":
+        return SequenceMatcher(None, a, b).get_opcodes()
+
+    if algorithm == "myers":
+        matches = __myers(a, b, 0, len(a), 0, len(b))
+    elif algorithm == "patience":
+        matches = __patience(a, b, 0, len(a), 0, len(b))
+    elif algorithm == "histogram":
+        matches = __histogram(a, b)
+    else:
+        raise ValueError(f"unknown algorithm: {algorithm}")
+
+    return __opcodes_from_matches(matches, len(a), len(b))
+
+def __opcodes_from_matches(
+    matches: List[Tuple[int, int]],
+    a_len: int,
+    b_len: int) -> List[Tuple[str, int, int, int, int]]:
+
+    # merge the matched pairs (i, j) into matching blocks (i, j, size)
+    matches.sort()
+    blocks: List[List[int]] = []
+    for i, j in matches:
+        if blocks and blocks[-1][0] + blocks[-1][2] == i and blocks[-1][1] + blocks[-1][2] == j:
+            blocks[-1][2] += 1
+        else:
+            blocks.append([i, j, 1])
+    blocks.append([a_len, b_len, 0])
+
+    # same as SequenceMatcher.get_opcodes()
+    opcodes = []
+    i = j = 0
+    for ai, bj, size in blocks:
+        tag = ""
+        if i < ai and j < bj:
+            tag = "replace"
+        elif i < ai:
+            tag = "delete"
+        elif j < bj:
+            tag = "insert"
+        if tag:
+            opcodes.append((tag, i, ai, j, bj))
+        i, j = ai + size, bj + size
+        if size:
+            opcodes.append(("equal", ai, i, bj, j))
+    return opcodes
+
+def __trim(
+    a: Sequence[Any],
+    b: Sequence[Any],
+    a_lo: int,
+    a_hi: int,
+    b_lo: int,
+    b_hi: int,
+    matches: List[Tuple[int, int]]) -> Tuple[int, int, int, int]:
+
+    # common prefix/suffix always match
+    while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+        matches.append((a_lo, b_lo))
+        a_lo += 1
+        b_lo += 1
+    while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+        a_hi -= 1
+        b_hi -= 1
+        matches.append((a_hi, b_hi))
+    return (a_lo, a_hi, b_lo, b_hi)
+
+def __myers(
+    a: Sequence[Any],
+    b: Sequence[Any],
+    a_lo: int,
+    a_hi: int,
+    b_lo: int,
+    b_hi: int) -> List[Tuple[int, int]]:
+
+    # lines which do not appear in the other side never match, so they are removed before the search
+    # the matched lines are the same, and the edits left are usually much fewer (e.g. new lines)
+    a_elements = set(a[i] for i in range(a_lo, a_hi))
+    b_elements = set(b[j] for j in range(b_lo, b_hi))
+    a_indexes = [ i for i in range(a_lo, a_hi) if a[i] in b_elements ]
+    b_indexes = [ j for j in range(b_lo, b_hi) if b[j] in a_elements ]
+    a = [ a[i] for i in a_indexes ]
+    b = [ b[j] for j in b_indexes ]
+
+    matches: List[Tuple[int, int]] = []
+    regions = [(0, len(a), 0, len(b))]
+    while regions:
+        a_lo, a_hi, b_lo, b_hi = __trim(a, b, *regions.pop(), matches)
+        if a_lo == a_hi or b_lo == b_hi:
+            # only insert or delete remains
+            continue
+        # divide by a point on an optimal path (middle snake)
+        x, y, minimal = __middle_snake(a, b, a_lo, a_hi, b_lo, b_hi)
+        if not minimal and __unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi):
+            # too expensive: patience diff of the region if there are unique lines
+            # (patience falls back to myers only for the regions without unique lines, so this never recurs forever)
+            matches += __patience(a, b, a_lo, a_hi, b_lo, b_hi)
+            continue
+        regions.append((a_lo, a_lo + x, b_lo, b_lo + y))
+        regions.append((a_lo + x, a_hi, b_lo + y, b_hi))
+    return [ (a_indexes[i], b_indexes[j]) for i, j in matches ]
+
+def __middle_snake(
+    a: Sequence[Any],
+    b: Sequence[Any],
+    a_lo: int,
+    a_hi: int,
+    b_lo: int,
+    b_hi: int) -> Tuple[int, int, bool]:
+
+    # (x, y, whether the point is on an optimal path)
+    # the region must be trimmed (first/last elements differ), so the point is never at the corners
+    n = a_hi - a_lo
+    m = b_hi - b_lo
+    delta = n - m
+    odd = delta % 2 == 1
+    max_d = (n + m + 1) // 2
+    offset = max_d + 1
+    # furthest reaching x on each diagonal k (forward), and x' on each diagonal k' of the reversed sequences (backward)
+    forward = [0] * (2 * offset + 1)
+    backward = [0] * (2 * offset + 1)
+
+    for d in range(max_d + 1):
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[offset + k - 1] < forward[offset + k + 1]):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            forward[offset + k] = x
+            if odd and delta - (d - 1) <= k <= delta + (d - 1):
+                if x + backward[offset + delta - k] >= n:
+                    return (x, y, True)
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[offset + k - 1] < backward[offset + k + 1]):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[a_hi - 1 - x] == b[b_hi - 1 - y]:
+                x += 1
+                y += 1
+            backward[offset + k] = x
+            if not odd and -d <= delta - k <= d:
+                if x + forward[offset + delta - k] >= n:
+                    return (n - x, m - y, True)
+
+        if d >= MYERS_MAX_COST:
+            # too expensive: the furthest reaching point of the forward paths (the result may not be minimal)
+            # it is inside the region and never at the corners, because no forward path has reached the end yet
+            x, y = max(
+                ((x, x - k) for k, x in ((k, forward[offset + k]) for k in range(-d, d + 1, 2)) if x <= n and 0 <= x - k <= m),
+                key=lambda point: point[0] + point[1])
+            return (x, y, False)
+
+    raise Exception("middle snake is not found")
+
+def __patience(
+    a: Sequence[Any],
+    b: Sequence[Any],
+    a_lo: int,
+    a_hi: int,
+    b_lo: int,
+    b_hi: int) -> List[Tuple[int, int]]:
+
+    matches: List[Tuple[int, int]] = []
+    regions = [(a_lo, a_hi, b_lo, b_hi)]
+    while regions:
+        a_lo, a_hi, b_lo, b_hi = __trim(a, b, *regions.pop(), matches)
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+
+        anchors = __unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi)
+        if not anchors:
+            matches += __myers(a, b, a_lo, a_hi, b_lo, b_hi)
+            continue
+
+        # the anchors split the region into independent regions
+        previous_i, previous_j = a_lo, b_lo
+        for i, j in anchors:
+            matches.append((i, j))
+            regions.append((previous_i, i, previous_j, j))
+            previous_i, previous_j = i + 1, j + 1
+        regions.append((previous_i, a_hi, previous_j, b_hi))
+    return matches
+
+def __unique_anchors(
+    a: Sequence[Any],
+    b: Sequence[Any],
+    a_lo: int,
+    a_hi: int,
+    b_lo: int,
+    b_hi: int) -> List[Tuple[int, int]]:
+
+    # lines which appear exactly once in both of before/after
+    a_counts: Dict[Any, int] = {}
+    a_positions: Dict[Any, int] = {}
+    for i in range(a_lo, a_hi):
+        a_counts[a[i]] = a_counts.get(a[i], 0) + 1
+        a_positions[a[i]] = i
+    b_counts: Dict[Any, int] = {}
+    b_positions: Dict[Any, int] = {}
+    for j in range(b_lo, b_hi):
+        if a_counts.get(b[j]) == 1:
+            b_counts[b[j]] = b_counts.get(b[j], 0) + 1
+            b_positions[b[j]] = j
+    uniques = sorted(
+        (a_positions[element], j)
+        for element, j in b_positions.items()
+        if b_counts[element] == 1)
+    return _longest_increasing(uniques)
+
+def _longest_increasing(pairs: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+
+    # patience sorting: the longest subsequence of the pairs whose j increases (pairs are sorted by i)
+    tails: List[int] = []
+    tail_indexes: List[int] = []
+    previous_indexes: List[int] = []
+    for index, (_, j) in enumerate(pairs):
+        pile = bisect_left(tails, j)
+        if pile == len(tails):
+            tails.append(j)
+            tail_indexes.append(index)
+        else:
+            tails[pile] = j
+            tail_indexes[pile] = index
+        previous_indexes.append(tail_indexes[pile - 1] if pile > 0 else -1)
+
+    res = []
+    index = tail_indexes[-1] if tail_indexes else -1
+    while index >= 0:
+        res.append(pairs[index])
+        index = previous_indexes[index]
+    res.reverse()
+    return res
+
+def __histogram(
+    a: Sequence[Any],
+    b: Sequence[Any]) -> List[Tuple[int, int]]:
+
+    matches: List[Tuple[int, int]] = []
+    regions = [(0, len(a), 0, len(b))]
+    while regions:
+        a_lo, a_hi, b_lo, b_hi = __trim(a, b, *regions.pop(), matches)
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+
+        # positions of each line in before
+        a_positions: Dict[Any, List[int]] = {}
+        for i in range(a_lo, a_hi):
+            a_positions.setdefault(a[i], []).append(i)
+
+        # find the common block whose lowest occurrence count is the smallest (the longest if tie)
+        best = None
+        best_count = HISTOGRAM_MAX_CHAIN + 1
+        j = b_lo
+        while j < b_hi:
+            next_j = j + 1
+            positions = a_positions.get(b[j])
+            if positions is not None and len(positions) <= best_count:
+                for i in positions:
+                    start_i, start_j = i, j
+                    while start_i > a_lo and start_j > b_lo and a[start_i - 1] == b[start_j - 1]:
+                        start_i -= 1
+                        start_j -= 1
+                    end_i, end_j = i + 1, j + 1
+                    while end_i < a_hi and end_j < b_hi and a[end_i] == b[end_j]:
+                        end_i += 1
+                        end_j += 1
+                    count = min(len(a_positions[a[index]]) for index in range(start_i, end_i))
+                    if (count < best_count
+                    or (count == best_count and best is not None and end_i - start_i > best[2] - best[0])):
+                        best = (start_i, start_j, end_i, end_j)
+                        best_count = count
+                    next_j = max(next_j, end_j)
+            j = next_j
+
+        if best is None:
+            matches += __myers(a, b, a_lo, a_hi, b_lo, b_hi)
+            continue
+
+        start_i, start_j, end_i, end_j = best
+        matches += [ (start_i + index, start_j + index) for index in range(end_i - start_i) ]
+        regions.append((a_lo, start_i, b_lo, start_j))
+        regions.append((end_i, a_hi, end_j, b_hi))
+    return matches
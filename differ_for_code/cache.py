@@ -0,0 +1,194 @@
+import hashlib
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, List, NamedTuple, Optional
+
+from differ_for_code import CompactDiffs, DiffResult, differ, serialize
+
+# options of differ.diff which do not change the result
+IGNORED_OPTIONS = ("vocabulary", "memo")
+
+# version of the SQLite file (PRAGMA user_version), a file of another version is cleared when opened
+# 1: the results are stored in the binary format of differ_for_code.serialize
+DISK_VERSION = 1
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    disk_hits: int
+    misses: int
+    size: int
+    disk_size: int
+
+
+# Cache of differ.diff keyed by the hash of the tokens and the options
+# results are kept in an in-process LRU, and optionally in a SQLite file on the disk
+# each caller gets its own DiffResult (the diffs list, moves and stats are copied),
+# and the diff objects (and CompactDiffs) are shared, so do not modify them
+# NOTE: a hit does not call the hooks of differ_for_code.stats, and the stats of a hit are the ones of the diff which
+#       calculated it (None if it is loaded from the disk)
+class DiffCache:
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        path: Optional[str] = None,
+        max_disk_bytes: Optional[int] = None,
+        max_age: Optional[float] = None):
+
+        self.maxsize = maxsize
+        self.max_disk_bytes = max_disk_bytes
+        # seconds since the last access
+        self.max_age = max_age
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.results: 'OrderedDict[str, DiffResult]' = OrderedDict()
+
+        self.connection = None
+        if path is not None:
+            self.connection = sqlite3.connect(path)
+            if self.connection.execute("PRAGMA user_version").fetchone()[0] != DISK_VERSION:
+                self.connection.execute("DROP TABLE IF EXISTS diffs")
+                self.connection.execute(f"PRAGMA user_version = {DISK_VERSION}")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS diffs ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS diffs_accessed ON diffs (accessed)")
+            self.connection.commit()
+
+
+    def __enter__(self) -> 'DiffCache':
+        return self
+
+
+    def __exit__(self, *args: Any):
+        self.close()
+
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+    def diff(
+        self,
+        before_lined_tokens: List[List[str]],
+        after_lined_tokens: List[List[str]],
+        **options: Any) -> DiffResult:
+
+        key = DiffCache.key(before_lined_tokens, after_lined_tokens, **options)
+
+        result = self.results.get(key)
+        if result is not None:
+            self.hits += 1
+            self.results.move_to_end(key)
+            return DiffCache.__copy(result)
+
+        result = self.__load(key)
+        if result is not None:
+            self.disk_hits += 1
+            if options.get("compact"):
+                moves = result.moves
+                result = DiffResult.from_iter(result.diffs, CompactDiffs(before_lined_tokens, after_lined_tokens))
+                result.moves = moves
+        else:
+            self.misses += 1
+            result = differ.diff(before_lined_tokens, after_lined_tokens, **options)
+            self.__store(key, result)
+
+        self.results[key] = result
+        if len(self.results) > self.maxsize:
+            self.results.popitem(last=False)
+        return DiffCache.__copy(result)
+
+
+    def cache_info(self) -> CacheInfo:
+        disk_size = 0
+        if self.connection is not None:
+            disk_size = self.connection.execute("SELECT COUNT(*) FROM diffs").fetchone()[0]
+        return CacheInfo(self.hits, self.disk_hits, self.misses, len(self.results), disk_size)
+
+
+    def clear(self):
+        self.results.clear()
+        if self.connection is not None:
+            self.connection.execute("DELETE FROM diffs")
+            self.connection.commit()
+
+
+    @staticmethod
+    def key(
+        before_lined_tokens: List[List[str]],
+        after_lined_tokens: List[List[str]],
+        **options: Any) -> str:
+
+        # stable hash (independent of the process) of the tokens and the options
+        # lengths are hashed before the contents so that different token lists never have the same bytes
+        digest = hashlib.blake2b(digest_size=20)
+        for lined_tokens in [ before_lined_tokens, after_lined_tokens ]:
+            digest.update(len(lined_tokens).to_bytes(8, "little"))
+            for line_tokens in lined_tokens:
+                digest.update(len(line_tokens).to_bytes(8, "little"))
+                for token in line_tokens:
+                    token_bytes = token.encode("utf-8", "surrogatepass")
+                    digest.update(len(token_bytes).to_bytes(8, "little"))
+                    digest.update(token_bytes)
+        options_str = repr(sorted(
+            (name, value)
+            for name, value in options.items()
+            if name not in IGNORED_OPTIONS
+        ))
+        digest.update(options_str.encode("utf-8"))
+        return digest.hexdigest()
+
+
+    @staticmethod
+    def __copy(result: DiffResult) -> DiffResult:
+        # a new DiffResult for the caller, so that the changes of the caller do not change the cached one
+        diffs = result.diffs if isinstance(result.diffs, CompactDiffs) else list(result.diffs)
+        res = DiffResult(diffs, result.contain_bulk_replace)
+        res.moves = list(result.moves)
+        res.stats = None if result.stats is None else result.stats.copy()
+        return res
+
+
+    def __load(self, key: str) -> Optional[DiffResult]:
+        if self.connection is None:
+            return None
+        now = time.time()
+        # the expired entries are never returned, even if they are not evicted yet
+        accessed = float("-inf") if self.max_age is None else now - self.max_age
+        row = self.connection.execute("SELECT value FROM diffs WHERE key = ? AND accessed >= ?", (key, accessed)).fetchone()
+        if row is None:
+            return None
+        self.connection.execute("UPDATE diffs SET accessed = ? WHERE key = ?", (now, key))
+        self.connection.commit()
+        return serialize.loads(row[0], "binary")
+
+
+    def __store(self, key: str, result: DiffResult):
+        if self.connection is None:
+            return
+        value = serialize.dumps(result, "binary")
+        now = time.time()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO diffs (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+            (key, value, len(value), now))
+
+        # evict old entries, then the least recently used entries until the size fits
+        if self.max_age is not None:
+            self.connection.execute("DELETE FROM diffs WHERE accessed < ?", (now - self.max_age,))
+        if self.max_disk_bytes is not None:
+            disk_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM diffs").fetchone()[0]
+            if disk_bytes > self.max_disk_bytes:
+                rows = self.connection.execute("SELECT key, size FROM diffs ORDER BY accessed").fetchall()
+                for old_key, size in rows:
+                    if disk_bytes <= self.max_disk_bytes:
+                        break
+                    self.connection.execute("DELETE FROM diffs WHERE key = ?", (old_key,))
+                    disk_bytes -= size
+        self.connection.commit()
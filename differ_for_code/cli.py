@@ -0,0 +1,322 @@
+import argparse
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+from collections import deque
+from concurrent.futures import (FIRST_COMPLETED, Executor, Future,
+                                ProcessPoolExecutor, as_completed, wait)
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, List, Optional, Set, TextIO
+
+from differ_for_code import differ, serialize, tree
+
+# request (one JSON per line)
+#   { "id": any, "before": [ [ token, ... ], ... ], "after": [ [ token, ... ], ... ], "diff": bool (optional) }
+# response (one JSON per line)
+#   { "id": any, "distance": int, "similarity": float, "diff": serialize.to_json (only if diff) }
+#   { "id": any, "error": message } if the request is invalid
+# tree (one JSON per line)
+#   { "status": tree.STATUSES, "before": path, "after": path, "distance": int, "similarity": float, "diff": serialize.to_json (only if --diff) }
+#   and the last line { "files": the number of changed files, "unchanged": int, "distance": int, "similarity": float }
+
+
+def main(args: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m differ_for_code", description="diff tokenized code pairs of JSON-lines")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch_parser = subparsers.add_parser("batch", help="diff the pairs of the input, and write the results")
+    batch_parser.add_argument("--input", help="JSON-lines of the pairs (default: stdin)")
+    batch_parser.add_argument("--output", help="JSON-lines of the results (default: stdout)")
+    batch_parser.add_argument("--unordered", action="store_true", help="write each result as soon as it finishes")
+    __add_common_arguments(batch_parser)
+
+    serve_parser = subparsers.add_parser("serve", help="run a local HTTP (POST /diff) or Unix socket service")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument("--unix", help="path of the Unix socket (instead of HTTP)")
+    __add_common_arguments(serve_parser)
+
+    tree_parser = subparsers.add_parser("tree", help="diff two directories or two revisions of a git repository")
+    tree_parser.add_argument("before", help="directory (or revision with --git)")
+    tree_parser.add_argument("after", help="directory (or revision with --git)")
+    tree_parser.add_argument("--git", metavar="REPOSITORY", help="compare the revisions of the git repository")
+    tree_parser.add_argument("--threshold", type=float, default=tree.THRESHOLD, help="similarity of a rename/copy at least")
+    tree_parser.add_argument("--copies", action="store_true", help="detect copies of the changed files as well as renames")
+    tree_parser.add_argument("--language", default="python", help="language of the files whose extensions are unknown")
+    tree_parser.add_argument("--output", help="JSON-lines of the files and the summary (default: stdout)")
+    tree_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    tree_parser.add_argument("--algorithm", default="ratcliff")
+    tree_parser.add_argument("--diff", action="store_true", help="include the full diff of each file")
+
+    options = parser.parse_args(args)
+    if options.command == "batch":
+        batch(options)
+    elif options.command == "tree":
+        diff_tree(options)
+    else:
+        serve(options)
+    return 0
+
+
+def __add_common_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-pending", type=int, help="the number of the pairs in the pool at most (default: workers * 4)")
+    parser.add_argument("--algorithm", default="ratcliff")
+    parser.add_argument("--diff", action="store_true", help="include the full diff in all the results")
+
+
+# Diff one request line into one response line (called in the worker process)
+def process_line(line: str, full_diff: bool = False, algorithm: str = "ratcliff") -> str:
+    request_id = None
+    try:
+        request = json.loads(line)
+        request_id = request.get("id")
+        before_lined_tokens = request["before"]
+        after_lined_tokens = request["after"]
+        if full_diff or request.get("diff", False):
+            result = differ.diff(before_lined_tokens, after_lined_tokens, algorithm=algorithm)
+            response: Dict[str, Any] = {
+                "id": request_id,
+                "distance": result.get_distance(),
+                "similarity": result.get_similarity(),
+                "diff": serialize.to_json(result),
+            }
+        else:
+            distance, total = differ.count_distance(before_lined_tokens, after_lined_tokens, algorithm=algorithm)
+            response = {
+                "id": request_id,
+                "distance": distance,
+                "similarity": 1 if total == 0 else 1. - distance / total,
+            }
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        response = { "id": request_id, "error": f"{type(e).__name__}: {e}" }
+    return json.dumps(response, ensure_ascii=False, separators=(",", ":"))
+
+
+# Executor which runs in the current process (workers <= 1)
+class InlineExecutor(Executor):
+
+    def submit(self, function, *args, **kwargs) -> Future:
+        future: Future = Future()
+        try:
+            future.set_result(function(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+def __executor(workers: int) -> Executor:
+    if workers <= 1:
+        return InlineExecutor()
+    return ProcessPoolExecutor(workers)
+
+
+def __max_pending(options: argparse.Namespace) -> int:
+    return options.max_pending or max(1, options.workers) * 4
+
+
+def batch(options: argparse.Namespace):
+    input_stream = sys.stdin if options.input is None else open(options.input, encoding="utf-8")
+    output_stream = sys.stdout if options.output is None else open(options.output, "w", encoding="utf-8")
+    try:
+        with __executor(options.workers) as executor:
+            run_batch(input_stream, output_stream, executor, __max_pending(options), options.unordered, options.diff, options.algorithm)
+    finally:
+        if options.input is not None:
+            input_stream.close()
+        if options.output is not None:
+            output_stream.close()
+
+
+# Stream the lines of the input through the executor
+# at most max_pending lines are submitted at a time, so the input is read only as fast as the workers diff
+def run_batch(
+    input_stream: TextIO,
+    output_stream: TextIO,
+    executor: Executor,
+    max_pending: int,
+    unordered: bool = False,
+    full_diff: bool = False,
+    algorithm: str = "ratcliff"):
+
+    # in the input order if ordered, otherwise in the order of completion
+    ordered_futures: Deque[Future] = deque()
+    unordered_futures: Set[Future] = set()
+
+    def write(future: Future):
+        output_stream.write(future.result())
+        output_stream.write("\n")
+        if unordered:
+            # each result is visible as soon as it finishes
+            output_stream.flush()
+
+    for line in input_stream:
+        if line.strip() == "":
+            continue
+        future = executor.submit(process_line, line, full_diff, algorithm)
+
+        if unordered:
+            unordered_futures.add(future)
+            # the finished ones are written without waiting, and the input waits only if the pool is full
+            done, unordered_futures = wait(unordered_futures, timeout=0)
+            if len(unordered_futures) >= max_pending:
+                more_done, unordered_futures = wait(unordered_futures, return_when=FIRST_COMPLETED)
+                done |= more_done
+            for future in done:
+                write(future)
+        else:
+            ordered_futures.append(future)
+            while ordered_futures and (ordered_futures[0].done() or len(ordered_futures) >= max_pending):
+                write(ordered_futures.popleft())
+
+    for future in ordered_futures:
+        write(future)
+    for future in as_completed(unordered_futures):
+        write(future)
+    output_stream.flush()
+
+
+def diff_tree(options: argparse.Namespace):
+    if options.git is not None:
+        before: Any = tree.GitSource(options.git, options.before)
+        after: Any = tree.GitSource(options.git, options.after)
+    else:
+        before = options.before
+        after = options.after
+    result = tree.diff_trees(
+        before, after, options.workers, options.algorithm, options.threshold, options.copies, language=options.language)
+
+    output_stream = sys.stdout if options.output is None else open(options.output, "w", encoding="utf-8")
+    try:
+        for file in result.files:
+            response: Dict[str, Any] = {
+                "status": file.status,
+                "before": file.before_path,
+                "after": file.after_path,
+                "distance": file.distance,
+                "similarity": file.get_similarity(),
+            }
+            if options.diff and file.result is not None:
+                response["diff"] = serialize.to_json(file.result)
+            output_stream.write(json.dumps(response, ensure_ascii=False, separators=(",", ":")))
+            output_stream.write("\n")
+        summary = {
+            "files": len(result.files),
+            "unchanged": result.unchanged,
+            "distance": result.get_distance(),
+            "similarity": result.get_similarity(),
+        }
+        output_stream.write(json.dumps(summary, separators=(",", ":")))
+        output_stream.write("\n")
+        output_stream.flush()
+    finally:
+        if options.output is not None:
+            output_stream.close()
+
+
+# Worker pool shared by the connections
+# at most max_pending lines are in the pool, and the connections wait for the room (backpressure)
+class DiffService:
+
+    def __init__(self, executor: Executor, max_pending: int, full_diff: bool = False, algorithm: str = "ratcliff"):
+        self.executor = executor
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self.full_diff = full_diff
+        self.algorithm = algorithm
+
+
+    def submit(self, line: str) -> Future:
+        self.pending.acquire()
+        try:
+            future = self.executor.submit(process_line, line, self.full_diff, self.algorithm)
+        except BaseException:
+            self.pending.release()
+            raise
+        future.add_done_callback(lambda _: self.pending.release())
+        return future
+
+
+    def process_lines(self, lines: List[str]) -> List[str]:
+        futures = [ self.submit(line) for line in lines if line.strip() != "" ]
+        return [ future.result() for future in futures ]
+
+
+def serve(options: argparse.Namespace):
+    with __executor(options.workers) as executor:
+        service = DiffService(executor, __max_pending(options), options.diff, options.algorithm)
+        server = make_server(service, options.host, options.port, options.unix)
+        # stop on SIGTERM as well as Ctrl-C
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            print(f"serving on {options.unix or f'http://{options.host}:{server.server_address[1]}'}", file=sys.stderr)
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if options.unix is not None and os.path.exists(options.unix):
+                os.remove(options.unix)
+
+
+# HTTP: POST /diff with JSON-lines of requests, and the response is JSON-lines of the results in the same order
+# Unix socket: each request line is answered with a result line
+def make_server(service: DiffService, host: str = "127.0.0.1", port: int = 8080, unix: Optional[str] = None) -> socketserver.BaseServer:
+    if unix is not None:
+        if os.path.exists(unix):
+            os.remove(unix)
+        server = ThreadingUnixStreamServer(unix, UnixHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), HTTPHandler)
+    server.service = service
+    return server
+
+
+class ThreadingUnixStreamServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class UnixHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            text = line.decode("utf-8")
+            if text.strip() == "":
+                continue
+            response = self.server.service.submit(text).result()
+            self.wfile.write(response.encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class HTTPHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_error(404)
+            return
+        self.__send(b"ok\n", "text/plain")
+
+
+    def do_POST(self):
+        if self.path != "/diff":
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        lines = self.rfile.read(length).decode("utf-8").splitlines()
+        responses = self.server.service.process_lines(lines)
+        self.__send("".join([ f"{response}\n" for response in responses ]).encode("utf-8"), "application/x-ndjson")
+
+
+    def log_message(self, format: str, *args: Any):
+        # no access log
+        pass
+
+
+    def __send(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
@@ -0,0 +1,186 @@
+import heapq
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from differ_for_code import differ
+from differ_for_code.vocabulary import EncodedDocument, Vocabulary
+
+LINKAGES = ("single", "complete")
+
+class ClusterResult(NamedTuple):
+    # cluster of each item (numbered in the order of the first item of each cluster)
+    labels: List[int]
+    # (index, index, similarity) of the pairs which are actually diffed
+    pairs: List[Tuple[int, int, float]]
+
+    def clusters(self) -> List[List[int]]:
+        res: List[List[int]] = []
+        for index, label in enumerate(self.labels):
+            if label == len(res):
+                res.append([])
+            res[label].append(index)
+        return res
+
+
+# Cluster the items whose similarities (get_similarity) >= threshold
+# single: connected components of the pairs whose similarity >= threshold (single linkage cut at threshold)
+# complete: agglomerative clustering where every pair in a cluster has similarity >= threshold (complete linkage)
+#
+# similarity >= threshold is distance <= (1 - threshold) * (characters of both), so a pair is rejected without the diff by
+#   the difference of the lengths, and the common characters (see differ.top_k)
+# and a pair is diffed only if the bounds cannot reject it (single linkage also skips the pairs already in a cluster)
+# the bounds always hold, so the result is the same as comparing every pair
+# the items are scanned in the order of the length, and a pair is never compared if the lengths alone reject it
+# NOTE: the distance of the diff is not a metric (the matcher is heuristic, get_distance is not symmetric,
+#       and BULK_REPLACE counts whole blocks), so the triangle inequality (e.g. bounds by pivots) cannot be used.
+#       the character distance (the characters which are not common) is a metric, but it is calculated exactly here,
+#       which is tighter than any bound by pivots
+def cluster(
+    lined_tokens_list: Sequence[List[List[str]]],
+    threshold: float,
+    linkage: str = "single",
+    vocabulary: Optional[Vocabulary] = None,
+    algorithm: str = "ratcliff") -> ClusterResult:
+
+    if linkage not in LINKAGES:
+        raise ValueError(f"unknown linkage: {linkage}")
+
+    size = len(lined_tokens_list)
+    if vocabulary is None:
+        # shared by all the pairs
+        vocabulary = Vocabulary()
+    lengths = [ sum(len(token) for line_tokens in lined_tokens for token in line_tokens) for lined_tokens in lined_tokens_list ]
+    # the number of each character (see differ.top_k)
+    profiles = [ differ._profile(lined_tokens) for lined_tokens in lined_tokens_list ]
+    # each item is encoded once by the vocabulary, when it is diffed first
+    documents: Dict[int, EncodedDocument] = {}
+    pairs: List[Tuple[int, int, float]] = []
+    # (index, index) -> distance of the diffed pairs
+    distances: Dict[Tuple[int, int], int] = {}
+
+    def distance(index: int, other_index: int) -> int:
+        key = (min(index, other_index), max(index, other_index))
+        if key not in distances:
+            for item_index in key:
+                if item_index not in documents:
+                    documents[item_index] = vocabulary.encode(lined_tokens_list[item_index])
+            value, total = differ.count_distance(documents[key[0]], documents[key[1]], vocabulary, algorithm)
+            distances[key] = value
+            pairs.append((key[0], key[1], 1. if total == 0 else 1. - value / total))
+        return distances[key]
+
+    # False if the bounds reject the pair, True if they accept it, None if the diff is needed
+    def bound(index: int, other_index: int) -> Optional[bool]:
+        key = (min(index, other_index), max(index, other_index))
+        total = lengths[index] + lengths[other_index]
+        if key in distances:
+            return __is_similar(distances[key], total, threshold)
+        if not __is_similar(abs(lengths[index] - lengths[other_index]), total, threshold):
+            return False
+        if differ._upper_bound(profiles[index], profiles[other_index]) < threshold:
+            # not enough common characters
+            return False
+        # every pair is similar if threshold <= 0
+        return True if __is_similar(total, total, threshold) else None
+
+    order = sorted(range(size), key=lambda index: (lengths[index], index))
+    if linkage == "single":
+        parents = list(range(size))
+        for position, index in enumerate(order):
+            for other_index in __candidates(order, position, lengths, threshold):
+                root = __find(parents, index)
+                other_root = __find(parents, other_index)
+                if root == other_root:
+                    # already in the same cluster
+                    continue
+                pair_bound = bound(index, other_index)
+                if pair_bound is False:
+                    continue
+                if pair_bound or __is_similar(distance(index, other_index), lengths[index] + lengths[other_index], threshold):
+                    parents[max(root, other_root)] = min(root, other_root)
+        roots = [ __find(parents, index) for index in range(size) ]
+    else:
+        # dissimilarity (1 - similarity) of the pairs whose similarity >= threshold
+        edges: List[Tuple[float, int, int]] = []
+        for position, index in enumerate(order):
+            for other_index in __candidates(order, position, lengths, threshold):
+                # the dissimilarity is needed even if the upper bound accepts the pair
+                if bound(index, other_index) is False:
+                    continue
+                total = lengths[index] + lengths[other_index]
+                pair_distance = distance(index, other_index)
+                if __is_similar(pair_distance, total, threshold):
+                    edges.append((0. if total == 0 else pair_distance / total, min(index, other_index), max(index, other_index)))
+        roots = __complete_linkage(size, edges)
+
+    labels = []
+    root_labels: Dict[int, int] = {}
+    for root in roots:
+        labels.append(root_labels.setdefault(root, len(root_labels)))
+    return ClusterResult(labels, pairs)
+
+
+def __is_similar(distance: int, total: int, threshold: float) -> bool:
+    # same as get_similarity() >= threshold
+    return (1. if total == 0 else 1. - distance / total) >= threshold
+
+
+def __candidates(order: List[int], position: int, lengths: List[int], threshold: float) -> Iterator[int]:
+    # the items after position (in the order of the length) which are not rejected by the lengths
+    # longer - shorter <= (1 - threshold) * (longer + shorter) is required, so the scan stops at the first longer item which fails
+    index = order[position]
+    for other_position in range(position + 1, len(order)):
+        other_index = order[other_position]
+        if not __is_similar(lengths[other_index] - lengths[index], lengths[index] + lengths[other_index], threshold):
+            break
+        yield other_index
+
+
+def __find(parents: List[int], index: int) -> int:
+    while parents[index] != index:
+        parents[index] = parents[parents[index]]
+        index = parents[index]
+    return index
+
+
+def __complete_linkage(size: int, edges: List[Tuple[float, int, int]]) -> List[int]:
+    # merge the closest clusters while every pair of the merged cluster is an edge
+    # the linkage of two clusters is the maximum dissimilarity of the pairs between them
+    members: Dict[int, List[int]] = { index: [ index ] for index in range(size) }
+    # cluster -> neighbour cluster -> (the number of the edges, the maximum dissimilarity)
+    neighbours: Dict[int, Dict[int, Tuple[int, float]]] = { index: {} for index in range(size) }
+    for dissimilarity, index, other_index in edges:
+        neighbours[index][other_index] = (1, dissimilarity)
+        neighbours[other_index][index] = (1, dissimilarity)
+    heap = [ (dissimilarity, index, other_index) for dissimilarity, index, other_index in edges ]
+    heapq.heapify(heap)
+
+    while heap:
+        dissimilarity, cluster_id, other_cluster_id = heapq.heappop(heap)
+        if cluster_id not in members or other_cluster_id not in members:
+            continue
+        link = neighbours[cluster_id].get(other_cluster_id)
+        if link is None or link[1] != dissimilarity or link[0] != len(members[cluster_id]) * len(members[other_cluster_id]):
+            # outdated, or not every pair is an edge
+            continue
+
+        # merge into the cluster of the smaller ID
+        cluster_id, other_cluster_id = min(cluster_id, other_cluster_id), max(cluster_id, other_cluster_id)
+        members[cluster_id] += members.pop(other_cluster_id)
+        other_neighbours = neighbours.pop(other_cluster_id)
+        del neighbours[cluster_id][other_cluster_id]
+        for neighbour_id, (count, neighbour_dissimilarity) in other_neighbours.items():
+            if neighbour_id == cluster_id:
+                continue
+            del neighbours[neighbour_id][other_cluster_id]
+            previous = neighbours[cluster_id].get(neighbour_id, (0, 0.))
+            neighbours[cluster_id][neighbour_id] = (previous[0] + count, max(previous[1], neighbour_dissimilarity))
+            neighbours[neighbour_id][cluster_id] = neighbours[cluster_id][neighbour_id]
+        for neighbour_id, (count, neighbour_dissimilarity) in neighbours[cluster_id].items():
+            if count == len(members[cluster_id]) * len(members[neighbour_id]):
+                heapq.heappush(heap, (neighbour_dissimilarity, min(cluster_id, neighbour_id), max(cluster_id, neighbour_id)))
+
+    roots = list(range(size))
+    for cluster_id, indexes in members.items():
+        for index in indexes:
+            roots[index] = cluster_id
+    return roots
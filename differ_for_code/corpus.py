@@ -0,0 +1,284 @@
+import mmap
+import struct
+from array import array
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Sequence, Union
+
+from differ_for_code.vocabulary import EncodedLines, Vocabulary
+
+# corpus file (native byte order)
+#   header: magic, the number of token references, lines, files, tokens in the vocabulary and distinct lines
+#   token IDs: uint32 for each token of each line of each file
+#   line IDs: uint32 for each line of each file (lines are identified by the joined string, same as Vocabulary)
+#   line offsets: int64 (the number of lines + 1), start of each line in the token IDs
+#   file offsets: int64 (the number of files + 1), start of each file in the lines
+#   line starts: int64 for each line ID, the first line of the line ID
+#   line lengths: int64 for each line ID, the number of characters of the line
+#   vocabulary offsets: int64 (the number of tokens + 1), start of each token in the vocabulary bytes
+#   vocabulary bytes: utf-8 of the tokens
+MAGIC = b"DFCCORP2"
+HEADER = struct.Struct("=8sQQQQQ")
+
+
+# Write the tokens of many files into a corpus file
+# the token IDs are written as the files are added, only the line IDs, the offsets and the vocabularies are kept in memory
+class CorpusWriter:
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file: Optional[BinaryIO] = open(path, "wb")
+        self.file.write(b"\0" * HEADER.size)
+        self.token_count = 0
+        self.token_ids: Dict[str, int] = {}
+        self.line_ids: Dict[str, int] = {}
+        self.file_line_ids = array("I")
+        self.line_starts = array("q")
+        self.line_lengths = array("q")
+        self.line_offsets = array("q", [ 0 ])
+        self.file_offsets = array("q", [ 0 ])
+
+
+    def __enter__(self) -> 'CorpusWriter':
+        return self
+
+
+    def __exit__(self, *args: Any):
+        self.close()
+
+
+    def add(self, lined_tokens: Sequence[List[str]]) -> int:
+        # returns the index of the file
+        token_ids = array("I")
+        for line_tokens in lined_tokens:
+            for token in line_tokens:
+                token_id = self.token_ids.get(token)
+                if token_id is None:
+                    token_id = len(self.token_ids)
+                    self.token_ids[token] = token_id
+                token_ids.append(token_id)
+            line = "".join(line_tokens)
+            line_id = self.line_ids.get(line)
+            if line_id is None:
+                line_id = len(self.line_ids)
+                self.line_ids[line] = line_id
+                self.line_starts.append(len(self.file_line_ids))
+                self.line_lengths.append(len(line))
+            self.file_line_ids.append(line_id)
+            self.line_offsets.append(self.token_count + len(token_ids))
+        self.file.write(token_ids.tobytes())
+        self.token_count += len(token_ids)
+        self.file_offsets.append(len(self.line_offsets) - 1)
+        return len(self.file_offsets) - 2
+
+
+    def close(self):
+        if self.file is None:
+            return
+        self.file.write(self.file_line_ids.tobytes())
+        self.__pad()
+        self.file.write(self.line_offsets.tobytes())
+        self.file.write(self.file_offsets.tobytes())
+        self.file.write(self.line_starts.tobytes())
+        self.file.write(self.line_lengths.tobytes())
+
+        vocabulary_offsets = array("q", [ 0 ])
+        vocabulary_bytes = bytearray()
+        # token IDs are assigned in the order of insertion
+        for token in self.token_ids:
+            vocabulary_bytes += token.encode("utf-8", "surrogatepass")
+            vocabulary_offsets.append(len(vocabulary_bytes))
+        self.file.write(vocabulary_offsets.tobytes())
+        self.file.write(vocabulary_bytes)
+
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, self.token_count, len(self.line_offsets) - 1, len(self.file_offsets) - 1, len(self.token_ids), len(self.line_ids)))
+        self.file.close()
+        self.file = None
+
+
+    def __pad(self):
+        # align the offset tables to 8 bytes
+        if (self.token_count + len(self.file_line_ids)) % 2 == 1:
+            self.file.write(b"\0" * 4)
+
+
+# Read-only corpus on a memory-mapped file
+# each item is a CorpusFile, which can be given to differ.diff/similarity/... as the lined tokens
+# the files of a corpus are compared as the stored line IDs (without decoding the lines that are equal)
+# the processes share one page-cached copy, and a Corpus is pickled as its path (e.g. similarity_matrix workers)
+class Corpus(Sequence['CorpusFile']):
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, token_count, line_count, file_count, vocabulary_count, distinct_line_count = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"not a corpus file: {path}")
+
+        view = memoryview(self.mmap)
+        position = HEADER.size
+        self.token_ids = view[position:position + token_count * 4].cast("I")
+        position += token_count * 4
+        self.line_ids = view[position:position + line_count * 4].cast("I")
+        position += line_count * 4 + ((token_count + line_count) % 2) * 4
+        self.line_offsets = view[position:position + (line_count + 1) * 8].cast("q")
+        position += (line_count + 1) * 8
+        self.file_offsets = view[position:position + (file_count + 1) * 8].cast("q")
+        position += (file_count + 1) * 8
+        self.line_starts = view[position:position + distinct_line_count * 8].cast("q")
+        position += distinct_line_count * 8
+        self.line_lengths = view[position:position + distinct_line_count * 8].cast("q")
+        position += distinct_line_count * 8
+        self.vocabulary_offsets = view[position:position + (vocabulary_count + 1) * 8].cast("q")
+        position += (vocabulary_count + 1) * 8
+        self.vocabulary_bytes = view[position:]
+        view.release()
+
+        # decoded lazily, once per process
+        self.tokens: Optional[List[str]] = None
+        self.line_vocabulary: Optional[CorpusVocabulary] = None
+
+
+    @staticmethod
+    def create(path: str, lined_tokens_list: Iterable[Sequence[List[str]]]) -> 'Corpus':
+        with CorpusWriter(path) as writer:
+            for lined_tokens in lined_tokens_list:
+                writer.add(lined_tokens)
+        return Corpus(path)
+
+
+    def __reduce__(self) -> Any:
+        return (Corpus, (self.path,))
+
+
+    def __enter__(self) -> 'Corpus':
+        return self
+
+
+    def __exit__(self, *args: Any):
+        self.close()
+
+
+    def close(self):
+        if self.mmap.closed:
+            return
+        for view in (self.token_ids, self.line_ids, self.line_offsets, self.file_offsets, self.line_starts, self.line_lengths, self.vocabulary_offsets, self.vocabulary_bytes):
+            view.release()
+        self.mmap.close()
+
+
+    def __len__(self) -> int:
+        return len(self.file_offsets) - 1
+
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return [ self[i] for i in range(*index.indices(len(self))) ]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("corpus index out of range")
+        return CorpusFile(self, index)
+
+
+    def line_tokens(self, line_number: int) -> List[str]:
+        # tokens of the line (the line number in the whole corpus)
+        tokens = self.tokens if self.tokens is not None else self.__decode_tokens()
+        return [ tokens[token_id] for token_id in self.token_ids[self.line_offsets[line_number]:self.line_offsets[line_number + 1]] ]
+
+
+    def vocabulary(self) -> 'CorpusVocabulary':
+        # Vocabulary whose line IDs are the same as the corpus (one per process)
+        if self.line_vocabulary is None:
+            self.line_vocabulary = CorpusVocabulary(self)
+        return self.line_vocabulary
+
+
+    def __decode_tokens(self) -> List[str]:
+        data = self.vocabulary_bytes
+        offsets = self.vocabulary_offsets
+        self.tokens = [ str(data[offsets[i]:offsets[i + 1]], "utf-8", "surrogatepass") for i in range(len(offsets) - 1) ]
+        return self.tokens
+
+
+# Vocabulary whose line IDs are the line IDs of the corpus
+# so that other documents (e.g. the query of differ.top_k) encoded by it are compared with the files as line IDs
+# the lines of the corpus are decoded when a line is encoded first
+class CorpusVocabulary(Vocabulary):
+
+    def __init__(self, corpus: Corpus):
+        super().__init__()
+        self.corpus = corpus
+        self.line_lengths = array("i", corpus.line_lengths)
+        self.decoded = False
+
+
+    def line_id(self, line_tokens: List[str]) -> int:
+        if not self.decoded:
+            self.__decode_lines()
+        return super().line_id(line_tokens)
+
+
+    def __decode_lines(self):
+        corpus = self.corpus
+        for line_start in corpus.line_starts:
+            line = "".join(corpus.line_tokens(line_start))
+            self.line_ids[line] = len(self.lines)
+            self.lines.append(line)
+        self.decoded = True
+
+
+# Lined tokens of a file of the corpus, decoded line by line on access
+# the line IDs and the line lengths are read from the corpus, like an EncodedDocument of Corpus.vocabulary()
+class CorpusFile(Sequence[List[str]], EncodedLines):
+
+    def __init__(self, corpus: Corpus, index: int):
+        self.corpus = corpus
+        self.index = index
+        self.line_start = corpus.file_offsets[index]
+        self.line_end = corpus.file_offsets[index + 1]
+
+
+    def __reduce__(self) -> Any:
+        return (CorpusFile, (self.corpus, self.index))
+
+
+    def __len__(self) -> int:
+        return self.line_end - self.line_start
+
+
+    @property
+    def vocabulary(self) -> CorpusVocabulary:
+        return self.corpus.vocabulary()
+
+
+    @property
+    def line_ids(self) -> memoryview:
+        return self.corpus.line_ids[self.line_start:self.line_end]
+
+
+    @property
+    def lines(self) -> List[str]:
+        return [ "".join(line_tokens) for line_tokens in self ]
+
+
+    @property
+    def line_lengths(self) -> List[int]:
+        line_lengths = self.corpus.line_lengths
+        return [ line_lengths[line_id] for line_id in self.corpus.line_ids[self.line_start:self.line_end] ]
+
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return [ self.corpus.line_tokens(self.line_start + i) for i in range(*index.indices(len(self))) ]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("line number out of range")
+        return self.corpus.line_tokens(self.line_start + index)
+
+
+    def __iter__(self):
+        for line_number in range(self.line_start, self.line_end):
+            yield self.corpus.line_tokens(line_number)
@@ -0,0 +1,175 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from differ_for_code import CompactDiffs, DiffBase, DiffResult, TokenDiff, differ
+from differ_for_code.algorithm import get_opcodes
+from differ_for_code.vocabulary import Vocabulary
+
+
+# Pre-process one fixed side (e.g. reference solution) once, and diff many counterparts against it
+# SequenceMatcher indexes the second sequence, so the index of the lines and the tokens of each line
+# are reused only if the fixed side is after (side="after")
+# if side="before", only the joined lines (or line IDs) of the fixed side are reused
+# the results are the same as differ.diff
+class DiffIndex:
+
+    def __init__(
+        self,
+        lined_tokens: Sequence[List[str]],
+        side: str = "after",
+        algorithm: str = "ratcliff",
+        vocabulary: Optional[Vocabulary] = None):
+
+        if side not in ("before", "after"):
+            raise ValueError(f"unknown side: {side}")
+
+        self.side = side
+        self.algorithm = algorithm
+        self.vocabulary = vocabulary
+        # keep the line lists, the matchers of the lines are identified by them
+        self.lined_tokens = list(lined_tokens)
+        self.lines = self.__encode_lines(self.lined_tokens)
+        self.line_lengths = self.__line_lengths(self.lined_tokens, self.lines)
+
+        self.line_matcher = None
+        if side == "after" and algorithm == "ratcliff":
+            # b2j of the lines is built once
+            self.line_matcher = SequenceMatcher(None)
+            self.line_matcher.set_seq2(self.lines)
+
+        # id of the line tokens of after -> matcher whose seq2 is the tokens (built lazily)
+        self.token_matchers: Dict[int, SequenceMatcher] = {}
+
+
+    def diff(self, lined_tokens: Sequence[List[str]], compact: bool = False) -> DiffResult:
+        before_lined_tokens, after_lined_tokens = self.__sides(lined_tokens)
+        store = CompactDiffs(before_lined_tokens, after_lined_tokens) if compact else None
+        return DiffResult.from_iter(self.iter_diff(lined_tokens), store)
+
+
+    def iter_diff(self, lined_tokens: Sequence[List[str]]) -> Iterator[DiffBase]:
+        before_lined_tokens, after_lined_tokens = self.__sides(lined_tokens)
+        line_diff_results = self.__line_opcodes(self.__encode_lines(lined_tokens))
+
+        def diff_tokens(diff_before_tokens: List[str], diff_after_tokens: List[str]) -> Tuple[List[TokenDiff], List[TokenDiff]]:
+            inline_diff_results = self.__inline_opcodes(diff_before_tokens, diff_after_tokens)
+            return differ._diff_tokens(diff_before_tokens, diff_after_tokens, inline_diff_results)
+
+        yield from differ._iter_diffs(before_lined_tokens, after_lined_tokens, line_diff_results, diff_tokens)
+
+
+    def distance(self, lined_tokens: Sequence[List[str]]) -> int:
+        distance, _ = self.__count_distance(lined_tokens)
+        return distance
+
+
+    def similarity(self, lined_tokens: Sequence[List[str]]) -> float:
+        distance, total = self.__count_distance(lined_tokens)
+        if total == 0:
+            # no diff
+            return 1
+        else:
+            return 1. - distance / total
+
+
+    def diff_many(
+        self,
+        lined_tokens_list: Sequence[Sequence[List[str]]],
+        workers: Optional[int] = None,
+        score_only: bool = False,
+        chunk_size: int = 16) -> List[Union[DiffResult, float]]:
+
+        # DiffResult (or similarity if score_only) for each counterpart
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        if workers <= 1:
+            return [ _diff_one(self, lined_tokens, score_only) for lined_tokens in lined_tokens_list ]
+
+        # the index is pickled once per worker by the initializer
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(self,)) as executor:
+            return list(executor.map(_diff_worker, lined_tokens_list, [score_only] * len(lined_tokens_list), chunksize=chunk_size))
+
+
+    def __sides(self, lined_tokens: Sequence[List[str]]) -> Tuple[Sequence[List[str]], Sequence[List[str]]]:
+        if self.side == "after":
+            return (lined_tokens, self.lined_tokens)
+        else:
+            return (self.lined_tokens, lined_tokens)
+
+
+    def __count_distance(self, lined_tokens: Sequence[List[str]]) -> Tuple[int, int]:
+        before_lined_tokens, after_lined_tokens = self.__sides(lined_tokens)
+        lines = self.__encode_lines(lined_tokens)
+        line_lengths = self.__line_lengths(lined_tokens, lines)
+        if self.side == "after":
+            before_line_lengths, after_line_lengths = line_lengths, self.line_lengths
+        else:
+            before_line_lengths, after_line_lengths = self.line_lengths, line_lengths
+        line_diff_results = self.__line_opcodes(lines)
+        return differ._count_distance(before_lined_tokens, after_lined_tokens, before_line_lengths, after_line_lengths, line_diff_results, self.__inline_opcodes)
+
+
+    def __line_opcodes(self, lines: Sequence[Any]) -> List[Tuple[str, int, int, int, int]]:
+        if self.line_matcher is not None:
+            self.line_matcher.set_seq1(lines)
+            return self.line_matcher.get_opcodes()
+        elif self.side == "after":
+            return get_opcodes(lines, self.lines, self.algorithm)
+        else:
+            return get_opcodes(self.lines, lines, self.algorithm)
+
+
+    def __inline_opcodes(self, diff_before_tokens: List[str], diff_after_tokens: List[str]) -> List[Tuple[str, int, int, int, int]]:
+        if self.side == "before":
+            return SequenceMatcher(None, diff_before_tokens, diff_after_tokens).get_opcodes()
+
+        # b2j of the tokens of the fixed line is built once
+        matcher = self.token_matchers.get(id(diff_after_tokens))
+        if matcher is None:
+            matcher = SequenceMatcher(None)
+            matcher.set_seq2(diff_after_tokens)
+            self.token_matchers[id(diff_after_tokens)] = matcher
+        matcher.set_seq1(diff_before_tokens)
+        return matcher.get_opcodes()
+
+
+    def __encode_lines(self, lined_tokens: Sequence[List[str]]) -> Sequence[Any]:
+        if self.vocabulary is None:
+            return [ "".join(line_tokens) for line_tokens in lined_tokens ]
+        else:
+            return self.vocabulary.encode_lines(lined_tokens)
+
+
+    def __line_lengths(self, lined_tokens: Sequence[List[str]], lines: Sequence[Any]) -> List[int]:
+        if self.vocabulary is None:
+            return [ len(line) for line in lines ]
+        else:
+            return self.vocabulary.encode_line_lengths(lined_tokens, lines)
+
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # the matchers of the tokens are identified by id, so they are rebuilt in the other process
+        state = self.__dict__.copy()
+        state["token_matchers"] = {}
+        return state
+
+
+def _diff_one(index: DiffIndex, lined_tokens: Sequence[List[str]], score_only: bool) -> Union[DiffResult, float]:
+    if score_only:
+        return index.similarity(lined_tokens)
+    else:
+        return index.diff(lined_tokens)
+
+
+# index shared by a worker process
+_worker_index: Optional[DiffIndex] = None
+
+def _init_worker(index: DiffIndex):
+    global _worker_index
+    _worker_index = index
+
+def _diff_worker(lined_tokens: Sequence[List[str]], score_only: bool) -> Union[DiffResult, float]:
+    return _diff_one(_worker_index, lined_tokens, score_only)
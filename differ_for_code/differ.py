@@ -1,22 +1,312 @@
+import heapq
+import os
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from difflib import SequenceMatcher
-from typing import List, Tuple
+from typing import (Any, Callable, Iterable, Iterator, List, NamedTuple,
+                    Optional, Sequence, Tuple, Union)
 
-from differ_for_code import (BulkReplace, DiffResult, DiffType, LineDiff,
-                                   LineReplace, TokenDiff)
+from differ_for_code import (BulkReplace, CompactDiffs, DiffBase, DiffResult,
+                             DiffType, LineDiff, LineReplace, TokenDiff)
+from differ_for_code.algorithm import get_opcodes
+from differ_for_code.memo import InlineMemo
+from differ_for_code.moves import detect_moves
+from differ_for_code.normalize import Normalizer
+from differ_for_code.stats import HOOKS, DiffStats
+from differ_for_code.vocabulary import EncodedLines, Vocabulary
 
 
 # Calculate difference between lines -> tokens
 def diff(
     before_lined_tokens: List[List[str]],
-    after_lined_tokens: List[List[str]]) -> DiffResult:
+    after_lined_tokens: List[List[str]],
+    vocabulary: Optional[Vocabulary] = None,
+    algorithm: str = "ratcliff",
+    compact: bool = False,
+    stats: bool = False,
+    align: Union[bool, 'Alignment'] = False,
+    moves: bool = False,
+    normalizer: Optional[Normalizer] = None,
+    memo: Optional[InlineMemo] = None) -> DiffResult:
+
+    # the statistics are collected only if stats or a hook is added (see differ_for_code.stats)
+    diff_stats = DiffStats() if stats or HOOKS else None
+
+    # the diffs are stored in arrays if compact
+    store = CompactDiffs(before_lined_tokens, after_lined_tokens) if compact else None
+    diffs = iter_diff(before_lined_tokens, after_lined_tokens, vocabulary, algorithm, diff_stats, align, normalizer, memo)
+    result = DiffResult.from_iter(diffs, store)
+    if moves:
+        # moved blocks of the lines (DiffResult.moves)
+        result.moves = detect_moves(result.diffs)
+
+    if diff_stats is not None:
+        result.stats = diff_stats
+        # the score phase is measured here, so that the hooks see every phase
+        result.get_distance()
+        if HOOKS:
+            # the hooks get a copy, which is not changed by the later get_distance/get_similarity of the result
+            frozen_stats = diff_stats.copy()
+            for hook in list(HOOKS):
+                hook(frozen_stats)
+    return result
+
+
+# Yield the diffs of diff() one by one
+def iter_diff(
+    before_lined_tokens: List[List[str]],
+    after_lined_tokens: List[List[str]],
+    vocabulary: Optional[Vocabulary] = None,
+    algorithm: str = "ratcliff",
+    stats: Optional[DiffStats] = None,
+    align: Union[bool, 'Alignment'] = False,
+    normalizer: Optional[Normalizer] = None,
+    memo: Optional[InlineMemo] = None) -> Iterator[DiffBase]:
+
+    if stats is not None:
+        yield from __iter_diff_with_stats(before_lined_tokens, after_lined_tokens, vocabulary, algorithm, stats, align, normalizer, memo)
+        return
+
+    before_lines, after_lines = __encode_lines(before_lined_tokens, after_lined_tokens, vocabulary, normalizer)
+    line_diff_results = get_opcodes(before_lines, after_lines, algorithm)
+    if align:
+        line_diff_results = __align(before_lined_tokens, after_lined_tokens, line_diff_results, vocabulary, align, normalizer)
+
+    def diff_tokens(diff_before_tokens: List[str], diff_after_tokens: List[str]) -> Tuple[List[TokenDiff], List[TokenDiff]]:
+        if normalizer is not None:
+            return normalizer.diff_tokens(diff_before_tokens, diff_after_tokens, normalizer.inline_opcodes(diff_before_tokens, diff_after_tokens))
+        inline_diff_results = _inline_opcodes(diff_before_tokens, diff_after_tokens)
+        return _diff_tokens(diff_before_tokens, diff_after_tokens, inline_diff_results)
+
+    if memo is not None:
+        # the TokenDiffs of the same line pair are shared by the diff calls
+        diff_tokens = memo.memoize(diff_tokens, normalizer)
+
+    yield from _iter_diffs(before_lined_tokens, after_lined_tokens, line_diff_results, diff_tokens, normalizer is not None)
+
+
+# iter_diff measuring each phase into stats
+# the time of build excludes inline_match, and the time spent by the consumer of the diffs is not counted
+def __iter_diff_with_stats(
+    before_lined_tokens: List[List[str]],
+    after_lined_tokens: List[List[str]],
+    vocabulary: Optional[Vocabulary],
+    algorithm: str,
+    stats: DiffStats,
+    align: Union[bool, 'Alignment'],
+    normalizer: Optional[Normalizer],
+    memo: Optional[InlineMemo]) -> Iterator[DiffBase]:
+
+    start = time.perf_counter()
+    before_lines, after_lines = __encode_lines(before_lined_tokens, after_lined_tokens, vocabulary, normalizer)
+    stats.add_phase("encode", time.perf_counter() - start)
+
+    start = time.perf_counter()
+    line_diff_results = get_opcodes(before_lines, after_lines, algorithm)
+    if align:
+        line_diff_results = __align(before_lined_tokens, after_lined_tokens, line_diff_results, vocabulary, align, normalizer)
+    stats.add_phase("line_match", time.perf_counter() - start)
+
+    for tag, before_start, before_end, after_start, after_end in line_diff_results:
+        if tag != DiffType.REPLACE.value:
+            stats.count_opcode(tag)
+        elif before_end - before_start == after_end - after_start:
+            stats.count_opcode(DiffType.LINE_REPLACE.value)
+        else:
+            stats.count_opcode(DiffType.BULK_REPLACE.value)
 
-    before_lines = [ "".join(line_tokens) for line_tokens in before_lined_tokens ]
-    after_lines = [ "".join(line_tokens) for line_tokens in after_lined_tokens ]
-    line_diff_results = SequenceMatcher(None, before_lines, after_lines).get_opcodes()
+    inline_seconds = 0.
+
+    def diff_tokens(diff_before_tokens: List[str], diff_after_tokens: List[str]) -> Tuple[List[TokenDiff], List[TokenDiff]]:
+        nonlocal inline_seconds
+        start = time.perf_counter()
+        if normalizer is not None:
+            inline_diff_results = normalizer.inline_opcodes(diff_before_tokens, diff_after_tokens)
+        else:
+            inline_diff_results = _inline_opcodes(diff_before_tokens, diff_after_tokens)
+        inline_seconds += time.perf_counter() - start
+        stats.inline_matcher_calls += 1
+        stats.tokens_compared += len(diff_before_tokens) + len(diff_after_tokens)
+        if normalizer is not None:
+            token_diffs = normalizer.diff_tokens(diff_before_tokens, diff_after_tokens, inline_diff_results)
+        else:
+            token_diffs = _diff_tokens(diff_before_tokens, diff_after_tokens, inline_diff_results)
+        stats.objects_allocated += len(token_diffs[0]) + len(token_diffs[1])
+        return token_diffs
+
+    memo_hits = 0 if memo is None else memo.hits
+    if memo is not None:
+        # only the misses are measured as inline_match
+        diff_tokens = memo.memoize(diff_tokens, normalizer)
+
+    build_seconds = 0.
+    diffs = _iter_diffs(before_lined_tokens, after_lined_tokens, line_diff_results, diff_tokens, normalizer is not None)
+    while True:
+        start = time.perf_counter()
+        diff = next(diffs, None)
+        build_seconds += time.perf_counter() - start
+        if diff is None:
+            break
+        stats.objects_allocated += 1
+        yield diff
+
+    if memo is not None:
+        stats.inline_memo_hits += memo.hits - memo_hits
+    stats.add_phase("inline_match", inline_seconds)
+    stats.add_phase("build", build_seconds - inline_seconds)
+
+
+# Options of align (alignment of the lines in a replace block whose numbers of lines are different)
+# max_lines: a block which has more lines (before or after) is kept as BULK_REPLACE, so the cost is at most max_lines ** 2 inline matches
+# cutoff: a pair of lines is aligned as LINE_REPLACE only if the similarity of the pair >= cutoff
+class Alignment(NamedTuple):
+    max_lines: int = 64
+    cutoff: float = 0.5
+
+
+def __align(
+    before_lined_tokens: Sequence[List[str]],
+    after_lined_tokens: Sequence[List[str]],
+    line_diff_results: List[Tuple[str, int, int, int, int]],
+    vocabulary: Optional[Vocabulary],
+    align: Union[bool, Alignment],
+    normalizer: Optional[Normalizer]) -> List[Tuple[str, int, int, int, int]]:
+
+    def inline_opcodes(diff_before_tokens: List[str], diff_after_tokens: List[str]) -> List[Tuple[str, int, int, int, int]]:
+        return _inline_opcodes(diff_before_tokens, diff_after_tokens)
+
+    alignment = align if isinstance(align, Alignment) else Alignment()
+    if normalizer is not None:
+        return _align_opcodes(before_lined_tokens, after_lined_tokens, line_diff_results, normalizer.inline_opcodes, alignment, normalizer)
+    return _align_opcodes(before_lined_tokens, after_lined_tokens, line_diff_results, inline_opcodes, alignment)
+
+
+# Split the replace blocks of BULK_REPLACE into opcodes of LINE_REPLACE (replace of the same number of lines), delete and insert
+# the aligned pairs maximize the matched characters (minimize the distance), and they keep the order of the lines
+# a block is kept as it is if it is larger than max_lines or no pair is similar enough
+# the distances of the pairs are counted by the normalizer if given (inline_opcodes must be normalizer.inline_opcodes)
+def _align_opcodes(
+    before_lined_tokens: Sequence[List[str]],
+    after_lined_tokens: Sequence[List[str]],
+    line_diff_results: Iterable[Tuple[str, int, int, int, int]],
+    inline_opcodes: Callable[[List[str], List[str]], List[Tuple[str, int, int, int, int]]],
+    alignment: Alignment,
+    normalizer: Optional[Normalizer] = None) -> List[Tuple[str, int, int, int, int]]:
+
+    res = []
+    for line_diff_result in line_diff_results:
+        tag, before_line_start_number, before_line_end_number, after_line_start_number, after_line_end_number = line_diff_result
+        before_lines_len = before_line_end_number - before_line_start_number
+        after_lines_len = after_line_end_number - after_line_start_number
+        if (tag != DiffType.REPLACE.value
+            or before_lines_len == after_lines_len
+            or max(before_lines_len, after_lines_len) > alignment.max_lines):
+            res.append(line_diff_result)
+            continue
+
+        pairs = __align_lines(
+            before_lined_tokens[before_line_start_number:before_line_end_number],
+            after_lined_tokens[after_line_start_number:after_line_end_number],
+            inline_opcodes,
+            alignment.cutoff,
+            normalizer)
+        if not pairs:
+            res.append(line_diff_result)
+            continue
+
+        # unaligned lines between the pairs are DELETE and INSERT
+        before_index = 0
+        after_index = 0
+        for before_pair_index, after_pair_index in pairs + [ (before_lines_len, after_lines_len) ]:
+            if before_index < before_pair_index:
+                res.append((DiffType.DELETE.value,
+                    before_line_start_number + before_index, before_line_start_number + before_pair_index,
+                    after_line_start_number + after_index, after_line_start_number + after_index))
+            if after_index < after_pair_index:
+                res.append((DiffType.INSERT.value,
+                    before_line_start_number + before_pair_index, before_line_start_number + before_pair_index,
+                    after_line_start_number + after_index, after_line_start_number + after_pair_index))
+            if before_pair_index == before_lines_len:
+                break
+
+            previous = res[-1] if res else None
+            if (previous is not None
+                and previous[0] == DiffType.REPLACE.value
+                and previous[2] == before_line_start_number + before_pair_index
+                and previous[4] == after_line_start_number + after_pair_index):
+                # merge consecutive pairs into one replace
+                res[-1] = (previous[0], previous[1], previous[2] + 1, previous[3], previous[4] + 1)
+            else:
+                res.append((DiffType.REPLACE.value,
+                    before_line_start_number + before_pair_index, before_line_start_number + before_pair_index + 1,
+                    after_line_start_number + after_pair_index, after_line_start_number + after_pair_index + 1))
+            before_index = before_pair_index + 1
+            after_index = after_pair_index + 1
+
+    return res
+
+def __align_lines(
+    diff_before_lined_tokens: Sequence[List[str]],
+    diff_after_lined_tokens: Sequence[List[str]],
+    inline_opcodes: Callable[[List[str], List[str]], List[Tuple[str, int, int, int, int]]],
+    cutoff: float,
+    normalizer: Optional[Normalizer]) -> List[Tuple[int, int]]:
+
+    count_line_replace_distance = __count_line_replace_distance if normalizer is None else normalizer.count_line_replace_distance
+
+    before_line_lengths = [ len("".join(line_tokens)) for line_tokens in diff_before_lined_tokens ]
+    after_line_lengths = [ len("".join(line_tokens)) for line_tokens in diff_after_lined_tokens ]
+
+    # gain of a pair = matched characters (distance of DELETE + INSERT - distance of LINE_REPLACE)
+    def gain(before_index: int, after_index: int) -> int:
+        length = before_line_lengths[before_index] + after_line_lengths[after_index]
+        if length == 0:
+            return 0
+        if normalizer is None and __length_upper_bound(before_line_lengths[before_index], after_line_lengths[after_index]) < cutoff:
+            # the bound does not hold if normalized (e.g. ignored whitespace is not counted as a diff)
+            return 0
+        diff_before_tokens = diff_before_lined_tokens[before_index]
+        diff_after_tokens = diff_after_lined_tokens[after_index]
+        distance = count_line_replace_distance(diff_before_tokens, diff_after_tokens, inline_opcodes(diff_before_tokens, diff_after_tokens))
+        return length - distance if 1. - distance / length >= cutoff else 0
+
+    # best[i][j] is the maximum gain of the first i lines of before and the first j lines of after
+    before_lines_len = len(diff_before_lined_tokens)
+    after_lines_len = len(diff_after_lined_tokens)
+    best = [ [ 0 ] * (after_lines_len + 1) for _ in range(before_lines_len + 1) ]
+    gains = [ [ 0 ] * after_lines_len for _ in range(before_lines_len) ]
+    for i in range(before_lines_len):
+        for j in range(after_lines_len):
+            gains[i][j] = gain(i, j)
+            best[i + 1][j + 1] = max(best[i][j + 1], best[i + 1][j], best[i][j] + gains[i][j] if gains[i][j] > 0 else 0)
+
+    pairs = []
+    i = before_lines_len
+    j = after_lines_len
+    while i > 0 and j > 0:
+        if best[i][j] == best[i - 1][j]:
+            i -= 1
+        elif best[i][j] == best[i][j - 1]:
+            j -= 1
+        else:
+            pairs.append((i - 1, j - 1))
+            i -= 1
+            j -= 1
+    pairs.reverse()
+    return pairs
+
+
+# Yield the diffs for the opcodes of the lines
+# diff_tokens calculates TokenDiffs of before/after for each pair of LINE_REPLACE lines
+# EQUAL lines keep the tokens of both before/after if normalized (they can be different)
+def _iter_diffs(
+    before_lined_tokens: Sequence[List[str]],
+    after_lined_tokens: Sequence[List[str]],
+    line_diff_results: Iterable[Tuple[str, int, int, int, int]],
+    diff_tokens: Callable[[List[str], List[str]], Tuple[List[TokenDiff], List[TokenDiff]]],
+    normalized: bool = False) -> Iterator[DiffBase]:
 
-    result = []
-    contains_bulk_replace = False
-    
     for line_diff_result in line_diff_results:
         label = DiffType(line_diff_result[0])
 
@@ -36,12 +326,20 @@ def diff(
             before_line_numbers = list(range(before_line_start_number, before_line_end_number + 1))
             after_line_numbers = list(range(after_line_start_number, after_line_end_number + 1))
 
+            if normalized:
+                yield from (
+                    LineDiff(DiffType.EQUAL, before_line_tokens, after_line_tokens, before_line_number, after_line_number)
+                    for before_line_tokens, after_line_tokens, before_line_number, after_line_number
+                    in zip(diff_before_lined_tokens, diff_after_lined_tokens, before_line_numbers, after_line_numbers)
+                    )
+                continue
+
             # contents of before/after is equal if EQUAL
-            result += [ 
+            yield from (
                 LineDiff.equal_line(line_tokens, before_line_number, after_line_number)
                 for line_tokens, before_line_number, after_line_number
                 in zip(diff_after_lined_tokens, before_line_numbers, after_line_numbers)
-                ]
+                )
             
         elif label == DiffType.INSERT:
             # if the line is inserted
@@ -50,11 +348,11 @@ def diff(
             after_line_numbers = list(range(after_line_start_number, after_line_end_number + 1))
             before_line_numbers = [before_line_start_number] * len(after_line_numbers)
 
-            result += [
+            yield from (
                 LineDiff.insert_line(line_tokens, before_line_number, after_line_number)
                 for line_tokens, before_line_number, after_line_number
                 in zip(diff_after_lined_tokens, before_line_numbers, after_line_numbers)
-                ]
+                )
             
         elif label == DiffType.DELETE:
             # if the line is deleted
@@ -63,96 +361,144 @@ def diff(
             before_line_numbers = list(range(before_line_start_number, before_line_end_number + 1))
             after_line_numbers = [after_line_start_number] * len(before_line_numbers)
 
-            result += [
+            yield from (
                 LineDiff.delete_line(line_tokens, before_line_number, after_line_number)
                 for line_tokens, before_line_number, after_line_number
                 in zip(diff_before_lined_tokens, before_line_numbers, after_line_numbers)
-                ]
+                )
             
         elif label == DiffType.REPLACE:
 
             if len(diff_before_lined_tokens) != len(diff_after_lined_tokens):
                 # whole lines are considerd BULK_REPLACE if different number of lines are replaced
-                # NOTE: compare each line of before/after
-                #       and change the label to LINE_REPLACE if the lines are very similar?
+                # NOTE: the similar lines are aligned into LINE_REPLACE before this if align (see _align_opcodes)
                 data = BulkReplace.bulk_replace(diff_before_lined_tokens, diff_after_lined_tokens, before_line_start_number, after_line_start_number)
-                result.append(data)
-                contains_bulk_replace = True
+                yield data
 
             else:
                 # each line is considerd LINE_REPLACE if same number of lines are replaced
                 # NOTE: it's possible that the number of lines are equal but the lines are not similar at all
                 lines_len = len(diff_before_lined_tokens)
-                result += __diff_line_replace(before_lined_tokens, after_lined_tokens, lines_len ,before_line_start_number, after_line_start_number)
-
-    return DiffResult(result, contains_bulk_replace)
+                yield from __diff_line_replace(before_lined_tokens, after_lined_tokens, lines_len ,before_line_start_number, after_line_start_number, diff_tokens)
 
-def __diff_line_replace(
+def __encode_lines(
     before_lined_tokens: List[List[str]],
     after_lined_tokens: List[List[str]],
+    vocabulary: Optional[Vocabulary],
+    normalizer: Optional[Normalizer] = None) -> Tuple[Sequence[Any], Sequence[Any]]:
+
+    if normalizer is not None:
+        # lines are compared as the keys of the normalized tokens (vocabulary is not used)
+        before_lines = [ normalizer.line_key(line_tokens) for line_tokens in before_lined_tokens ]
+        after_lines = [ normalizer.line_key(line_tokens) for line_tokens in after_lined_tokens ]
+    elif __is_encoded(before_lined_tokens, after_lined_tokens, vocabulary):
+        # lines are compared as line IDs (a list because SequenceMatcher is slower with an array)
+        before_lines = before_lined_tokens.line_ids.tolist()
+        after_lines = after_lined_tokens.line_ids.tolist()
+    else:
+        # lines are compared as joined strings (encoding them here would cost more than the matcher saves)
+        before_lines = __join_lines(before_lined_tokens)
+        after_lines = __join_lines(after_lined_tokens)
+    return (before_lines, after_lines)
+
+def __is_encoded(
+    before_lined_tokens: Sequence[List[str]],
+    after_lined_tokens: Sequence[List[str]],
+    vocabulary: Optional[Vocabulary]) -> bool:
+
+    # both sides are encoded by the same vocabulary (the given one if any), e.g. the files of a corpus
+    if not (isinstance(before_lined_tokens, EncodedLines) and isinstance(after_lined_tokens, EncodedLines)):
+        return False
+    shared_vocabulary = before_lined_tokens.vocabulary
+    return after_lined_tokens.vocabulary is shared_vocabulary and (vocabulary is None or vocabulary is shared_vocabulary)
+
+def __join_lines(lined_tokens: Sequence[List[str]]) -> List[str]:
+    if isinstance(lined_tokens, EncodedLines):
+        # joined once by Vocabulary.encode
+        return lined_tokens.lines
+    return [ "".join(line_tokens) for line_tokens in lined_tokens ]
+
+def __line_lengths(lined_tokens: Sequence[List[str]], lines: Sequence[Any]) -> List[int]:
+    # the number of characters of each line of __encode_lines (without a normalizer)
+    if isinstance(lined_tokens, EncodedLines):
+        return lined_tokens.line_lengths
+    return [ len(line) for line in lines ]
+
+def _inline_opcodes(
+    diff_before_tokens: List[str],
+    diff_after_tokens: List[str]) -> List[Tuple[str, int, int, int, int]]:
+
+    # tokens are compared as strings even with a vocabulary
+    # (the hashes of the strings are cached, and encoding the tokens of each pair costs more than it saves)
+    return SequenceMatcher(None, diff_before_tokens, diff_after_tokens).get_opcodes()
+
+def __diff_line_replace(
+    before_lined_tokens: Sequence[List[str]],
+    after_lined_tokens: Sequence[List[str]],
     lines_len: int,
     before_line_start_number: int,
-    after_line_start_number: int) -> List[LineReplace]:
-
-    # pre-calculate the difference for each token in the line to use it twice (before/after)
-    pre_inline_diff_results_list: List[List[Tuple[str, int, int, int, int]]] = []
-
-    for index in range(lines_len):
-        diff_before_tokens = before_lined_tokens[before_line_start_number + index]
-        diff_after_tokens = after_lined_tokens[after_line_start_number + index]
-        inline_diff_results = SequenceMatcher(None, diff_before_tokens, diff_after_tokens).get_opcodes()
-        pre_inline_diff_results_list.append(inline_diff_results)
+    after_line_start_number: int,
+    diff_tokens: Callable[[List[str], List[str]], Tuple[List[TokenDiff], List[TokenDiff]]]) -> List[LineReplace]:
 
     line_diffs: List[LineReplace] = []
 
     for index in range(lines_len):
 
-        inline_diff_results = pre_inline_diff_results_list[index]
         before_line_number = before_line_start_number + index
         after_line_number = after_line_start_number + index
         diff_before_tokens = before_lined_tokens[before_line_number]
         diff_after_tokens = after_lined_tokens[after_line_number]
 
-        before_line_token_diffs: List[TokenDiff] = []
-        after_line_token_diffs: List[TokenDiff] = []
+        before_line_token_diffs, after_line_token_diffs = diff_tokens(diff_before_tokens, diff_after_tokens)
 
+        line_diff = LineReplace.line_replace(before_line_token_diffs, after_line_token_diffs, before_line_number, after_line_number)
+        line_diffs.append(line_diff)
 
-        # before
-        current_before_column_number = 0
-        current_after_column_number = 0
-        for idx, inline_diff_result in enumerate(inline_diff_results):
-            label = DiffType(inline_diff_result[0])
-            # these are not column number, just a position of the token
-            before_token_start_pos = inline_diff_result[1]
-            before_token_end_pos = inline_diff_result[2]
+    return line_diffs
 
-            diff_before = diff_before_tokens[before_token_start_pos:before_token_end_pos]
-            diff_before_line = "".join(diff_before)
+# Calculate TokenDiffs of a pair of LINE_REPLACE lines from the opcodes of the tokens
+def _diff_tokens(
+    diff_before_tokens: List[str],
+    diff_after_tokens: List[str],
+    inline_diff_results: List[Tuple[str, int, int, int, int]]) -> Tuple[List[TokenDiff], List[TokenDiff]]:
 
-            diff_result, current_before_column_number, current_after_column_number = __convert_line_replace(inline_diff_results, idx, diff_before_line, diff_before, current_before_column_number, current_after_column_number, label, True)
-            before_line_token_diffs += diff_result
-        
-        
-        # after
-        current_before_column_number = 0
-        current_after_column_number = 0
-        for idx, inline_diff_result in enumerate(inline_diff_results):
-            label = DiffType(inline_diff_result[0])
-            # these are not column number, just a position of the token
-            after_token_start_pos = inline_diff_result[3]
-            after_token_end_pos = inline_diff_result[4]
-
-            diff_after = diff_after_tokens[after_token_start_pos:after_token_end_pos]
-            diff_after_line = "".join(diff_after)
-
-            diff_result, current_before_column_number, current_after_column_number = __convert_line_replace(inline_diff_results, idx, diff_after_line, diff_after, current_before_column_number, current_after_column_number, label, False)
-            after_line_token_diffs += diff_result
-        
+    before_line_token_diffs: List[TokenDiff] = []
+    after_line_token_diffs: List[TokenDiff] = []
 
-        line_diff = LineReplace.line_replace(before_line_token_diffs, after_line_token_diffs, before_line_number, after_line_number)
-        line_diffs.append(line_diff)
 
-    return line_diffs
+    # before
+    current_before_column_number = 0
+    current_after_column_number = 0
+    for idx, inline_diff_result in enumerate(inline_diff_results):
+        label = DiffType(inline_diff_result[0])
+        # these are not column number, just a position of the token
+        before_token_start_pos = inline_diff_result[1]
+        before_token_end_pos = inline_diff_result[2]
+
+        diff_before = diff_before_tokens[before_token_start_pos:before_token_end_pos]
+        diff_before_line = "".join(diff_before)
+
+        diff_result, current_before_column_number, current_after_column_number = __convert_line_replace(inline_diff_results, idx, diff_before_line, diff_before, current_before_column_number, current_after_column_number, label, True)
+        before_line_token_diffs += diff_result
+    
+    
+    # after
+    current_before_column_number = 0
+    current_after_column_number = 0
+    for idx, inline_diff_result in enumerate(inline_diff_results):
+        label = DiffType(inline_diff_result[0])
+        # these are not column number, just a position of the token
+        after_token_start_pos = inline_diff_result[3]
+        after_token_end_pos = inline_diff_result[4]
+
+        diff_after = diff_after_tokens[after_token_start_pos:after_token_end_pos]
+        diff_after_line = "".join(diff_after)
+
+        diff_result, current_before_column_number, current_after_column_number = __convert_line_replace(inline_diff_results, idx, diff_after_line, diff_after, current_before_column_number, current_after_column_number, label, False)
+        after_line_token_diffs += diff_result
+
+
+    return (before_line_token_diffs, after_line_token_diffs)
 
 def __convert_line_replace(
     inline_diff_results: List[Tuple[str, int, int, int, int]],
@@ -164,19 +510,7 @@ def __convert_line_replace(
     label: DiffType,
     is_before: bool) -> Tuple[List[TokenDiff], int, int]:
 
-    # if previous and next token is insert/delete/replace and this token is empty, it will be REPLACE
-    # this is because the inner empty token is often considered EQUAL even if the both(previous/next) tokens are REPLACE
-    is_between = False
-    if (0 < idx < len(inline_diff_results) - 1):
-
-        before_label = DiffType(inline_diff_results[idx - 1][0])
-        after_label = DiffType(inline_diff_results[idx + 1][0])
-        
-        if ((before_label == after_label == DiffType.INSERT)
-        or (before_label == after_label == DiffType.DELETE)
-        or (before_label == after_label == DiffType.REPLACE)):
-            if (diff_line.strip() == ""):
-                is_between = True
+    is_between = __is_between(inline_diff_results, idx, diff_line)
     
     if (is_between or label != DiffType.EQUAL):
         if is_before:
@@ -201,3 +535,354 @@ def __convert_line_replace(
             current_before_column_number += len(token)
             current_after_column_number += len(token)
         return (res, current_before_column_number, current_after_column_number)
+
+
+def __is_between(
+    inline_diff_results: List[Tuple[str, int, int, int, int]],
+    idx: int,
+    diff_line: str) -> bool:
+
+    # if previous and next token is insert/delete/replace and this token is empty, it will be REPLACE
+    # this is because the inner empty token is often considered EQUAL even if the both(previous/next) tokens are REPLACE
+    if (0 < idx < len(inline_diff_results) - 1):
+
+        before_label = DiffType(inline_diff_results[idx - 1][0])
+        after_label = DiffType(inline_diff_results[idx + 1][0])
+        
+        if ((before_label == after_label == DiffType.INSERT)
+        or (before_label == after_label == DiffType.DELETE)
+        or (before_label == after_label == DiffType.REPLACE)):
+            if (diff_line.strip() == ""):
+                return True
+
+    return False
+
+
+# Calculate diff().get_distance() without building the diff objects
+def distance(
+    before_lined_tokens: List[List[str]],
+    after_lined_tokens: List[List[str]],
+    vocabulary: Optional[Vocabulary] = None,
+    algorithm: str = "ratcliff",
+    align: Union[bool, 'Alignment'] = False,
+    normalizer: Optional[Normalizer] = None) -> int:
+
+    distance, _ = count_distance(before_lined_tokens, after_lined_tokens, vocabulary, algorithm, align, normalizer)
+    return distance
+
+
+# Calculate diff().get_similarity() without building the diff objects
+def similarity(
+    before_lined_tokens: List[List[str]],
+    after_lined_tokens: List[List[str]],
+    vocabulary: Optional[Vocabulary] = None,
+    algorithm: str = "ratcliff",
+    align: Union[bool, 'Alignment'] = False,
+    normalizer: Optional[Normalizer] = None) -> float:
+
+    distance, total = count_distance(before_lined_tokens, after_lined_tokens, vocabulary, algorithm, align, normalizer)
+    if total == 0:
+        # no diff
+        return 1
+    else:
+        return 1. - distance / total
+
+# Calculate (distance, total) of diff() without building the diff objects
+def count_distance(
+    before_lined_tokens: List[List[str]],
+    after_lined_tokens: List[List[str]],
+    vocabulary: Optional[Vocabulary] = None,
+    algorithm: str = "ratcliff",
+    align: Union[bool, 'Alignment'] = False,
+    normalizer: Optional[Normalizer] = None) -> Tuple[int, int]:
+
+    before_lines, after_lines = __encode_lines(before_lined_tokens, after_lined_tokens, vocabulary, normalizer)
+    line_diff_results = get_opcodes(before_lines, after_lines, algorithm)
+    if align:
+        line_diff_results = __align(before_lined_tokens, after_lined_tokens, line_diff_results, vocabulary, align, normalizer)
+
+    if normalizer is not None:
+        # the distance is counted in the characters of the original tokens
+        before_line_lengths = [ sum(len(token) for token in line_tokens) for line_tokens in before_lined_tokens ]
+        after_line_lengths = [ sum(len(token) for token in line_tokens) for line_tokens in after_lined_tokens ]
+        return _count_distance(before_lined_tokens, after_lined_tokens, before_line_lengths, after_line_lengths, line_diff_results, normalizer.inline_opcodes, normalizer)
+
+    before_line_lengths = __line_lengths(before_lined_tokens, before_lines)
+    after_line_lengths = __line_lengths(after_lined_tokens, after_lines)
+
+    def inline_opcodes(diff_before_tokens: List[str], diff_after_tokens: List[str]) -> List[Tuple[str, int, int, int, int]]:
+        return _inline_opcodes(diff_before_tokens, diff_after_tokens)
+
+    return _count_distance(before_lined_tokens, after_lined_tokens, before_line_lengths, after_line_lengths, line_diff_results, inline_opcodes)
+
+# Calculate (distance, total) for the opcodes of the lines without building the diff objects
+# inline_opcodes calculates the opcodes of the tokens for each pair of LINE_REPLACE lines
+# the distances of LINE_REPLACE are counted by the normalizer if given (inline_opcodes must be normalizer.inline_opcodes)
+def _count_distance(
+    before_lined_tokens: Sequence[List[str]],
+    after_lined_tokens: Sequence[List[str]],
+    before_line_lengths: Sequence[int],
+    after_line_lengths: Sequence[int],
+    line_diff_results: Iterable[Tuple[str, int, int, int, int]],
+    inline_opcodes: Callable[[List[str], List[str]], List[Tuple[str, int, int, int, int]]],
+    normalizer: Optional[Normalizer] = None) -> Tuple[int, int]:
+
+    count_line_replace_distance = __count_line_replace_distance if normalizer is None else normalizer.count_line_replace_distance
+
+    # every character of before/after is counted once in total, whatever the label is
+    total = sum(before_line_lengths) + sum(after_line_lengths)
+    distance = 0
+
+    for tag, before_line_start_number, before_line_end_number, after_line_start_number, after_line_end_number in line_diff_results:
+        label = DiffType(tag)
+        if label == DiffType.EQUAL:
+            continue
+        elif label == DiffType.INSERT:
+            distance += sum(after_line_lengths[after_line_start_number:after_line_end_number])
+        elif label == DiffType.DELETE:
+            distance += sum(before_line_lengths[before_line_start_number:before_line_end_number])
+        elif (before_line_end_number - before_line_start_number) != (after_line_end_number - after_line_start_number):
+            # BULK_REPLACE
+            distance += sum(before_line_lengths[before_line_start_number:before_line_end_number])
+            distance += sum(after_line_lengths[after_line_start_number:after_line_end_number])
+        else:
+            # LINE_REPLACE
+            for index in range(before_line_end_number - before_line_start_number):
+                diff_before_tokens = before_lined_tokens[before_line_start_number + index]
+                diff_after_tokens = after_lined_tokens[after_line_start_number + index]
+                inline_diff_results = inline_opcodes(diff_before_tokens, diff_after_tokens)
+                distance += count_line_replace_distance(diff_before_tokens, diff_after_tokens, inline_diff_results)
+
+    return (distance, total)
+
+def __count_line_replace_distance(
+    diff_before_tokens: List[str],
+    diff_after_tokens: List[str],
+    inline_diff_results: List[Tuple[str, int, int, int, int]]) -> int:
+
+    distance = 0
+    for idx, (tag, before_token_start_pos, before_token_end_pos, after_token_start_pos, after_token_end_pos) in enumerate(inline_diff_results):
+        diff_before = diff_before_tokens[before_token_start_pos:before_token_end_pos]
+        # the tokens are DELETE (before) and INSERT (after) unless they are EQUAL
+        if tag != "equal" or __is_between(inline_diff_results, idx, "".join(diff_before)):
+            distance += sum(len(token) for token in diff_before)
+            distance += sum(len(token) for token in diff_after_tokens[after_token_start_pos:after_token_end_pos])
+
+    return distance
+
+# Check similarity() >= threshold, rejecting the pair by upper bounds before the diff
+def similarity_at_least(
+    before_lined_tokens: List[List[str]],
+    after_lined_tokens: List[List[str]],
+    threshold: float,
+    vocabulary: Optional[Vocabulary] = None,
+    algorithm: str = "ratcliff",
+    normalizer: Optional[Normalizer] = None) -> bool:
+
+    if normalizer is not None:
+        # the bounds of the characters do not hold (e.g. ignored whitespace is not counted as a diff)
+        return similarity(before_lined_tokens, after_lined_tokens, vocabulary, algorithm, normalizer=normalizer) >= threshold
+
+    # similarity is 2 * (matched characters) / (total characters)
+    # because every matched character is counted once in before and once in after
+    before_length = sum(len(token) for line_tokens in before_lined_tokens for token in line_tokens)
+    after_length = sum(len(token) for line_tokens in after_lined_tokens for token in line_tokens)
+    if __length_upper_bound(before_length, after_length) < threshold:
+        return False
+    if _upper_bound(_profile(before_lined_tokens), _profile(after_lined_tokens)) < threshold:
+        return False
+    return similarity(before_lined_tokens, after_lined_tokens, vocabulary, algorithm) >= threshold
+
+
+# Find k items of the corpus which are the most similar to the query
+# returns [ (index in the corpus, similarity) ] in descending order of similarity (ascending order of index if tie)
+def top_k(
+    query_lined_tokens: List[List[str]],
+    corpus: Sequence[List[List[str]]],
+    k: int,
+    vocabulary: Optional[Vocabulary] = None,
+    algorithm: str = "ratcliff",
+    normalizer: Optional[Normalizer] = None) -> List[Tuple[int, float]]:
+
+    if k <= 0:
+        return []
+
+    if normalizer is not None:
+        # the bounds of the characters do not hold, so every item is compared
+        upper_bounds = [ (1., index) for index in range(len(corpus)) ]
+    else:
+        query_profile = _profile(query_lined_tokens)
+        upper_bounds = sorted(
+            ((_upper_bound(query_profile, _profile(lined_tokens)), index) for index, lined_tokens in enumerate(corpus)),
+            key=lambda upper_bound: (-upper_bound[0], upper_bound[1]))
+
+    # the query is encoded once, for the items encoded by the same vocabulary (the others are compared as joined lines)
+    encoded_query_lined_tokens = None
+    if vocabulary is not None and isinstance(query_lined_tokens, EncodedLines) and query_lined_tokens.vocabulary is vocabulary:
+        encoded_query_lined_tokens = query_lined_tokens
+
+    # min-heap of (similarity, -index), so that the worst result is at the top
+    results: List[Tuple[float, int]] = []
+    for upper_bound, index in upper_bounds:
+        if len(results) == k and upper_bound < results[0][0]:
+            # the rest cannot be better than the current results
+            break
+        lined_tokens = corpus[index]
+        if vocabulary is not None and normalizer is None and isinstance(lined_tokens, EncodedLines) and lined_tokens.vocabulary is vocabulary:
+            if encoded_query_lined_tokens is None:
+                encoded_query_lined_tokens = vocabulary.encode(query_lined_tokens)
+            item = (similarity(encoded_query_lined_tokens, lined_tokens, vocabulary, algorithm), -index)
+        else:
+            item = (similarity(query_lined_tokens, lined_tokens, vocabulary, algorithm, normalizer=normalizer), -index)
+        if len(results) < k:
+            heapq.heappush(results, item)
+        elif item > results[0]:
+            heapq.heapreplace(results, item)
+
+    return [ (-negative_index, similarity_value) for similarity_value, negative_index in sorted(results, reverse=True) ]
+
+def _profile(lined_tokens: List[List[str]]) -> Tuple[int, Counter]:
+    # (the number of characters, the number of each character)
+    text = "".join([ "".join(line_tokens) for line_tokens in lined_tokens ])
+    return (len(text), Counter(text))
+
+def __length_upper_bound(before_length: int, after_length: int) -> float:
+    # matched characters <= the shorter one
+    if before_length + after_length == 0:
+        # no diff
+        return 1
+    return 2 * min(before_length, after_length) / (before_length + after_length)
+
+def _upper_bound(
+    before_profile: Tuple[int, Counter],
+    after_profile: Tuple[int, Counter]) -> float:
+
+    # matched characters <= common characters (regardless of the order)
+    # NOTE: common tokens are not an upper bound
+    #       because EQUAL lines are compared as joined strings (same line can be tokenized differently)
+    before_length, before_counter = before_profile
+    after_length, after_counter = after_profile
+    if before_length + after_length == 0:
+        # no diff
+        return 1
+    common_length = sum((before_counter & after_counter).values())
+    return 2 * common_length / (before_length + after_length)
+
+
+# Calculate get_similarity() for every pair of a corpus
+# matrix[row, column] is the similarity of (before=corpus[row], after=corpus[column])
+# NOTE: the diff is not symmetric (e.g. the matcher prefers the earlier lines of before), so neither is the matrix
+#       symmetric=True is an approximation which computes only the upper triangle (half the pairs) and mirrors it
+def similarity_matrix(
+    lined_tokens_list: Sequence[List[List[str]]],
+    workers: Optional[int] = None,
+    chunk_size: int = 256,
+    threshold: Optional[float] = None,
+    symmetric: bool = False,
+    algorithm: str = "ratcliff",
+    normalizer: Optional[Normalizer] = None) -> Any:
+
+    # numpy/scipy are optional dependencies (pip install differ-for-code[matrix])
+    import numpy
+
+    size = len(lined_tokens_list)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    # a chunk is a list of (row, column start, column end) segments
+    # so that only indexes are sent to the workers, never the tokens
+    chunks = __iter_similarity_chunks(size, chunk_size, symmetric)
+
+    if workers <= 1:
+        __init_similarity_worker(lined_tokens_list, normalizer)
+        try:
+            chunk_results = map(lambda chunk: __similarity_chunk(chunk, threshold, algorithm), chunks)
+            entries = [ entry for chunk_result in chunk_results for entry in chunk_result ]
+        finally:
+            __init_similarity_worker(None, None)
+    else:
+        entries = []
+        # the corpus (and the normalizer) is pickled once per worker by the initializer
+        with ProcessPoolExecutor(workers, initializer=__init_similarity_worker, initargs=(lined_tokens_list, normalizer)) as executor:
+            # keep a bounded number of chunks in flight to bound the memory of the pair list
+            pending = set()
+            for chunk in chunks:
+                if len(pending) >= workers * 4:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        entries += future.result()
+                pending.add(executor.submit(__similarity_chunk, chunk, threshold, algorithm))
+            for future in pending:
+                entries += future.result()
+
+    if threshold is None:
+        matrix = numpy.ones((size, size), dtype=float)
+        for row, column, similarity in entries:
+            matrix[row, column] = similarity
+            if symmetric:
+                matrix[column, row] = similarity
+        return matrix
+
+    from scipy.sparse import coo_matrix
+
+    # the diagonal is always 1 (same token list)
+    rows = list(range(size))
+    columns = list(range(size))
+    values = [1.] * size
+    for row, column, similarity in entries:
+        rows.append(row)
+        columns.append(column)
+        values.append(similarity)
+        if symmetric:
+            rows.append(column)
+            columns.append(row)
+            values.append(similarity)
+    return coo_matrix((values, (rows, columns)), shape=(size, size)).tocsr()
+
+
+# tokens of the corpus shared by a worker process
+__worker_lined_tokens_list: Optional[Sequence[List[List[str]]]] = None
+__worker_normalizer: Optional[Normalizer] = None
+
+def __init_similarity_worker(lined_tokens_list: Optional[Sequence[List[List[str]]]], normalizer: Optional[Normalizer]):
+    global __worker_lined_tokens_list, __worker_normalizer
+    __worker_lined_tokens_list = lined_tokens_list
+    __worker_normalizer = normalizer
+
+def __iter_similarity_chunks(
+    size: int,
+    chunk_size: int,
+    symmetric: bool) -> Iterator[List[Tuple[int, int, int]]]:
+
+    chunk: List[Tuple[int, int, int]] = []
+    chunk_pairs = 0
+    for row in range(size):
+        # only the upper triangle is computed if symmetric
+        column = row + 1 if symmetric else 0
+        while column < size:
+            column_end = min(size, column + chunk_size - chunk_pairs)
+            chunk.append((row, column, column_end))
+            chunk_pairs += column_end - column
+            column = column_end
+            if chunk_pairs >= chunk_size:
+                yield chunk
+                chunk = []
+                chunk_pairs = 0
+    if chunk:
+        yield chunk
+
+def __similarity_chunk(
+    chunk: List[Tuple[int, int, int]],
+    threshold: Optional[float],
+    algorithm: str) -> List[Tuple[int, int, float]]:
+
+    lined_tokens_list = __worker_lined_tokens_list
+    res = []
+    for row, column_start, column_end in chunk:
+        for column in range(column_start, column_end):
+            if row == column:
+                continue
+            similarity_value = similarity(lined_tokens_list[row], lined_tokens_list[column], algorithm=algorithm, normalizer=__worker_normalizer)
+            if threshold is None or similarity_value >= threshold:
+                res.append((row, column, similarity_value))
+    return res
@@ -0,0 +1,200 @@
+from typing import Dict, List, Optional, Tuple
+
+from differ_for_code import (BulkReplace, DiffBase, DiffResult, DiffType,
+                             LineDiff, LineReplace, TokenDiff, differ)
+from differ_for_code.algorithm import get_opcodes
+from differ_for_code.memo import InlineMemo
+from differ_for_code.vocabulary import Vocabulary
+
+
+# Keep the last diff and update it when the lines of after are edited (e.g. editor)
+# exact (default): the whole lines (line IDs) are matched again, so the result is the same as differ.diff of the current lines,
+#   and the diff objects of the opcodes which are not changed by the edit are reused
+#   (the diffs after the edit are moved by the number of the added lines, and their TokenDiffs are reused)
+# exact=False: only the window between the EQUAL runs around the edited lines is matched again,
+#   and the opcodes of the window are spliced into the previous opcodes
+#   NOTE: the matching is not local (a small edit can change the alignment of far lines in differ.diff),
+#         so the result can be different from differ.diff, but it is always a valid diff of the current lines;
+#         rediff() matches the whole lines again
+class IncrementalDiffer:
+
+    def __init__(
+        self,
+        before_lined_tokens: List[List[str]],
+        after_lined_tokens: List[List[str]],
+        algorithm: str = "ratcliff",
+        vocabulary: Optional[Vocabulary] = None,
+        memo: Optional[InlineMemo] = None,
+        exact: bool = True):
+
+        self.algorithm = algorithm
+        self.exact = exact
+        self.vocabulary = Vocabulary() if vocabulary is None else vocabulary
+        self.before_lined_tokens = before_lined_tokens
+        self.after_lined_tokens = list(after_lined_tokens)
+        self.before_lines = self.vocabulary.encode_lines(self.before_lined_tokens)
+        self.after_lines = self.vocabulary.encode_lines(self.after_lined_tokens)
+
+        # TokenDiffs of the LINE_REPLACE line pairs (can be shared with differ.diff(..., memo=memo))
+        self.memo = InlineMemo() if memo is None else memo
+        self.line_diff_results: List[Tuple[str, int, int, int, int]] = []
+        self.result = self.rediff()
+
+
+    def rediff(self) -> DiffResult:
+        # match the whole lines again (same as differ.diff)
+        self.line_diff_results = get_opcodes(self.before_lines, self.after_lines, self.algorithm)
+        self.result = DiffResult.from_iter(self.__iter_diffs(self.line_diff_results))
+        return self.result
+
+
+    def replace_lines(
+        self,
+        after_line_start_number: int,
+        after_line_end_number: int,
+        lined_tokens: List[List[str]]) -> DiffResult:
+
+        # replace after[start:end] with the lines
+        self.after_lined_tokens[after_line_start_number:after_line_end_number] = lined_tokens
+        self.after_lines[after_line_start_number:after_line_end_number] = self.vocabulary.encode_lines(lined_tokens)
+        delta = len(lined_tokens) - (after_line_end_number - after_line_start_number)
+        if self.exact:
+            return self.__rediff_exact(after_line_start_number, after_line_end_number, delta)
+
+        # the opcodes which overlap the edited lines (the non-EQUAL opcodes which touch them too)
+        # they are contiguous, and the opcodes around them are EQUAL because non-EQUAL opcodes are never adjacent
+        window = [
+            index for index, (tag, _, _, after_start, after_end) in enumerate(self.line_diff_results)
+            if (after_start < after_line_end_number and after_end > after_line_start_number)
+            or (tag != DiffType.EQUAL.value and after_start <= after_line_end_number and after_end >= after_line_start_number)
+        ]
+        if window:
+            first, last = window[0], window[-1]
+            tag, before_start, _, after_start, _ = self.line_diff_results[first]
+            # an EQUAL opcode is cut at the edited lines
+            window_after_start = max(after_start, after_line_start_number) if tag == DiffType.EQUAL.value else after_start
+            window_before_start = before_start + (window_after_start - after_start)
+            tag, before_start, before_end, after_start, after_end = self.line_diff_results[last]
+            window_after_end = min(after_end, after_line_end_number) if tag == DiffType.EQUAL.value else after_end
+            window_before_end = before_start + (window_after_end - after_start) if tag == DiffType.EQUAL.value else before_end
+        else:
+            # inserted between two EQUAL opcodes (or into empty lines)
+            first, last = len(self.line_diff_results), len(self.line_diff_results) - 1
+            window_after_start = window_after_end = after_line_start_number
+            window_before_start = window_before_end = 0
+            for index, (_, _, before_end, _, after_end) in enumerate(self.line_diff_results):
+                if after_end <= after_line_start_number:
+                    first, last = index + 1, index
+                    window_before_start = window_before_end = before_end
+
+        # opcodes and diffs before/after the window (with the cut parts of the EQUAL opcodes)
+        prefix = self.line_diff_results[:first]
+        suffix = [ (tag, before_start, before_end, after_start + delta, after_end + delta)
+            for tag, before_start, before_end, after_start, after_end in self.line_diff_results[last + 1:] ]
+        diffs_start = sum(IncrementalDiffer.__count_diffs(line_diff_result) for line_diff_result in prefix)
+        diffs_end = diffs_start + sum(IncrementalDiffer.__count_diffs(line_diff_result) for line_diff_result in self.line_diff_results[first:last + 1])
+        if window:
+            tag, before_start, _, after_start, _ = self.line_diff_results[first]
+            if tag == DiffType.EQUAL.value and after_start < window_after_start:
+                prefix.append((tag, before_start, window_before_start, after_start, window_after_start))
+                diffs_start += window_after_start - after_start
+            tag, _, before_end, _, after_end = self.line_diff_results[last]
+            if tag == DiffType.EQUAL.value and window_after_end < after_end:
+                suffix.insert(0, (tag, window_before_end, before_end, window_after_end + delta, after_end + delta))
+                diffs_end -= after_end - window_after_end
+
+        # match only the window again
+        window_line_diff_results = [
+            (tag, before_start + window_before_start, before_end + window_before_start, after_start + window_after_start, after_end + window_after_start)
+            for tag, before_start, before_end, after_start, after_end
+            in get_opcodes(self.before_lines[window_before_start:window_before_end], self.after_lines[window_after_start:window_after_end + delta], self.algorithm)
+        ]
+
+        previous_diffs = self.result.diffs
+        diffs = previous_diffs[:diffs_start]
+        diffs += self.__iter_diffs(window_line_diff_results)
+        if delta == 0:
+            diffs += previous_diffs[diffs_end:]
+        else:
+            diffs += (IncrementalDiffer.__move(diff, delta) for diff in previous_diffs[diffs_end:])
+
+        self.line_diff_results = IncrementalDiffer.__merge(prefix + window_line_diff_results + suffix)
+        self.result = DiffResult.from_iter(diffs)
+        return self.result
+
+
+    def __rediff_exact(self, after_line_start_number: int, after_line_end_number: int, delta: int) -> DiffResult:
+        # previous opcode (moved by delta if after the edit) -> (start, end, moved) of its diffs
+        # the opcodes before the edit refer to the same lines, and the ones after it refer to the moved lines
+        previous_diffs = self.result.diffs
+        reusable: Dict[Tuple[str, int, int, int, int], Tuple[int, int, bool]] = {}
+        diffs_start = 0
+        for line_diff_result in self.line_diff_results:
+            tag, before_start, before_end, after_start, after_end = line_diff_result
+            diffs_end = diffs_start + IncrementalDiffer.__count_diffs(line_diff_result)
+            if after_end <= after_line_start_number:
+                reusable[line_diff_result] = (diffs_start, diffs_end, False)
+            if after_start >= after_line_end_number:
+                reusable[(tag, before_start, before_end, after_start + delta, after_end + delta)] = (diffs_start, diffs_end, delta != 0)
+            diffs_start = diffs_end
+
+        self.line_diff_results = get_opcodes(self.before_lines, self.after_lines, self.algorithm)
+        diffs: List[DiffBase] = []
+        for line_diff_result in self.line_diff_results:
+            reused = reusable.get(line_diff_result)
+            if reused is None:
+                diffs += self.__iter_diffs([ line_diff_result ])
+            elif reused[2]:
+                diffs += (IncrementalDiffer.__move(diff, delta) for diff in previous_diffs[reused[0]:reused[1]])
+            else:
+                diffs += previous_diffs[reused[0]:reused[1]]
+        self.result = DiffResult.from_iter(diffs)
+        return self.result
+
+
+    def insert_lines(self, after_line_number: int, lined_tokens: List[List[str]]) -> DiffResult:
+        return self.replace_lines(after_line_number, after_line_number, lined_tokens)
+
+
+    def delete_lines(self, after_line_start_number: int, after_line_end_number: int) -> DiffResult:
+        return self.replace_lines(after_line_start_number, after_line_end_number, [])
+
+
+    def __iter_diffs(self, line_diff_results: List[Tuple[str, int, int, int, int]]) -> List[DiffBase]:
+        def diff_tokens(diff_before_tokens: List[str], diff_after_tokens: List[str]) -> Tuple[List[TokenDiff], List[TokenDiff]]:
+            inline_diff_results = differ._inline_opcodes(diff_before_tokens, diff_after_tokens)
+            return differ._diff_tokens(diff_before_tokens, diff_after_tokens, inline_diff_results)
+
+        return list(differ._iter_diffs(self.before_lined_tokens, self.after_lined_tokens, line_diff_results, self.memo.memoize(diff_tokens)))
+
+
+    @staticmethod
+    def __count_diffs(line_diff_result: Tuple[str, int, int, int, int]) -> int:
+        # the number of the diffs of an opcode (see differ._iter_diffs)
+        tag, before_start, before_end, after_start, after_end = line_diff_result
+        if tag == DiffType.REPLACE.value:
+            return 1 if before_end - before_start != after_end - after_start else before_end - before_start
+        return max(before_end - before_start, after_end - after_start)
+
+
+    @staticmethod
+    def __move(diff: DiffBase, delta: int) -> DiffBase:
+        # the same diff whose after line numbers are moved (the tokens and TokenDiffs are shared)
+        if type(diff) == LineDiff:
+            return LineDiff(diff.label, diff.before, diff.after, diff.before_line_number, diff.after_line_number + delta)
+        elif type(diff) == BulkReplace:
+            return BulkReplace(diff.before, diff.after, diff.before_line_start_number, diff.after_line_start_number + delta)
+        else:
+            return LineReplace(diff.before, diff.after, diff.before_line_number, diff.after_line_number + delta)
+
+
+    @staticmethod
+    def __merge(line_diff_results: List[Tuple[str, int, int, int, int]]) -> List[Tuple[str, int, int, int, int]]:
+        # merge the adjacent EQUAL opcodes at the edges of the window (same as get_opcodes)
+        res: List[Tuple[str, int, int, int, int]] = []
+        for line_diff_result in line_diff_results:
+            if res and res[-1][0] == line_diff_result[0] == DiffType.EQUAL.value:
+                res[-1] = (res[-1][0], res[-1][1], line_diff_result[2], res[-1][3], line_diff_result[4])
+            else:
+                res.append(line_diff_result)
+        return res
@@ -0,0 +1,323 @@
+import struct
+import tempfile
+from array import array
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import (Any, BinaryIO, Deque, Dict, Iterator, List, Optional,
+                    Sequence, Tuple)
+
+from differ_for_code import CompactDiffs, DiffBase, DiffResult, DiffType, differ
+from differ_for_code.algorithm import _longest_increasing, get_opcodes
+from differ_for_code.vocabulary import Vocabulary
+
+# Large-file mode
+# lines which appear exactly once in both of before/after (anchors) split the files into independent regions,
+# and only the regions are given to the algorithm (optionally in parallel)
+# the opcodes are kept in memory up to max_memory_bytes, and the rest is spilled to a temporary file
+# the diffs are built while they are consumed, so they can be streamed (e.g. renderer.render)
+# NOTE: max_memory_bytes bounds only the opcodes, and the rest is not bounded:
+#       the lined tokens, the line IDs and the line lengths (an int for each line),
+#       the table of the distinct lines while they are encoded (kept by the vocabulary if given),
+#       and the diffs kept by diff (CompactDiffs by default, iter_diff and count_distance keep none)
+# the result is the same as differ.diff if before + after has at most region_lines lines
+# NOTE: otherwise the result can differ from differ.diff because the anchors are always matched (like patience)
+
+# a region with at most this number of lines (before + after) is not split further
+REGION_LINES = 4096
+# a region with less lines is diffed in the current process even if workers > 1
+PARALLEL_MIN_LINES = 256
+MAX_MEMORY_BYTES = 64 << 20
+# estimated size of an opcode in memory (tuple of a str and 4 ints)
+OPCODE_BYTES = 120
+
+TAGS = [ DiffType.EQUAL.value, DiffType.INSERT.value, DiffType.DELETE.value, DiffType.REPLACE.value ]
+OPCODE = struct.Struct("=Bqqqq")
+
+
+# Opcodes of the lines in order, spilled to a temporary file if they exceed max_memory_bytes
+# consecutive EQUAL opcodes are merged
+class OpcodeSpool:
+
+    def __init__(self, max_memory_bytes: int = MAX_MEMORY_BYTES):
+        self.max_memory_bytes = max_memory_bytes
+        self.opcodes: List[Tuple[str, int, int, int, int]] = []
+        self.last: Optional[Tuple[str, int, int, int, int]] = None
+        self.file: Optional[BinaryIO] = None
+        self.spilled = 0
+
+
+    def __enter__(self) -> 'OpcodeSpool':
+        return self
+
+
+    def __exit__(self, *args: Any):
+        self.close()
+
+
+    def __len__(self) -> int:
+        return self.spilled + len(self.opcodes) + (self.last is not None)
+
+
+    def append(self, opcode: Tuple[str, int, int, int, int]):
+        last = self.last
+        if (last is not None and last[0] == DiffType.EQUAL.value and opcode[0] == DiffType.EQUAL.value
+            and last[2] == opcode[1] and last[4] == opcode[3]):
+            self.last = (last[0], last[1], opcode[2], last[3], opcode[4])
+            return
+        if last is not None:
+            self.__store(last)
+        self.last = opcode
+
+
+    def __iter__(self) -> Iterator[Tuple[str, int, int, int, int]]:
+        if self.file is not None:
+            self.file.flush()
+            self.file.seek(0)
+            while True:
+                data = self.file.read(OPCODE.size * 4096)
+                if not data:
+                    break
+                for tag, before_start, before_end, after_start, after_end in OPCODE.iter_unpack(data):
+                    yield (TAGS[tag], before_start, before_end, after_start, after_end)
+            self.file.seek(0, 2)
+        yield from self.opcodes
+        if self.last is not None:
+            yield self.last
+
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.opcodes = []
+        self.last = None
+
+
+    def __store(self, opcode: Tuple[str, int, int, int, int]):
+        self.opcodes.append(opcode)
+        if len(self.opcodes) * OPCODE_BYTES > self.max_memory_bytes:
+            if self.file is None:
+                self.file = tempfile.TemporaryFile()
+            self.file.write(b"".join([ OPCODE.pack(TAGS.index(tag), *positions) for tag, *positions in self.opcodes ]))
+            self.spilled += len(self.opcodes)
+            self.opcodes = []
+
+
+# Calculate the opcodes of the lines (line IDs) region by region
+def line_opcodes(
+    before_lines: Sequence[int],
+    after_lines: Sequence[int],
+    algorithm: str = "ratcliff",
+    workers: int = 1,
+    region_lines: int = REGION_LINES,
+    max_memory_bytes: int = MAX_MEMORY_BYTES) -> OpcodeSpool:
+
+    spool = OpcodeSpool(max_memory_bytes)
+    executor = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        # keep the order of the regions, with a bounded number of regions in flight
+        pending: Deque[Future] = deque()
+        for item in __iter_regions(before_lines, after_lines, region_lines):
+            if item[0] == DiffType.EQUAL.value:
+                future: Future = Future()
+                future.set_result([ item ])
+            else:
+                _, before_start, before_end, after_start, after_end = item
+                before_region = before_lines[before_start:before_end]
+                after_region = after_lines[after_start:after_end]
+                if executor is not None and (before_end - before_start) + (after_end - after_start) >= PARALLEL_MIN_LINES:
+                    future = executor.submit(__region_opcodes, before_region, after_region, before_start, after_start, algorithm)
+                else:
+                    future = Future()
+                    future.set_result(__region_opcodes(before_region, after_region, before_start, after_start, algorithm))
+            pending.append(future)
+            while pending and (pending[0].done() or len(pending) >= max(1, workers) * 4):
+                for opcode in pending.popleft().result():
+                    spool.append(opcode)
+        for future in pending:
+            for opcode in future.result():
+                spool.append(opcode)
+    except BaseException:
+        spool.close()
+        raise
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    return spool
+
+
+# Yield the diffs of the large-file mode one by one
+def iter_diff(
+    before_lined_tokens: Sequence[List[str]],
+    after_lined_tokens: Sequence[List[str]],
+    vocabulary: Optional[Vocabulary] = None,
+    algorithm: str = "ratcliff",
+    workers: int = 1,
+    region_lines: int = REGION_LINES,
+    max_memory_bytes: int = MAX_MEMORY_BYTES) -> Iterator[DiffBase]:
+
+    before_lines, after_lines, _, _ = __encode_lines(before_lined_tokens, after_lined_tokens, vocabulary)
+    spool = line_opcodes(before_lines, after_lines, algorithm, workers, region_lines, max_memory_bytes)
+    del before_lines, after_lines
+
+    def diff_tokens(diff_before_tokens: List[str], diff_after_tokens: List[str]) -> Any:
+        return differ._diff_tokens(diff_before_tokens, diff_after_tokens, differ._inline_opcodes(diff_before_tokens, diff_after_tokens))
+
+    with spool:
+        yield from differ._iter_diffs(before_lined_tokens, after_lined_tokens, spool, diff_tokens)
+
+
+def diff(
+    before_lined_tokens: Sequence[List[str]],
+    after_lined_tokens: Sequence[List[str]],
+    vocabulary: Optional[Vocabulary] = None,
+    algorithm: str = "ratcliff",
+    workers: int = 1,
+    region_lines: int = REGION_LINES,
+    max_memory_bytes: int = MAX_MEMORY_BYTES,
+    compact: bool = True) -> DiffResult:
+
+    # the diffs are stored in arrays by default, a list of the diff objects is as large as the files
+    store = CompactDiffs(before_lined_tokens, after_lined_tokens) if compact else None
+    diffs = iter_diff(before_lined_tokens, after_lined_tokens, vocabulary, algorithm, workers, region_lines, max_memory_bytes)
+    return DiffResult.from_iter(diffs, store)
+
+
+# (distance, total) of the large-file mode without building the diff objects
+def count_distance(
+    before_lined_tokens: Sequence[List[str]],
+    after_lined_tokens: Sequence[List[str]],
+    vocabulary: Optional[Vocabulary] = None,
+    algorithm: str = "ratcliff",
+    workers: int = 1,
+    region_lines: int = REGION_LINES,
+    max_memory_bytes: int = MAX_MEMORY_BYTES) -> Tuple[int, int]:
+
+    before_lines, after_lines, before_line_lengths, after_line_lengths = __encode_lines(before_lined_tokens, after_lined_tokens, vocabulary)
+    def inline_opcodes(diff_before_tokens: List[str], diff_after_tokens: List[str]) -> List[Tuple[str, int, int, int, int]]:
+        return differ._inline_opcodes(diff_before_tokens, diff_after_tokens)
+
+    with line_opcodes(before_lines, after_lines, algorithm, workers, region_lines, max_memory_bytes) as spool:
+        return differ._count_distance(before_lined_tokens, after_lined_tokens, before_line_lengths, after_line_lengths, spool, inline_opcodes)
+
+
+def __encode_lines(
+    before_lined_tokens: Sequence[List[str]],
+    after_lined_tokens: Sequence[List[str]],
+    vocabulary: Optional[Vocabulary]) -> Tuple[array, array, array, array]:
+
+    # lines are compared as integers (same line string -> same integer)
+    # so that the regions sent to the workers are small
+    # the table of the distinct lines is released when they are encoded (not counted in max_memory_bytes)
+    if vocabulary is not None:
+        before_lines = array("i", vocabulary.encode_lines(before_lined_tokens))
+        after_lines = array("i", vocabulary.encode_lines(after_lined_tokens))
+        before_line_lengths = array("i", vocabulary.encode_line_lengths(before_lined_tokens, before_lines))
+        after_line_lengths = array("i", vocabulary.encode_line_lengths(after_lined_tokens, after_lines))
+        return (before_lines, after_lines, before_line_lengths, after_line_lengths)
+
+    line_ids: Dict[str, int] = {}
+    res = []
+    for lined_tokens in [ before_lined_tokens, after_lined_tokens ]:
+        lines = array("i")
+        line_lengths = array("i")
+        for line_tokens in lined_tokens:
+            line = "".join(line_tokens)
+            lines.append(line_ids.setdefault(line, len(line_ids)))
+            line_lengths.append(len(line))
+        res.append((lines, line_lengths))
+    return (res[0][0], res[1][0], res[0][1], res[1][1])
+
+def __iter_regions(
+    a: Sequence[int],
+    b: Sequence[int],
+    region_lines: int) -> Iterator[Tuple[str, int, int, int, int]]:
+
+    # yield EQUAL opcodes of the common lines and REPLACE items of the regions to diff, in order
+    stack: List[Tuple[bool, Tuple[str, int, int, int, int]]] = [ (True, (DiffType.REPLACE.value, 0, len(a), 0, len(b))) ]
+    while stack:
+        split, item = stack.pop()
+        if not split:
+            yield item
+            continue
+
+        _, a_lo, a_hi, b_lo, b_hi = item
+        if (a_hi - a_lo) + (b_hi - b_lo) <= region_lines:
+            yield item
+            continue
+        items: List[Tuple[bool, Tuple[str, int, int, int, int]]] = []
+
+        # common prefix/suffix always match
+        prefix_hi = a_lo
+        while prefix_hi < a_hi and b_lo + (prefix_hi - a_lo) < b_hi and a[prefix_hi] == b[b_lo + (prefix_hi - a_lo)]:
+            prefix_hi += 1
+        prefix = prefix_hi - a_lo
+        suffix = 0
+        while suffix < (a_hi - prefix_hi) and suffix < (b_hi - b_lo - prefix) and a[a_hi - 1 - suffix] == b[b_hi - 1 - suffix]:
+            suffix += 1
+        if prefix > 0:
+            items.append((False, (DiffType.EQUAL.value, a_lo, prefix_hi, b_lo, b_lo + prefix)))
+        a_lo, b_lo = prefix_hi, b_lo + prefix
+        a_hi, b_hi = a_hi - suffix, b_hi - suffix
+
+        if a_lo < a_hi or b_lo < b_hi:
+            anchors = []
+            if a_lo < a_hi and b_lo < b_hi:
+                anchors = __anchors(a, b, a_lo, a_hi, b_lo, b_hi)
+            if not anchors:
+                items.append((False, (DiffType.REPLACE.value, a_lo, a_hi, b_lo, b_hi)))
+            else:
+                # the anchors split the region into independent regions
+                previous_i, previous_j = a_lo, b_lo
+                for i, j in anchors:
+                    items.append((True, (DiffType.REPLACE.value, previous_i, i, previous_j, j)))
+                    items.append((False, (DiffType.EQUAL.value, i, i + 1, j, j + 1)))
+                    previous_i, previous_j = i + 1, j + 1
+                items.append((True, (DiffType.REPLACE.value, previous_i, a_hi, previous_j, b_hi)))
+
+        if suffix > 0:
+            items.append((False, (DiffType.EQUAL.value, a_hi, a_hi + suffix, b_hi, b_hi + suffix)))
+        stack += reversed(items)
+
+def __anchors(
+    a: Sequence[int],
+    b: Sequence[int],
+    a_lo: int,
+    a_hi: int,
+    b_lo: int,
+    b_hi: int) -> List[Tuple[int, int]]:
+
+    # the longest increasing sequence of the lines which appear exactly once in both of before/after
+    a_counts: Dict[int, int] = {}
+    a_positions: Dict[int, int] = {}
+    for i in range(a_lo, a_hi):
+        a_counts[a[i]] = a_counts.get(a[i], 0) + 1
+        a_positions[a[i]] = i
+    b_counts: Dict[int, int] = {}
+    b_positions: Dict[int, int] = {}
+    for j in range(b_lo, b_hi):
+        if a_counts.get(b[j]) == 1:
+            b_counts[b[j]] = b_counts.get(b[j], 0) + 1
+            b_positions[b[j]] = j
+    uniques = sorted(
+        (a_positions[line], j)
+        for line, j in b_positions.items()
+        if b_counts[line] == 1)
+    return _longest_increasing(uniques)
+
+def __region_opcodes(
+    before_region: Sequence[int],
+    after_region: Sequence[int],
+    before_start: int,
+    after_start: int,
+    algorithm: str) -> List[Tuple[str, int, int, int, int]]:
+
+    if len(before_region) == 0 or len(after_region) == 0:
+        if len(before_region) == 0 and len(after_region) == 0:
+            return []
+        tag = DiffType.INSERT.value if len(before_region) == 0 else DiffType.DELETE.value
+        return [ (tag, before_start, before_start + len(before_region), after_start, after_start + len(after_region)) ]
+    return [
+        (tag, before_start + before_lo, before_start + before_hi, after_start + after_lo, after_start + after_hi)
+        for tag, before_lo, before_hi, after_lo, after_hi in get_opcodes(before_region, after_region, algorithm)
+    ]
@@ -0,0 +1,79 @@
+from collections import OrderedDict
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+
+from differ_for_code import TokenDiff
+
+MAXSIZE = 16384
+
+DiffTokens = Callable[[List[str], List[str]], Tuple[List[TokenDiff], List[TokenDiff]]]
+
+
+class InlineMemoInfo(NamedTuple):
+    hits: int
+    misses: int
+    size: int
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return 0. if lookups == 0 else self.hits / lookups
+
+
+# LRU of the TokenDiffs of LINE_REPLACE line pairs keyed by the tokens of the pair (and the normalizer)
+# one memo can be shared by many differ.diff calls (differ.diff(..., memo=memo)), and the results are the same as without it
+# NOTE: TokenDiff objects are shared by the results, so do not modify them
+class InlineMemo:
+
+    def __init__(self, maxsize: int = MAXSIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.results: 'OrderedDict[Any, Tuple[List[TokenDiff], List[TokenDiff]]]' = OrderedDict()
+
+
+    def lookup(self, key: Any) -> Optional[Tuple[List[TokenDiff], List[TokenDiff]]]:
+        token_diffs = self.results.get(key)
+        if token_diffs is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.results.move_to_end(key)
+        return token_diffs
+
+
+    def store(self, key: Any, token_diffs: Tuple[List[TokenDiff], List[TokenDiff]]):
+        self.results[key] = token_diffs
+        self.results.move_to_end(key)
+        while len(self.results) > self.maxsize:
+            self.results.popitem(last=False)
+
+
+    def memoize(self, diff_tokens: DiffTokens, normalizer: Any = None) -> DiffTokens:
+        # diff_tokens through the memo (normalizer is the one used by diff_tokens)
+        def memoized_diff_tokens(diff_before_tokens: List[str], diff_after_tokens: List[str]) -> Tuple[List[TokenDiff], List[TokenDiff]]:
+            key = InlineMemo.key(diff_before_tokens, diff_after_tokens, normalizer)
+            token_diffs = self.lookup(key)
+            if token_diffs is None:
+                token_diffs = diff_tokens(diff_before_tokens, diff_after_tokens)
+                self.store(key, token_diffs)
+            # the lists are copied because each LineReplace has its own lists
+            return (list(token_diffs[0]), list(token_diffs[1]))
+
+        return memoized_diff_tokens
+
+
+    def memo_info(self) -> InlineMemoInfo:
+        return InlineMemoInfo(self.hits, self.misses, len(self.results))
+
+
+    def clear(self):
+        self.hits = 0
+        self.misses = 0
+        self.results.clear()
+
+
+    @staticmethod
+    def key(diff_before_tokens: List[str], diff_after_tokens: List[str], normalizer: Any = None) -> Any:
+        # the normalizer is compared by identity
+        if normalizer is None:
+            return (tuple(diff_before_tokens), tuple(diff_after_tokens))
+        return (tuple(diff_before_tokens), tuple(diff_after_tokens), normalizer)
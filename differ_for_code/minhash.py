@@ -0,0 +1,167 @@
+import hashlib
+import json
+import random
+from typing import Any, Callable, Dict, Hashable, List, Set, Tuple
+
+from differ_for_code import differ
+
+# hash values are permuted by (a * x + b) mod MERSENNE_PRIME
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+# Index of MinHash signatures with LSH (locality sensitive hashing) bands
+# to find candidates of near-duplicate code without comparing every pair
+# the signature is calculated from the shingles (k consecutive tokens, whitespace tokens are skipped)
+class MinHashIndex:
+
+    def __init__(
+        self,
+        num_perm: int = 128,
+        bands: int = 32,
+        shingle_size: int = 5,
+        seed: int = 1):
+
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be a multiple of bands")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.seed = seed
+
+        generator = random.Random(seed)
+        self.permutations = [
+            (generator.randrange(1, MERSENNE_PRIME), generator.randrange(0, MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+        self.signatures: Dict[Hashable, List[int]] = {}
+        # the order of the addition of each key (the results of search are in this order if tie)
+        self.orders: Dict[Hashable, int] = {}
+        self.next_order = 0
+        # for each band, the rows of the signature -> keys
+        self.buckets: List[Dict[Tuple[int, ...], Set[Hashable]]] = [ {} for _ in range(bands) ]
+
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.signatures
+
+
+    def signature(self, lined_tokens: List[List[str]]) -> List[int]:
+        tokens = [ token for line_tokens in lined_tokens for token in line_tokens if token.strip() != "" ]
+        shingle_count = max(1, len(tokens) - self.shingle_size + 1)
+        hashes = [
+            MinHashIndex.__hash("\x1f".join(tokens[index:index + self.shingle_size]))
+            for index in range(shingle_count)
+        ]
+        return [
+            min((a * value + b) % MERSENNE_PRIME & MAX_HASH for value in hashes)
+            for a, b in self.permutations
+        ]
+
+
+    def add(self, key: Hashable, lined_tokens: List[List[str]]):
+        self.add_signature(key, self.signature(lined_tokens))
+
+
+    def add_signature(self, key: Hashable, signature: List[int]):
+        if key in self.signatures:
+            self.remove(key)
+        self.signatures[key] = signature
+        self.orders[key] = self.next_order
+        self.next_order += 1
+        for band, band_key in enumerate(self.__band_keys(signature)):
+            self.buckets[band].setdefault(band_key, set()).add(key)
+
+
+    def remove(self, key: Hashable):
+        signature = self.signatures.pop(key)
+        del self.orders[key]
+        for band, band_key in enumerate(self.__band_keys(signature)):
+            bucket = self.buckets[band][band_key]
+            bucket.discard(key)
+            if not bucket:
+                del self.buckets[band][band_key]
+
+
+    def query(self, lined_tokens: List[List[str]]) -> Set[Hashable]:
+        # keys which share at least one band with the tokens
+        candidates: Set[Hashable] = set()
+        for band, band_key in enumerate(self.__band_keys(self.signature(lined_tokens))):
+            candidates |= self.buckets[band].get(band_key, set())
+        return candidates
+
+
+    def search(
+        self,
+        lined_tokens: List[List[str]],
+        lookup: Callable[[Hashable], List[List[str]]],
+        threshold: float,
+        **options: Any) -> List[Tuple[Hashable, float]]:
+
+        # verify the candidates by the exact similarity (same as differ.diff(...).get_similarity())
+        # lookup returns the tokens of the key, options are passed to differ
+        # each candidate is diffed once, and not at all if the common characters reject it (see differ.similarity_at_least)
+        profile = differ._profile(lined_tokens) if options.get("normalizer") is None else None
+        res = []
+        for key in self.query(lined_tokens):
+            other_lined_tokens = lookup(key)
+            if profile is not None and differ._upper_bound(profile, differ._profile(other_lined_tokens)) < threshold:
+                continue
+            similarity = differ.similarity(lined_tokens, other_lined_tokens, **options)
+            if similarity >= threshold:
+                res.append((key, similarity))
+        # in descending order of the similarity, and in the order of the addition if tie (the candidates are a set)
+        res.sort(key=lambda item: (-item[1], self.orders[item[0]]))
+        return res
+
+
+    def save(self, path: str):
+        # keys are str, int, float, bool, None or (nested) tuples of them
+        # (JSON has no tuple, so tuples are saved as lists and restored by load)
+        data = {
+            "num_perm": self.num_perm,
+            "bands": self.bands,
+            "shingle_size": self.shingle_size,
+            "seed": self.seed,
+            "signatures": [ [key, signature] for key, signature in self.signatures.items() ],
+        }
+        with open(path, "w") as f:
+            json.dump(data, f)
+
+
+    @staticmethod
+    def load(path: str) -> 'MinHashIndex':
+        with open(path) as f:
+            data = json.load(f)
+        index = MinHashIndex(data["num_perm"], data["bands"], data["shingle_size"], data["seed"])
+        for key, signature in data["signatures"]:
+            index.add_signature(MinHashIndex.__key(key), signature)
+        return index
+
+
+    def __band_keys(self, signature: List[int]) -> List[Tuple[int, ...]]:
+        return [
+            tuple(signature[band * self.rows:(band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+
+
+    @staticmethod
+    def __key(key: Any) -> Hashable:
+        # the key saved by save (lists are tuples)
+        if isinstance(key, list):
+            return tuple(MinHashIndex.__key(item) for item in key)
+        return key
+
+
+    @staticmethod
+    def __hash(shingle: str) -> int:
+        # stable hash (hash() of str is different for each process)
+        return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "little")
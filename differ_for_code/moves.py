@@ -0,0 +1,118 @@
+from typing import Dict, Iterable, List, Tuple
+
+from differ_for_code import BlockMove, BulkReplace, DiffBase, DiffType, LineDiff
+
+# a block has at least this number of non-blank lines to be a move
+MIN_LINES = 3
+# the number of the deleted positions compared for a window of the inserted lines at most
+MAX_CANDIDATES = 8
+
+# rolling hash of the windows of the lines (polynomial hash modulo a Mersenne prime)
+HASH_MODULUS = (1 << 61) - 1
+HASH_BASE = 1000003
+
+
+# Find the blocks of lines which are deleted (DELETE, before of BULK_REPLACE) and inserted (INSERT, after of BULK_REPLACE) elsewhere
+# the windows of min_lines lines of the deleted lines are indexed by a rolling hash,
+# and each window of the inserted lines looks up the index and extends the match, so the cost is near-linear
+# lines are compared as joined strings (same as differ.diff)
+def detect_moves(diffs: Iterable[DiffBase], min_lines: int = MIN_LINES) -> List[BlockMove]:
+    min_lines = max(1, min_lines)
+    deleted: List[Tuple[int, List[str]]] = []
+    inserted: List[Tuple[int, List[str]]] = []
+    for diff in diffs:
+        if type(diff) == LineDiff:
+            if diff.label == DiffType.DELETE:
+                deleted.append((diff.before_line_number, diff.before))
+            elif diff.label == DiffType.INSERT:
+                inserted.append((diff.after_line_number, diff.after))
+        elif type(diff) == BulkReplace:
+            deleted += [ (diff.before_line_start_number + index, line_tokens) for index, line_tokens in enumerate(diff.before) ]
+            inserted += [ (diff.after_line_start_number + index, line_tokens) for index, line_tokens in enumerate(diff.after) ]
+
+    if len(deleted) < min_lines or len(inserted) < min_lines:
+        return []
+
+    deleted_lines = [ "".join(line_tokens) for _, line_tokens in deleted ]
+    inserted_lines = [ "".join(line_tokens) for _, line_tokens in inserted ]
+    # end (exclusive) of the run of consecutive line numbers which contains each position
+    deleted_run_ends = __run_ends([ line_number for line_number, _ in deleted ])
+    inserted_run_ends = __run_ends([ line_number for line_number, _ in inserted ])
+
+    index: Dict[int, List[int]] = {}
+    for position, window_hash in __window_hashes(deleted_lines, deleted_run_ends, min_lines):
+        index.setdefault(window_hash, []).append(position)
+
+    used = bytearray(len(deleted))
+    inserted_hashes = dict(__window_hashes(inserted_lines, inserted_run_ends, min_lines))
+    moves = []
+    position = 0
+    while position < len(inserted):
+        candidates = index.get(inserted_hashes.get(position, -1))
+        if candidates is None:
+            position += 1
+            continue
+
+        # the longest match among the candidates
+        best_start = -1
+        best_length = 0
+        compared = 0
+        for start in candidates:
+            if used[start]:
+                continue
+            compared += 1
+            if compared > MAX_CANDIDATES:
+                break
+            length = 0
+            while (start + length < deleted_run_ends[start]
+                and position + length < inserted_run_ends[position]
+                and not used[start + length]
+                and deleted_lines[start + length] == inserted_lines[position + length]):
+                length += 1
+            if length > best_length:
+                best_start = start
+                best_length = length
+
+        non_blank = sum(1 for line in inserted_lines[position:position + best_length] if line.strip() != "")
+        if best_length < min_lines or non_blank < min_lines:
+            position += 1
+            continue
+
+        moves.append(BlockMove(
+            [ line_tokens for _, line_tokens in deleted[best_start:best_start + best_length] ],
+            [ line_tokens for _, line_tokens in inserted[position:position + best_length] ],
+            deleted[best_start][0],
+            inserted[position][0]))
+        for used_position in range(best_start, best_start + best_length):
+            used[used_position] = 1
+        position += best_length
+
+    return moves
+
+
+def __run_ends(line_numbers: List[int]) -> List[int]:
+    run_ends = [ 0 ] * len(line_numbers)
+    end = len(line_numbers)
+    for position in range(len(line_numbers) - 1, -1, -1):
+        if position + 1 < len(line_numbers) and line_numbers[position + 1] != line_numbers[position] + 1:
+            end = position + 1
+        run_ends[position] = end
+    return run_ends
+
+def __window_hashes(lines: List[str], run_ends: List[int], window: int) -> Iterable[Tuple[int, int]]:
+    # (start position, hash) of each window of the lines inside a run
+    top = pow(HASH_BASE, window - 1, HASH_MODULUS)
+    line_hashes = [ hash(line) % HASH_MODULUS for line in lines ]
+    position = 0
+    while position < len(lines):
+        run_end = run_ends[position]
+        if run_end - position >= window:
+            window_hash = 0
+            for line_hash in line_hashes[position:position + window]:
+                window_hash = (window_hash * HASH_BASE + line_hash) % HASH_MODULUS
+            yield (position, window_hash)
+            for start in range(position + 1, run_end - window + 1):
+                window_hash = (window_hash - line_hashes[start - 1] * top) % HASH_MODULUS
+                window_hash = (window_hash * HASH_BASE + line_hashes[start + window - 1]) % HASH_MODULUS
+                yield (start, window_hash)
+        position = run_end
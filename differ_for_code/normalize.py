@@ -0,0 +1,211 @@
+import keyword
+import re
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from differ_for_code import DiffType, TokenDiff
+
+# keywords of Python and C-like languages, which are not canonicalized as identifiers
+KEYWORDS = frozenset(keyword.kwlist + keyword.softkwlist + [
+    "auto", "bool", "boolean", "break", "byte", "case", "catch", "char", "class", "const", "continue", "default",
+    "delete", "do", "double", "else", "enum", "export", "extends", "extern", "false", "final", "finally", "float",
+    "for", "fn", "func", "function", "goto", "if", "implements", "import", "inline", "instanceof", "int", "interface",
+    "let", "long", "new", "null", "nullptr", "package", "private", "protected", "public", "register", "return",
+    "short", "signed", "sizeof", "static", "struct", "super", "switch", "template", "this", "throw", "throws",
+    "true", "try", "typedef", "typeof", "union", "unsigned", "using", "var", "virtual", "void", "volatile", "while",
+])
+
+NUMBER_PATTERN = re.compile(r"(?:\d|\.\d)[\w.'+-]*")
+STRING_PATTERN = re.compile(r"(?:[rRbBuUfFL]{1,2}|u8)?['\"`]")
+
+# keys of the canonicalized tokens
+IDENTIFIER_KEY = "<id>"
+NUMBER_KEY = "<num>"
+STRING_KEY = "<str>"
+
+# separator of the token keys in a line key
+SEPARATOR = "\0"
+
+# partner of a token which is not compared (and not paired yet) / which is DELETE or INSERT
+IGNORED = -1
+CHANGED = -2
+
+
+# Normalize the tokens before matching (differ.diff(..., normalizer=Normalizer()))
+# ignore_whitespace: whitespace (and empty) tokens are not compared, e.g. indentation-only changes are EQUAL
+# identifiers: identifiers (except keywords) are compared as the same token
+# literals: numbers are compared as the same token, and strings are too
+# casefold: tokens are compared case-insensitively
+# the key of each token is computed once and memoized, and the TokenDiffs refer to the original tokens and columns
+# EQUAL lines and tokens keep the original tokens of both before/after, which can be different
+class Normalizer:
+
+    def __init__(
+        self,
+        ignore_whitespace: bool = True,
+        identifiers: bool = False,
+        literals: bool = False,
+        casefold: bool = False,
+        keywords: Iterable[str] = KEYWORDS):
+
+        self.ignore_whitespace = ignore_whitespace
+        self.identifiers = identifiers
+        self.literals = literals
+        self.casefold = casefold
+        self.keywords = frozenset(keywords)
+        # token -> key (None if the token is ignored)
+        self.keys: Dict[str, Optional[str]] = {}
+
+
+    def __repr__(self) -> str:
+        # used by cache.DiffCache.key, so it depends only on the options
+        keywords = "" if self.keywords == KEYWORDS else f", keywords={sorted(self.keywords)}"
+        return (f"Normalizer(ignore_whitespace={self.ignore_whitespace}, identifiers={self.identifiers}, "
+            f"literals={self.literals}, casefold={self.casefold}{keywords})")
+
+
+    def key(self, token: str) -> Optional[str]:
+        if token in self.keys:
+            return self.keys[token]
+
+        key: Optional[str] = token
+        if token.strip() == "":
+            key = None if self.ignore_whitespace else token
+        elif self.literals and STRING_PATTERN.match(token):
+            key = STRING_KEY
+        elif self.literals and NUMBER_PATTERN.fullmatch(token):
+            key = NUMBER_KEY
+        elif self.identifiers and token.isidentifier() and token not in self.keywords:
+            key = IDENTIFIER_KEY
+        elif self.casefold:
+            key = token.casefold()
+        self.keys[token] = key
+        return key
+
+
+    def normalize_line(self, line_tokens: Sequence[str]) -> Tuple[List[str], List[int]]:
+        # (keys of the compared tokens, positions of them in the line)
+        keys = []
+        positions = []
+        for position, token in enumerate(line_tokens):
+            key = self.keys[token] if token in self.keys else self.key(token)
+            if key is not None:
+                keys.append(key)
+                positions.append(position)
+        return (keys, positions)
+
+
+    def line_key(self, line_tokens: Sequence[str]) -> str:
+        # lines are matched by the keys of the compared tokens
+        keys, _ = self.normalize_line(line_tokens)
+        return SEPARATOR.join(keys)
+
+
+    def inline_opcodes(self, diff_before_tokens: List[str], diff_after_tokens: List[str]) -> List[Tuple[str, int, int, int, int]]:
+        # opcodes of the keys (positions are in the compared tokens)
+        before_keys, _ = self.normalize_line(diff_before_tokens)
+        after_keys, _ = self.normalize_line(diff_after_tokens)
+        return SequenceMatcher(None, before_keys, after_keys).get_opcodes()
+
+
+    def diff_tokens(
+        self,
+        diff_before_tokens: List[str],
+        diff_after_tokens: List[str],
+        inline_diff_results: List[Tuple[str, int, int, int, int]]) -> Tuple[List[TokenDiff], List[TokenDiff]]:
+
+        before_partners, after_partners = self.__partners(diff_before_tokens, diff_after_tokens, inline_diff_results)
+        before_line_token_diffs = self.__token_diffs(diff_before_tokens, diff_after_tokens, before_partners, True)
+        after_line_token_diffs = self.__token_diffs(diff_after_tokens, diff_before_tokens, after_partners, False)
+        return (before_line_token_diffs, after_line_token_diffs)
+
+
+    def count_line_replace_distance(
+        self,
+        diff_before_tokens: List[str],
+        diff_after_tokens: List[str],
+        inline_diff_results: List[Tuple[str, int, int, int, int]]) -> int:
+
+        # same as the DELETE/INSERT tokens of diff_tokens
+        before_partners, after_partners = self.__partners(diff_before_tokens, diff_after_tokens, inline_diff_results)
+        distance = sum(len(token) for token, partner in zip(diff_before_tokens, before_partners) if partner == CHANGED)
+        distance += sum(len(token) for token, partner in zip(diff_after_tokens, after_partners) if partner == CHANGED)
+        return distance
+
+
+    def __partners(
+        self,
+        diff_before_tokens: List[str],
+        diff_after_tokens: List[str],
+        inline_diff_results: List[Tuple[str, int, int, int, int]]) -> Tuple[List[int], List[int]]:
+
+        # position of the EQUAL token of the other side for each token, CHANGED if the token is DELETE/INSERT
+        # the tokens which are not compared are paired in order with those of the other side between the same EQUAL tokens
+        # (e.g. the whitespace around a changed token), and the rest of them is DELETE/INSERT
+        _, before_positions = self.normalize_line(diff_before_tokens)
+        _, after_positions = self.normalize_line(diff_after_tokens)
+        before_partners = [ IGNORED ] * len(diff_before_tokens)
+        after_partners = [ IGNORED ] * len(diff_after_tokens)
+        for tag, before_start, before_end, after_start, after_end in inline_diff_results:
+            if tag == DiffType.EQUAL.value:
+                for before_position, after_position in zip(before_positions[before_start:before_end], after_positions[after_start:after_end]):
+                    before_partners[before_position] = after_position
+                    after_partners[after_position] = before_position
+            else:
+                for before_position in before_positions[before_start:before_end]:
+                    before_partners[before_position] = CHANGED
+                for after_position in after_positions[after_start:after_end]:
+                    after_partners[after_position] = CHANGED
+
+        before_ignored: List[int] = []
+        after_ignored: List[int] = []
+        after_position = 0
+        for before_position in range(len(diff_before_tokens) + 1):
+            before_partner = before_partners[before_position] if before_position < len(diff_before_tokens) else len(diff_after_tokens)
+            if before_partner == IGNORED:
+                before_ignored.append(before_position)
+                continue
+            elif before_partner == CHANGED:
+                continue
+            # an EQUAL token (or the end): pair the ignored tokens since the last EQUAL token
+            while after_position < before_partner:
+                if after_partners[after_position] == IGNORED:
+                    after_ignored.append(after_position)
+                after_position += 1
+            after_position += 1
+            for before_ignored_position, after_ignored_position in zip(before_ignored, after_ignored):
+                before_partners[before_ignored_position] = after_ignored_position
+                after_partners[after_ignored_position] = before_ignored_position
+            for before_ignored_position in before_ignored[len(after_ignored):]:
+                before_partners[before_ignored_position] = CHANGED
+            for after_ignored_position in after_ignored[len(before_ignored):]:
+                after_partners[after_ignored_position] = CHANGED
+            before_ignored.clear()
+            after_ignored.clear()
+        return (before_partners, after_partners)
+
+
+    def __token_diffs(self, tokens: List[str], other_tokens: List[str], partners: List[int], is_before: bool) -> List[TokenDiff]:
+        # columns of the EQUAL tokens are the original columns of both sides
+        # (the paired tokens which are not compared are EQUAL too, and they can be different, e.g. indentation)
+        other_columns = [ 0 ]
+        for other_token in other_tokens:
+            other_columns.append(other_columns[-1] + len(other_token))
+
+        res = []
+        column = 0
+        other_column = 0
+        for token, partner in zip(tokens, partners):
+            if partner >= 0:
+                other_column = other_columns[partner]
+                if is_before:
+                    res.append(TokenDiff(DiffType.EQUAL, token, other_tokens[partner], column, other_column))
+                else:
+                    res.append(TokenDiff(DiffType.EQUAL, other_tokens[partner], token, other_column, column))
+                other_column = other_columns[partner + 1]
+            elif is_before:
+                res.append(TokenDiff.delete_token(token, column, other_column))
+            else:
+                res.append(TokenDiff.insert_token(token, other_column, column))
+            column += len(token)
+        return res
@@ -0,0 +1,164 @@
+import html
+from typing import Iterable, List, Optional, TextIO
+
+from colorama import Style
+
+from differ_for_code import (BulkReplace, DiffBase, DiffType, LineDiff,
+                             LineReplace, visualizer)
+
+FORMATS = ("ansi", "plain", "html")
+
+# styles of the text (same as visualizer.print_*)
+NORMAL = "normal"
+INSERT = "insert"
+DELETE = "delete"
+REPLACE = "replace"
+
+NEWLINE = "\n"
+
+# HTML document around the rendered diffs
+HTML_HEADER = """<pre class="differ-for-code">"""
+HTML_FOOTER = """</pre>"""
+HTML_STYLE = """<style>
+.differ-for-code .insert { background-color: #acf2bd; }
+.differ-for-code .delete { background-color: #fdb8c0; }
+.differ-for-code .replace { background-color: #a5d6ff; }
+</style>"""
+
+
+# Render diffs into a buffer, and write it to the stream when the buffer is full
+# consecutive text of the same style is merged into one span
+class Renderer:
+
+    def __init__(
+        self,
+        stream: Optional[TextIO] = None,
+        format: str = "ansi",
+        buffer_size: int = 1 << 16):
+
+        if format not in FORMATS:
+            raise ValueError(f"unknown format: {format}")
+
+        self.stream = stream
+        self.format = format
+        self.buffer_size = buffer_size
+        self.buffer: List[str] = []
+        self.buffer_length = 0
+        # text of the current span
+        self.span: List[str] = []
+        self.span_style = NORMAL
+        # whole output if there is no stream
+        self.output: List[str] = []
+
+        if format == "html":
+            self.__append(HTML_STYLE + NEWLINE + HTML_HEADER)
+
+
+    def render(self, diffs: Iterable[DiffBase]):
+        for diff in diffs:
+            if type(diff) == BulkReplace:
+                self.write(NEWLINE.join([ "".join(line_tokens) for line_tokens in diff.before ]), DELETE)
+                self.write(NEWLINE, NORMAL)
+                self.write(NEWLINE.join([ "".join(line_tokens) for line_tokens in diff.after ]), INSERT)
+                self.write(NEWLINE, NORMAL)
+            elif type(diff) == LineDiff:
+                if diff.label == DiffType.INSERT:
+                    self.write("".join(diff.after), INSERT)
+                elif diff.label == DiffType.DELETE:
+                    self.write("".join(diff.before), DELETE)
+                else:
+                    self.write("".join(diff.before), NORMAL)
+                self.write(NEWLINE, NORMAL)
+            elif type(diff) == LineReplace:
+                for token_diff in diff.before:
+                    self.write(token_diff.before, REPLACE if token_diff.label == DiffType.DELETE else DELETE)
+                self.write(NEWLINE, NORMAL)
+                for token_diff in diff.after:
+                    self.write(token_diff.after, REPLACE if token_diff.label == DiffType.INSERT else INSERT)
+                self.write(NEWLINE, NORMAL)
+            else:
+                raise Exception("unknown diff type")
+
+
+    def write(self, text: str, style: str):
+        if text == "":
+            return
+        # newlines are never styled (the style is applied to each line)
+        lines = text.split(NEWLINE)
+        for index, line in enumerate(lines):
+            if index > 0:
+                self.__write_span(NEWLINE, NORMAL)
+            if line != "":
+                self.__write_span(line, style)
+
+
+    def close(self) -> Optional[str]:
+        # write the rest, and return the whole output if there is no stream
+        self.__flush_span()
+        if self.format == "html":
+            self.__append(HTML_FOOTER + NEWLINE)
+        self.__flush_buffer()
+        if self.stream is not None:
+            self.stream.flush()
+            return None
+        return "".join(self.output)
+
+
+    def __write_span(self, text: str, style: str):
+        if style != self.span_style:
+            self.__flush_span()
+            self.span_style = style
+        self.span.append(text)
+
+
+    def __flush_span(self):
+        if not self.span:
+            return
+        text = "".join(self.span)
+        self.span = []
+
+        if self.format == "plain":
+            content = text
+        elif self.format == "html":
+            content = html.escape(text)
+            if self.span_style != NORMAL:
+                content = f'<span class="{self.span_style}">{content}</span>'
+        else:
+            color = {
+                INSERT: visualizer.INSERT_COLOR,
+                DELETE: visualizer.DELETE_COLOR,
+                REPLACE: visualizer.REPLACE_COLOR,
+            }.get(self.span_style)
+            content = text if color is None else color + text + Style.RESET_ALL
+
+        self.__append(content)
+
+
+    def __append(self, content: str):
+        self.buffer.append(content)
+        self.buffer_length += len(content)
+        if self.buffer_length >= self.buffer_size:
+            self.__flush_buffer()
+
+
+    def __flush_buffer(self):
+        if not self.buffer:
+            return
+        text = "".join(self.buffer)
+        self.buffer = []
+        self.buffer_length = 0
+        if self.stream is None:
+            self.output.append(text)
+        else:
+            self.stream.write(text)
+
+
+# Render diffs in the format, into the stream (returns None) or a string (returns the string)
+def render(
+    diffs: Iterable[DiffBase],
+    stream: Optional[TextIO] = None,
+    format: str = "ansi") -> Optional[str]:
+
+    renderer = Renderer(stream, format)
+    renderer.render(diffs)
+    return renderer.close()
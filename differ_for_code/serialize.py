@@ -0,0 +1,431 @@
+import json
+import mmap
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from differ_for_code import (BlockMove, BulkReplace, DiffBase, DiffResult,
+                             DiffType, LineDiff, LineReplace, TokenDiff)
+
+FORMATS = ("binary", "jsonl")
+
+# label <-> byte
+LABELS = list(DiffType)
+LABEL_CODES = { label: code for code, label in enumerate(LABELS) }
+
+# binary format
+# a file is a sequence of records, and a record is (varint length, record bytes)
+# record:
+#   varint the number of tokens, and each token (varint length, utf-8 bytes)
+#   byte contain_bulk_replace
+#   varint the number of diffs, and each diff
+#     byte label
+#     varint zigzag line numbers of before/after (start numbers if BULK_REPLACE), delta from the previous diff
+#     LineDiff: byte flag (bit 0: before exists, bit 1: after exists, bit 2: after is the same as before) and the lines
+#     BulkReplace: varint the number of lines and the lines of before, then after
+#     LineReplace: varint the number of TokenDiffs and the TokenDiffs of before, then after
+#   (only if DiffResult.moves) varint the number of moves, and each move
+#     varint start line numbers of before/after, varint the number of lines and the lines of before, then after
+#   line: varint the number of tokens, and varint index of each token in the token table
+#   TokenDiff: byte label, varint (index + 1) of before/after token (0 if None),
+#              varint zigzag start columns of before/after, delta from the end columns of the previous TokenDiff
+
+
+# Serialize DiffResult into bytes (one record)
+def dumps(result: DiffResult, format: str = "binary") -> bytes:
+    if format == "binary":
+        return __encode_binary(result)
+    elif format == "jsonl":
+        # lone surrogates (e.g. tokens of broken files) are kept, same as the binary format
+        return json.dumps(to_json(result), ensure_ascii=False, separators=(",", ":")).encode("utf-8", "surrogatepass")
+    else:
+        raise ValueError(f"unknown format: {format}")
+
+
+# Deserialize DiffResult from bytes of one record
+def loads(data: bytes, format: str = "binary") -> DiffResult:
+    if format == "binary":
+        return __decode_binary(memoryview(data))
+    elif format == "jsonl":
+        return from_json(json.loads(bytes(data).decode("utf-8", "surrogatepass")))
+    else:
+        raise ValueError(f"unknown format: {format}")
+
+
+# Append DiffResult to the file as one record
+def dump(result: DiffResult, fp: BinaryIO, format: str = "binary"):
+    data = dumps(result, format)
+    if format == "binary":
+        length = bytearray()
+        _write_varint(length, len(data))
+        fp.write(bytes(length))
+        fp.write(data)
+    else:
+        fp.write(data)
+        fp.write(b"\n")
+
+
+# Read one record from the current position of the file (None at the end of the file)
+def load(fp: BinaryIO, format: str = "binary") -> Optional[DiffResult]:
+    if format == "binary":
+        length = 0
+        shift = 0
+        while True:
+            byte = fp.read(1)
+            if not byte:
+                if shift == 0:
+                    return None
+                raise ValueError("unexpected end of file")
+            length |= (byte[0] & 0x7f) << shift
+            shift += 7
+            if byte[0] < 0x80:
+                break
+        data = fp.read(length)
+        if len(data) != length:
+            raise ValueError("unexpected end of file")
+        return loads(data, format)
+    else:
+        line = fp.readline()
+        if not line:
+            return None
+        return loads(line, format)
+
+
+# Read all records of the file
+def load_all(fp: BinaryIO, format: str = "binary") -> Iterator[DiffResult]:
+    while True:
+        result = load(fp, format)
+        if result is None:
+            return
+        yield result
+
+
+# Read records of the file lazily with mmap
+# only the positions of the records are scanned when opened, and each record is decoded when it is accessed
+class DiffArchive:
+
+    def __init__(self, path: str, format: str = "binary"):
+        if format not in FORMATS:
+            raise ValueError(f"unknown format: {format}")
+        self.format = format
+        self.file = open(path, "rb")
+        self.mmap: Optional[mmap.mmap] = None
+        # (start, end) of each record
+        self.offsets: List[Tuple[int, int]] = []
+
+        size = self.file.seek(0, 2)
+        if size == 0:
+            return
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        position = 0
+        while position < size:
+            if format == "binary":
+                length, position = _read_varint(self.mmap, position)
+                self.offsets.append((position, position + length))
+                position += length
+            else:
+                end = self.mmap.find(b"\n", position)
+                if end < 0:
+                    end = size
+                self.offsets.append((position, end))
+                position = end + 1
+
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+
+    def __getitem__(self, index: int) -> DiffResult:
+        start, end = self.offsets[index]
+        return loads(self.mmap[start:end], self.format)
+
+
+    def __iter__(self) -> Iterator[DiffResult]:
+        for index in range(len(self)):
+            yield self[index]
+
+
+    def __enter__(self) -> 'DiffArchive':
+        return self
+
+
+    def __exit__(self, *args: Any):
+        self.close()
+
+
+    def close(self):
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        self.file.close()
+
+
+def _write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _read_varint(data: Any, position: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            return (value, position)
+
+def __zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+def __unzigzag(value: int) -> int:
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+
+def __encode_binary(result: DiffResult) -> bytes:
+    token_indexes: Dict[str, int] = {}
+    body = bytearray()
+
+    def write_line(line_tokens: List[str]):
+        _write_varint(body, len(line_tokens))
+        for token in line_tokens:
+            index = token_indexes.get(token)
+            if index is None:
+                index = len(token_indexes)
+                token_indexes[token] = index
+            _write_varint(body, index)
+
+    def write_token_ref(token: Optional[str]):
+        if token is None:
+            _write_varint(body, 0)
+        else:
+            index = token_indexes.get(token)
+            if index is None:
+                index = len(token_indexes)
+                token_indexes[token] = index
+            _write_varint(body, index + 1)
+
+    def write_token_diffs(token_diffs: List[TokenDiff]):
+        _write_varint(body, len(token_diffs))
+        before_column_number = 0
+        after_column_number = 0
+        for token_diff in token_diffs:
+            body.append(LABEL_CODES[token_diff.label])
+            write_token_ref(token_diff.before)
+            write_token_ref(token_diff.after)
+            _write_varint(body, __zigzag(token_diff.before_column_start_number - before_column_number))
+            _write_varint(body, __zigzag(token_diff.after_column_start_number - after_column_number))
+            before_column_number = token_diff.before_column_end_number
+            after_column_number = token_diff.after_column_end_number
+
+    body.append(1 if result.contain_bulk_replace else 0)
+    _write_varint(body, len(result.diffs))
+    before_line_number = 0
+    after_line_number = 0
+    for diff in result.diffs:
+        body.append(LABEL_CODES[diff.label])
+        if type(diff) == BulkReplace:
+            current_before_line_number = diff.before_line_start_number
+            current_after_line_number = diff.after_line_start_number
+        else:
+            current_before_line_number = diff.before_line_number
+            current_after_line_number = diff.after_line_number
+        _write_varint(body, __zigzag(current_before_line_number - before_line_number))
+        _write_varint(body, __zigzag(current_after_line_number - after_line_number))
+        before_line_number = current_before_line_number
+        after_line_number = current_after_line_number
+
+        if type(diff) == LineDiff:
+            flag = (1 if diff.before is not None else 0) | (2 if diff.after is not None else 0)
+            if diff.before is not None and diff.after == diff.before:
+                flag |= 4
+            body.append(flag)
+            if diff.before is not None:
+                write_line(diff.before)
+            if diff.after is not None and not flag & 4:
+                write_line(diff.after)
+        elif type(diff) == BulkReplace:
+            for lined_tokens in [ diff.before, diff.after ]:
+                _write_varint(body, len(lined_tokens))
+                for line_tokens in lined_tokens:
+                    write_line(line_tokens)
+        elif type(diff) == LineReplace:
+            write_token_diffs(diff.before)
+            write_token_diffs(diff.after)
+        else:
+            raise Exception("unknown diff type")
+
+    # moves are written only if there are, so that the records without moves are the same as before
+    if result.moves:
+        _write_varint(body, len(result.moves))
+        for move in result.moves:
+            _write_varint(body, move.before_line_start_number)
+            _write_varint(body, move.after_line_start_number)
+            for lined_tokens in [ move.before, move.after ]:
+                _write_varint(body, len(lined_tokens))
+                for line_tokens in lined_tokens:
+                    write_line(line_tokens)
+
+    header = bytearray()
+    _write_varint(header, len(token_indexes))
+    for token in token_indexes:
+        token_bytes = token.encode("utf-8", "surrogatepass")
+        _write_varint(header, len(token_bytes))
+        header += token_bytes
+    return bytes(header + body)
+
+def __decode_binary(data: memoryview) -> DiffResult:
+    position = 0
+
+    def read_varint() -> int:
+        nonlocal position
+        value, position = _read_varint(data, position)
+        return value
+
+    def read_byte() -> int:
+        nonlocal position
+        position += 1
+        return data[position - 1]
+
+    tokens = []
+    for _ in range(read_varint()):
+        length = read_varint()
+        tokens.append(str(data[position:position + length], "utf-8", "surrogatepass"))
+        position += length
+
+    def read_line() -> List[str]:
+        return [ tokens[read_varint()] for _ in range(read_varint()) ]
+
+    def read_token_ref() -> Optional[str]:
+        index = read_varint()
+        return None if index == 0 else tokens[index - 1]
+
+    def read_token_diffs() -> List[TokenDiff]:
+        token_diffs = []
+        before_column_number = 0
+        after_column_number = 0
+        for _ in range(read_varint()):
+            label = LABELS[read_byte()]
+            before_token = read_token_ref()
+            after_token = read_token_ref()
+            before_column_number += __unzigzag(read_varint())
+            after_column_number += __unzigzag(read_varint())
+            token_diff = TokenDiff(label, before_token, after_token, before_column_number, after_column_number)
+            token_diffs.append(token_diff)
+            before_column_number = token_diff.before_column_end_number
+            after_column_number = token_diff.after_column_end_number
+        return token_diffs
+
+    contain_bulk_replace = read_byte() == 1
+    diffs: List[DiffBase] = []
+    before_line_number = 0
+    after_line_number = 0
+    for _ in range(read_varint()):
+        label = LABELS[read_byte()]
+        before_line_number += __unzigzag(read_varint())
+        after_line_number += __unzigzag(read_varint())
+
+        if label == DiffType.BULK_REPLACE:
+            before_lined_tokens = [ read_line() for _ in range(read_varint()) ]
+            after_lined_tokens = [ read_line() for _ in range(read_varint()) ]
+            diffs.append(BulkReplace(before_lined_tokens, after_lined_tokens, before_line_number, after_line_number))
+        elif label == DiffType.LINE_REPLACE:
+            before_line_token_diffs = read_token_diffs()
+            after_line_token_diffs = read_token_diffs()
+            diffs.append(LineReplace(before_line_token_diffs, after_line_token_diffs, before_line_number, after_line_number))
+        else:
+            flag = read_byte()
+            before_line_tokens = read_line() if flag & 1 else None
+            if flag & 4:
+                after_line_tokens = before_line_tokens
+            else:
+                after_line_tokens = read_line() if flag & 2 else None
+            diffs.append(LineDiff(label, before_line_tokens, after_line_tokens, before_line_number, after_line_number))
+
+    result = DiffResult(diffs, contain_bulk_replace)
+    if position < len(data):
+        for _ in range(read_varint()):
+            before_line_start_number = read_varint()
+            after_line_start_number = read_varint()
+            before_lined_tokens = [ read_line() for _ in range(read_varint()) ]
+            after_lined_tokens = [ read_line() for _ in range(read_varint()) ]
+            result.moves.append(BlockMove(before_lined_tokens, after_lined_tokens, before_line_start_number, after_line_start_number))
+    return result
+
+
+# DiffResult <-> JSON object of the jsonl format
+def to_json(result: DiffResult) -> Dict[str, Any]:
+    diffs = []
+    for diff in result.diffs:
+        if type(diff) == LineDiff:
+            diffs.append({
+                "label": diff.label.value,
+                "before_line_number": diff.before_line_number,
+                "after_line_number": diff.after_line_number,
+                "before": diff.before,
+                "after": diff.after,
+            })
+        elif type(diff) == BulkReplace:
+            diffs.append({
+                "label": diff.label.value,
+                "before_line_start_number": diff.before_line_start_number,
+                "after_line_start_number": diff.after_line_start_number,
+                "before": diff.before,
+                "after": diff.after,
+            })
+        elif type(diff) == LineReplace:
+            diffs.append({
+                "label": diff.label.value,
+                "before_line_number": diff.before_line_number,
+                "after_line_number": diff.after_line_number,
+                # [ label, before token, after token, before start column, after start column ]
+                "before": [ __token_diff_to_json(token_diff) for token_diff in diff.before ],
+                "after": [ __token_diff_to_json(token_diff) for token_diff in diff.after ],
+            })
+        else:
+            raise Exception("unknown diff type")
+    data = {
+        "contain_bulk_replace": result.contain_bulk_replace,
+        "diffs": diffs,
+    }
+    if result.moves:
+        data["moves"] = [
+            {
+                "before_line_start_number": move.before_line_start_number,
+                "after_line_start_number": move.after_line_start_number,
+                "before": move.before,
+                "after": move.after,
+            }
+            for move in result.moves
+        ]
+    return data
+
+def __token_diff_to_json(token_diff: TokenDiff) -> List[Any]:
+    return [
+        token_diff.label.value,
+        token_diff.before,
+        token_diff.after,
+        token_diff.before_column_start_number,
+        token_diff.after_column_start_number,
+    ]
+
+def from_json(data: Dict[str, Any]) -> DiffResult:
+    diffs: List[DiffBase] = []
+    for item in data["diffs"]:
+        label = DiffType(item["label"])
+        if label == DiffType.BULK_REPLACE:
+            diffs.append(BulkReplace(item["before"], item["after"], item["before_line_start_number"], item["after_line_start_number"]))
+        elif label == DiffType.LINE_REPLACE:
+            diffs.append(LineReplace(
+                [ TokenDiff(DiffType(values[0]), *values[1:]) for values in item["before"] ],
+                [ TokenDiff(DiffType(values[0]), *values[1:]) for values in item["after"] ],
+                item["before_line_number"],
+                item["after_line_number"]))
+        else:
+            diffs.append(LineDiff(label, item["before"], item["after"], item["before_line_number"], item["after_line_number"]))
+    result = DiffResult(diffs, data["contain_bulk_replace"])
+    result.moves = [
+        BlockMove(item["before"], item["after"], item["before_line_start_number"], item["after_line_start_number"])
+        for item in data.get("moves", [])
+    ]
+    return result
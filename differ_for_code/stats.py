@@ -0,0 +1,72 @@
+from typing import Any, Callable, Dict, List
+
+# phases of differ.diff
+# encode: joining (or encoding) the lines
+# line_match: matching the lines
+# inline_match: matching the tokens of LINE_REPLACE lines
+# build: building the diff objects
+# score: get_distance/get_similarity
+PHASES = ("encode", "line_match", "inline_match", "build", "score")
+
+
+# Statistics of a diff (differ.diff(..., stats=True))
+class DiffStats:
+
+    def __init__(self):
+        self.phase_seconds: Dict[str, float] = {}
+        # the number of the line opcodes for each label (DiffType value)
+        self.opcode_counts: Dict[str, int] = {}
+        self.inline_matcher_calls = 0
+        # the number of the line pairs found in the InlineMemo (differ.diff(..., memo=...))
+        self.inline_memo_hits = 0
+        # the number of tokens given to the inline matcher (before + after)
+        self.tokens_compared = 0
+        # the number of LineDiff/BulkReplace/LineReplace/TokenDiff objects
+        self.objects_allocated = 0
+
+
+    def __repr__(self) -> str:
+        return f"DiffStats({self.to_dict()})"
+
+
+    def copy(self) -> 'DiffStats':
+        res = DiffStats()
+        res.phase_seconds = dict(self.phase_seconds)
+        res.opcode_counts = dict(self.opcode_counts)
+        res.inline_matcher_calls = self.inline_matcher_calls
+        res.inline_memo_hits = self.inline_memo_hits
+        res.tokens_compared = self.tokens_compared
+        res.objects_allocated = self.objects_allocated
+        return res
+
+
+    def add_phase(self, phase: str, seconds: float):
+        self.phase_seconds[phase] = self.phase_seconds.get(phase, 0.) + seconds
+
+
+    def count_opcode(self, label: str):
+        self.opcode_counts[label] = self.opcode_counts.get(label, 0) + 1
+
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "phase_seconds": dict(self.phase_seconds),
+            "opcode_counts": dict(self.opcode_counts),
+            "inline_matcher_calls": self.inline_matcher_calls,
+            "inline_memo_hits": self.inline_memo_hits,
+            "tokens_compared": self.tokens_compared,
+            "objects_allocated": self.objects_allocated,
+        }
+
+
+# callbacks which are called with DiffStats when differ.diff finishes (after the first score phase)
+# differ.diff collects the statistics if at least one hook is added (even if stats=False)
+# the hooks get a copy of DiffResult.stats, which keeps counting the later score phases
+# NOTE: the hits of cache.DiffCache do not call the hooks because no diff is calculated (see DiffCache.cache_info)
+HOOKS: List[Callable[[DiffStats], None]] = []
+
+def add_hook(hook: Callable[[DiffStats], None]):
+    HOOKS.append(hook)
+
+def remove_hook(hook: Callable[[DiffStats], None]):
+    HOOKS.remove(hook)
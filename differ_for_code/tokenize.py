@@ -0,0 +1,204 @@
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+# Tokenizer of source code into the input of differ.diff (a list of tokens for each line)
+# whitespace is kept as tokens, so "".join(line_tokens) is the line and the columns of TokenDiff are correct
+# a token over multiple lines (e.g. triple-quoted string, block comment) is split at the newlines
+
+# one alternative per kind of token, the first match wins
+# every character is matched by the last alternative, so no character is dropped
+PYTHON_PATTERN = re.compile(r"""
+    \n
+    | [^\S\n]+
+    | \#[^\n]*
+    | (?:[rRbBuUfF]{1,2})?(?:'''(?:\\.|[^\\])*?'''|\"\"\"(?:\\.|[^\\])*?\"\"\")
+    | (?:[rRbBuUfF]{1,2})?(?:'(?:\\.|[^\\'\n])*'|"(?:\\.|[^\\"\n])*")
+    | 0[xX][0-9a-fA-F_]+ | 0[bB][01_]+ | 0[oO][0-7_]+
+    | (?:\d[\d_]*\.?[\d_]*|\.\d[\d_]*)(?:[eE][+-]?\d[\d_]*)?[jJ]?
+    | \w+
+    | \*\*= | //= | >>= | <<= | \.\.\. | -> | := | [-+*/%&|^@<>=!]= | \*\* | // | << | >>
+    | .
+    """, re.VERBOSE | re.DOTALL)
+
+# C, C++, Java, JavaScript, C#, Go, ...
+C_PATTERN = re.compile(r"""
+    \n
+    | [^\S\n]+
+    | //[^\n]*
+    | /\*.*?\*/
+    | (?:u8|[LuU])?(?:"(?:\\.|[^\\"\n])*"|'(?:\\.|[^\\'\n])*')
+    | `(?:\\.|[^\\`])*`
+    | (?:0[xX][0-9a-fA-F']+|0[bB][01']+|(?:\d[\d']*\.?[\d']*|\.\d[\d']*)(?:[eE][+-]?\d+)?)[uUlLfF]*
+    | \w+
+    | >>>= | <<= | >>= | >>> | \.\.\. | -> | :: | \+\+ | -- | && | \|\| | [-+*/%&|^<>=!]= | << | >> | => | \?\?
+    | .
+    """, re.VERBOSE | re.DOTALL)
+
+LANGUAGES = {
+    "python": PYTHON_PATTERN,
+    "c": C_PATTERN,
+}
+
+# extension of the file -> language
+EXTENSIONS = {
+    ".py": "python",
+    ".pyi": "python",
+    ".c": "c",
+    ".h": "c",
+    ".cc": "c",
+    ".cpp": "c",
+    ".cxx": "c",
+    ".hpp": "c",
+    ".java": "c",
+    ".js": "c",
+    ".ts": "c",
+    ".cs": "c",
+    ".go": "c",
+    ".rs": "c",
+    ".kt": "c",
+    ".swift": "c",
+}
+
+
+def language_for(path: str, default: str = "python") -> str:
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower(), default)
+
+
+# Split the code into the tokens of each line in one pass
+def tokenize(code: str, language: str = "python") -> List[List[str]]:
+    line_tokens: List[str] = []
+    lined_tokens = [ line_tokens ]
+    for token in __pattern(language).findall(code):
+        if token == "\n":
+            line_tokens = []
+            lined_tokens.append(line_tokens)
+        elif "\n" in token:
+            pieces = token.split("\n")
+            line_tokens.append(pieces[0])
+            for piece in pieces[1:]:
+                line_tokens = [ piece ] if piece != "" else []
+                lined_tokens.append(line_tokens)
+        else:
+            line_tokens.append(token)
+    return lined_tokens
+
+
+# Yield (line number, column number, token) of each token of tokenize()
+def iter_tokens(code: str, language: str = "python") -> Iterator[Tuple[int, int, str]]:
+    for line_number, line_tokens in enumerate(tokenize(code, language)):
+        column_number = 0
+        for token in line_tokens:
+            yield (line_number, column_number, token)
+            column_number += len(token)
+
+
+# Tokenize many codes with a process pool
+# codes in the cache (or the same code in the codes) are not tokenized again
+def tokenize_many(
+    codes: Sequence[str],
+    language: str = "python",
+    workers: Optional[int] = None,
+    cache: Optional['TokenizeCache'] = None,
+    chunk_size: int = 16) -> List[List[List[str]]]:
+
+    __pattern(language)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    results: List[Optional[List[List[str]]]] = [ None ] * len(codes)
+    # key -> indexes of the codes to tokenize
+    misses: Dict[str, List[int]] = OrderedDict()
+    for index, code in enumerate(codes):
+        key = TokenizeCache.key(code, language)
+        lined_tokens = None if cache is None else cache.lookup(key)
+        if lined_tokens is None:
+            misses.setdefault(key, []).append(index)
+        else:
+            results[index] = lined_tokens
+
+    miss_codes = [ codes[indexes[0]] for indexes in misses.values() ]
+    if workers <= 1 or len(miss_codes) <= 1:
+        miss_results = [ tokenize(code, language) for code in miss_codes ]
+    else:
+        with ProcessPoolExecutor(min(workers, len(miss_codes))) as executor:
+            miss_results = list(executor.map(tokenize, miss_codes, [ language ] * len(miss_codes), chunksize=chunk_size))
+
+    for (key, indexes), lined_tokens in zip(misses.items(), miss_results):
+        if cache is not None:
+            cache.store(key, lined_tokens)
+        for index in indexes:
+            results[index] = lined_tokens
+    return results
+
+
+class TokenizeCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    size: int
+
+
+# LRU of tokenize keyed by the hash of the language and the code
+# NOTE: cached token lists are shared by the callers, so do not modify them
+class TokenizeCache:
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.results: 'OrderedDict[str, List[List[str]]]' = OrderedDict()
+
+
+    def tokenize(self, code: str, language: str = "python") -> List[List[str]]:
+        key = TokenizeCache.key(code, language)
+        lined_tokens = self.lookup(key)
+        if lined_tokens is None:
+            lined_tokens = tokenize(code, language)
+            self.store(key, lined_tokens)
+        return lined_tokens
+
+
+    def lookup(self, key: str) -> Optional[List[List[str]]]:
+        lined_tokens = self.results.get(key)
+        if lined_tokens is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.results.move_to_end(key)
+        return lined_tokens
+
+
+    def store(self, key: str, lined_tokens: List[List[str]]):
+        self.results[key] = lined_tokens
+        self.results.move_to_end(key)
+        while len(self.results) > self.maxsize:
+            self.results.popitem(last=False)
+
+
+    def cache_info(self) -> TokenizeCacheInfo:
+        return TokenizeCacheInfo(self.hits, self.misses, len(self.results))
+
+
+    def clear(self):
+        self.hits = 0
+        self.misses = 0
+        self.results.clear()
+
+
+    @staticmethod
+    def key(code: str, language: str = "python") -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(language.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(code.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+
+def __pattern(language: str) -> 're.Pattern[str]':
+    pattern = LANGUAGES.get(language)
+    if pattern is None:
+        raise ValueError(f"unknown language: {language}")
+    return pattern
@@ -0,0 +1,403 @@
+import hashlib
+import os
+import subprocess
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import (Any, Callable, Dict, Iterable, List, NamedTuple, Optional,
+                    Tuple, Union)
+
+from differ_for_code import DiffResult, differ
+from differ_for_code.tokenize import language_for, tokenize
+
+# Tree diff of two directories or two revisions of a git repository
+# files are paired by path, and the files whose contents have the same hash are never read again nor tokenized
+# the files only in after are paired with the files only in before (renames) or the changed files of before (copies)
+# by ranking the candidates with the upper bound of the characters and confirming the similarity,
+# and the files are diffed in a process pool, so the cost is proportional to the changed files
+
+STATUSES = ("modified", "added", "deleted", "renamed", "copied")
+
+# a rename/copy needs at least this similarity
+THRESHOLD = 0.5
+# the number of the candidates compared for a file at most
+MAX_CANDIDATES = 8
+
+
+# Files of a directory (the paths are relative, separated by "/")
+# the digest is the same as the blob ID of git, so a directory can be compared with a revision
+class DirectorySource:
+
+    def __init__(self, path: str):
+        self.path = path
+
+
+    def __repr__(self) -> str:
+        return f"DirectorySource({self.path!r})"
+
+
+    def files(self) -> Dict[str, Tuple[str, int]]:
+        # path -> (digest, size in bytes)
+        res = {}
+        for directory, directory_names, file_names in os.walk(self.path):
+            directory_names[:] = sorted(name for name in directory_names if name != ".git")
+            for file_name in sorted(file_names):
+                full_path = os.path.join(directory, file_name)
+                if os.path.islink(full_path) or not os.path.isfile(full_path):
+                    continue
+                with open(full_path, "rb") as f:
+                    data = f.read()
+                res[os.path.relpath(full_path, self.path).replace(os.sep, "/")] = (_blob_digest(data), len(data))
+        return res
+
+
+    def read(self, paths: Iterable[str]) -> Dict[str, bytes]:
+        res = {}
+        for path in paths:
+            with open(os.path.join(self.path, *path.split("/")), "rb") as f:
+                res[path] = f.read()
+        return res
+
+
+# Files of a revision of a local git repository (git is called as a subprocess)
+class GitSource:
+
+    def __init__(self, repository: str, revision: str):
+        self.repository = repository
+        self.revision = revision
+        # path -> blob ID
+        self.blobs: Dict[str, str] = {}
+
+
+    def __repr__(self) -> str:
+        return f"GitSource({self.repository!r}, {self.revision!r})"
+
+
+    def files(self) -> Dict[str, Tuple[str, int]]:
+        # mode SP type SP object SP size TAB path NUL (submodules are not files)
+        output = self.__git([ "ls-tree", "-r", "-z", "-l", self.revision ])
+        res = {}
+        for entry in output.split(b"\0"):
+            if not entry:
+                continue
+            info, path_bytes = entry.split(b"\t", 1)
+            _, object_type, blob, size = info.split()
+            if object_type != b"blob":
+                continue
+            path = path_bytes.decode("utf-8", "surrogateescape")
+            self.blobs[path] = blob.decode("ascii")
+            res[path] = (self.blobs[path], int(size))
+        return res
+
+
+    def read(self, paths: Iterable[str]) -> Dict[str, bytes]:
+        if not self.blobs:
+            self.files()
+        paths = list(paths)
+        if not paths:
+            return {}
+        # one process for all the blobs: (blob SP type SP size LF contents LF) for each blob
+        output = self.__git([ "cat-file", "--batch" ], "".join([ f"{self.blobs[path]}\n" for path in paths ]).encode("ascii"))
+        res = {}
+        position = 0
+        for path in paths:
+            header_end = output.index(b"\n", position)
+            size = int(output[position:header_end].split()[2])
+            res[path] = output[header_end + 1:header_end + 1 + size]
+            position = header_end + 1 + size + 1
+        return res
+
+
+    def __git(self, args: List[str], input: Optional[bytes] = None) -> bytes:
+        process = subprocess.run([ "git", "-C", self.repository ] + args, input=input, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if process.returncode != 0:
+            raise ValueError(f"git {args[0]} failed: {process.stderr.decode('utf-8', 'replace').strip()}")
+        return process.stdout
+
+
+TreeSource = Union[DirectorySource, GitSource]
+
+
+# Diff of a file in the tree
+# result is None if the contents are the same (exact rename/copy) or binary
+# distance and total are counted in the characters (in the bytes if result is None)
+class TreeFileDiff(NamedTuple):
+    status: str
+    before_path: Optional[str]
+    after_path: Optional[str]
+    result: Optional[DiffResult]
+    distance: int
+    total: int
+
+    def get_similarity(self) -> float:
+        if self.total == 0:
+            # no diff
+            return 1
+        return 1. - self.distance / self.total
+
+
+class TreeDiffResult:
+
+    def __init__(self, files: List[TreeFileDiff], unchanged: int, unchanged_total: int):
+        # changed files in the order of the path (after_path, or before_path if deleted)
+        self.files = files
+        # the number of the files of the same path and contents, and their total (2 * the bytes)
+        self.unchanged = unchanged
+        self.unchanged_total = unchanged_total
+
+
+    def __str__(self):
+        return "\n".join([ f"{file.status} {self.__format_paths(file)} {file.get_similarity():.3f}" for file in self.files ])
+
+
+    def get_distance(self) -> int:
+        return sum(file.distance for file in self.files)
+
+
+    def get_similarity(self) -> float:
+        total = self.unchanged_total + sum(file.total for file in self.files)
+        if total == 0:
+            # no diff
+            return 1
+        return 1. - self.get_distance() / total
+
+
+    def __format_paths(self, file: TreeFileDiff) -> str:
+        if file.before_path is None or file.after_path is None or file.before_path == file.after_path:
+            return file.after_path or file.before_path or ""
+        return f"{file.before_path} -> {file.after_path}"
+
+
+# Diff two directories (paths) or sources
+# copies: the files only in after are paired with the changed files of before too
+# language: the language of the files whose extensions are unknown (see tokenize.language_for)
+def diff_trees(
+    before: Union[str, TreeSource],
+    after: Union[str, TreeSource],
+    workers: Optional[int] = None,
+    algorithm: str = "ratcliff",
+    threshold: float = THRESHOLD,
+    copies: bool = False,
+    max_candidates: int = MAX_CANDIDATES,
+    language: str = "python") -> TreeDiffResult:
+
+    before_source = DirectorySource(before) if isinstance(before, str) else before
+    after_source = DirectorySource(after) if isinstance(after, str) else after
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    before_files = before_source.files()
+    after_files = after_source.files()
+
+    unchanged = 0
+    unchanged_total = 0
+    modified = []
+    for path, (digest, size) in after_files.items():
+        if path not in before_files:
+            continue
+        if before_files[path][0] == digest:
+            unchanged += 1
+            unchanged_total += 2 * size
+        else:
+            modified.append(path)
+    added = sorted(path for path in after_files if path not in before_files)
+    deleted = sorted(path for path in before_files if path not in after_files)
+
+    # (status, before_path, after_path) of the pairs
+    pairs: List[Tuple[str, Optional[str], Optional[str]]] = [ ("modified", path, path) for path in modified ]
+    # same contents, never read
+    exact_pairs: List[Tuple[str, str, str]] = []
+
+    # exact renames/copies by the digest
+    deleted_by_digest: Dict[str, List[str]] = {}
+    for path in deleted:
+        deleted_by_digest.setdefault(before_files[path][0], []).append(path)
+    before_by_digest = { digest: path for path, (digest, _) in sorted(before_files.items(), reverse=True) }
+    used = set()
+    remaining_added = []
+    for path in added:
+        digest = after_files[path][0]
+        rename_source = next((source for source in deleted_by_digest.get(digest, []) if source not in used), None)
+        if rename_source is not None:
+            used.add(rename_source)
+            exact_pairs.append(("renamed", rename_source, path))
+        elif copies and digest in before_by_digest:
+            exact_pairs.append(("copied", before_by_digest[digest], path))
+        else:
+            remaining_added.append(path)
+    remaining_deleted = [ path for path in deleted if path not in used ]
+    remaining_deleted_set = set(remaining_deleted)
+
+    # contents of the changed files only
+    sources = remaining_deleted + modified if copies else remaining_deleted
+    before_data = before_source.read(sorted(set(modified + sources)))
+    after_data = after_source.read(sorted(set(modified + remaining_added)))
+    before_texts = { path: __decode(data) for path, data in before_data.items() }
+    after_texts = { path: __decode(data) for path, data in after_data.items() }
+
+    with __executor(workers) as executor:
+        matches = __find_matches(remaining_added, sources, before_texts, after_texts, executor, algorithm, threshold, max_candidates, language)
+
+        # the most similar pairs first, and a deleted file is renamed once
+        matched = set()
+        for similarity, after_path, before_path in sorted(matches, key=lambda match: (-match[0], match[1], match[2])):
+            if after_path in matched:
+                continue
+            if before_path in remaining_deleted_set and before_path not in used:
+                used.add(before_path)
+                pairs.append(("renamed", before_path, after_path))
+            elif copies:
+                pairs.append(("copied", before_path, after_path))
+            else:
+                continue
+            matched.add(after_path)
+        pairs += [ ("added", None, path) for path in remaining_added if path not in matched ]
+        pairs += [ ("deleted", path, None) for path in remaining_deleted if path not in used ]
+
+        files = [
+            TreeFileDiff(status, before_path, after_path, None, 0, 2 * after_files[after_path][1])
+            for status, before_path, after_path in exact_pairs
+        ]
+        text_pairs = []
+        for status, before_path, after_path in pairs:
+            before_text = None if before_path is None else before_texts[before_path]
+            after_text = None if after_path is None else after_texts[after_path]
+            if __is_binary(before_text) or __is_binary(after_text):
+                before_size = 0 if before_path is None else before_files[before_path][1]
+                after_size = 0 if after_path is None else after_files[after_path][1]
+                files.append(TreeFileDiff(status, before_path, after_path, None, before_size + after_size, before_size + after_size))
+            else:
+                text_pairs.append((status, before_path, after_path, before_text, after_text))
+
+        results = executor.map(
+            __diff_texts,
+            [ before_text for _, _, _, before_text, _ in text_pairs ],
+            [ after_text for _, _, _, _, after_text in text_pairs ],
+            [ language_for(after_path or before_path, language) for _, before_path, after_path, _, _ in text_pairs ],
+            [ algorithm ] * len(text_pairs))
+        for (status, before_path, after_path, _, _), result in zip(text_pairs, results):
+            distance, total = DiffResult.count_distance(result.diffs)
+            files.append(TreeFileDiff(status, before_path, after_path, result, distance, total))
+
+    files.sort(key=lambda file: (file.after_path or file.before_path, file.before_path or ""))
+    return TreeDiffResult(files, unchanged, unchanged_total)
+
+
+# Diff two revisions of a local git repository
+def diff_revisions(repository: str, before_revision: str, after_revision: str, **options: Any) -> TreeDiffResult:
+    return diff_trees(GitSource(repository, before_revision), GitSource(repository, after_revision), **options)
+
+
+def _blob_digest(data: bytes) -> str:
+    # same as git hash-object
+    digest = hashlib.sha1(b"blob %d\0" % len(data))
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def __decode(data: bytes) -> str:
+    return data.decode("utf-8", "replace")
+
+
+def __is_binary(text: Optional[str]) -> bool:
+    return text is not None and "\0" in text
+
+
+def __profile(text: str) -> Tuple[int, Counter]:
+    # same as the profile of the tokens (tokenize is lossless except the line breaks)
+    counter = Counter(text)
+    del counter["\n"]
+    return (len(text) - text.count("\n"), counter)
+
+
+def __find_matches(
+    added: List[str],
+    sources: List[str],
+    before_texts: Dict[str, str],
+    after_texts: Dict[str, str],
+    executor: Any,
+    algorithm: str,
+    threshold: float,
+    max_candidates: int,
+    language: str) -> List[Tuple[float, str, str]]:
+
+    # (similarity, after_path, before_path) of the pairs whose similarity >= threshold
+    sources = [ path for path in sources if not __is_binary(before_texts[path]) ]
+    added = [ path for path in added if not __is_binary(after_texts[path]) ]
+    if not sources or not added:
+        return []
+
+    source_profiles = [ __profile(before_texts[path]) for path in sources ]
+    tasks = []
+    for path in added:
+        profile = __profile(after_texts[path])
+        candidates = sorted(
+            ((differ._upper_bound(source_profile, profile), source) for source, source_profile in zip(sources, source_profiles)),
+            key=lambda candidate: (-candidate[0], candidate[1]))
+        candidates = [ candidate for candidate in candidates[:max_candidates] if candidate[0] >= threshold ]
+        if candidates:
+            tasks.append((path, candidates))
+
+    # each source is tokenized once (in each language) for all the added files
+    languages = [ language_for(path, language) for path, _ in tasks ]
+    keys = sorted({ (source, task_language) for (_, candidates), task_language in zip(tasks, languages) for _, source in candidates })
+    source_tokens = dict(zip(keys, executor.map(tokenize, [ before_texts[source] for source, _ in keys ], [ key_language for _, key_language in keys ])))
+
+    results = executor.map(
+        __match_candidates,
+        [ after_texts[path] for path, _ in tasks ],
+        [ [ (upper_bound, source_tokens[(source, task_language)]) for upper_bound, source in candidates ]
+            for (_, candidates), task_language in zip(tasks, languages) ],
+        languages,
+        [ algorithm ] * len(tasks),
+        [ threshold ] * len(tasks))
+    matches = []
+    for (path, candidates), similarities in zip(tasks, results):
+        matches += [ (similarity, path, candidates[index][1]) for index, similarity in similarities ]
+    return matches
+
+
+def __match_candidates(
+    after_text: str,
+    candidates: List[Tuple[float, List[List[str]]]],
+    language: str,
+    algorithm: str,
+    threshold: float) -> List[Tuple[int, float]]:
+
+    # [ (index of the candidate, similarity) ] of every candidate whose similarity >= threshold
+    # NOTE: a candidate cannot be skipped by the best similarity so far, because the best source can be renamed
+    #       to another added file by the assignment (diff_trees), and then the next one is needed
+    after_lined_tokens = tokenize(after_text, language)
+    res = []
+    for index, (_, before_lined_tokens) in enumerate(candidates):
+        similarity = differ.similarity(before_lined_tokens, after_lined_tokens, algorithm=algorithm)
+        if similarity >= threshold:
+            res.append((index, similarity))
+    return res
+
+
+def __diff_texts(before_text: Optional[str], after_text: Optional[str], language: str, algorithm: str) -> DiffResult:
+    # no lines if the file does not exist
+    before_lined_tokens = [] if before_text is None else tokenize(before_text, language)
+    after_lined_tokens = [] if after_text is None else tokenize(after_text, language)
+    return differ.diff(before_lined_tokens, after_lined_tokens, algorithm=algorithm)
+
+
+class __InlineExecutor:
+    # executor.map in the current process (workers <= 1)
+
+    def __enter__(self) -> '__InlineExecutor':
+        return self
+
+
+    def __exit__(self, *args: Any):
+        pass
+
+
+    def map(self, function: Callable[..., Any], *iterables: Iterable[Any]) -> Iterable[Any]:
+        return map(function, *iterables)
+
+
+def __executor(workers: int) -> Any:
+    if workers <= 1:
+        return __InlineExecutor()
+    return ProcessPoolExecutor(workers)
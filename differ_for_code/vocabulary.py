@@ -0,0 +1,81 @@
+from array import array
+from typing import Dict, List, Sequence, Union
+
+
+# Map lines to small integers (IDs) so that the matcher compares integers instead of strings
+# A vocabulary can be shared by many diffs (e.g. whole corpus)
+# NOTE: encoding a line costs more than joining it, so differ.diff uses the IDs only if both sides are encoded
+#       beforehand (Vocabulary.encode), which pays off when a file is compared many times
+class Vocabulary:
+
+    def __init__(self):
+        # lines are identified by the joined string, same as differ.diff
+        self.line_ids: Dict[str, int] = {}
+        # the line of each line ID
+        self.lines: List[str] = []
+        # the number of characters of each line (indexed by line ID)
+        self.line_lengths = array("i")
+
+
+    def __len__(self) -> int:
+        # the number of line IDs
+        return len(self.line_lengths)
+
+
+    def line_id(self, line_tokens: List[str]) -> int:
+        line = "".join(line_tokens)
+        line_id = self.line_ids.get(line)
+        if line_id is None:
+            line_id = len(self.line_ids)
+            self.line_ids[line] = line_id
+            self.lines.append(line)
+            self.line_lengths.append(len(line))
+        return line_id
+
+
+    def line_length(self, line_id: int) -> int:
+        return self.line_lengths[line_id]
+
+
+    def encode_lines(self, lined_tokens: Sequence[List[str]]) -> List[int]:
+        # a list because SequenceMatcher is slower with an array (each item is boxed on access)
+        if isinstance(lined_tokens, EncodedLines) and lined_tokens.vocabulary is self:
+            return lined_tokens.line_ids.tolist()
+        return [ self.line_id(line_tokens) for line_tokens in lined_tokens ]
+
+
+    def encode_line_lengths(self, lined_tokens: Sequence[List[str]], lines: Sequence[int]) -> Sequence[int]:
+        # the number of characters of each line of encode_lines
+        if isinstance(lined_tokens, EncodedLines) and lined_tokens.vocabulary is self:
+            return lined_tokens.line_lengths
+        line_lengths = self.line_lengths
+        return [ line_lengths[line_id] for line_id in lines ]
+
+
+    def encode(self, lined_tokens: Sequence[List[str]]) -> 'EncodedDocument':
+        return EncodedDocument(lined_tokens, self)
+
+
+# Lined tokens whose lines are encoded beforehand by a vocabulary (EncodedDocument, corpus.CorpusFile)
+# the line IDs (or the joined lines) and the line lengths are used by differ in place of the tokens
+# the line IDs are kept compact (array or memoryview), and tolist() gives the list for the matcher
+class EncodedLines:
+    vocabulary: Vocabulary
+    line_ids: Union[array, memoryview]
+    lines: List[str]
+    line_lengths: Sequence[int]
+
+
+# Lined tokens whose lines are encoded once (Vocabulary.encode)
+# accepted in place of List[List[str]], and the line IDs (or the joined lines and the lengths) are reused by every diff
+# the joined lines are the same string objects for the same line, so they are compared by identity
+# NOTE: do not modify the lines
+class EncodedDocument(List[List[str]], EncodedLines):
+
+    def __init__(self, lined_tokens: Sequence[List[str]], vocabulary: Vocabulary):
+        super().__init__(lined_tokens)
+        self.vocabulary = vocabulary
+        self.line_ids = array("i", [ vocabulary.line_id(line_tokens) for line_tokens in self ])
+        self.lines = [ vocabulary.lines[line_id] for line_id in self.line_ids ]
+        line_lengths = vocabulary.line_lengths
+        self.line_lengths = array("i", [ line_lengths[line_id] for line_id in self.line_ids ])
@@ -3,6 +3,9 @@ from setuptools import setup, find_packages
 setup(
     name="differ-for-code",
     version="1.0.1",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
     install_requires=["colorama"],
+    extras_require={
+        "matrix": ["numpy", "scipy"],
+    },
 )
@@ -0,0 +1,98 @@
+import random
+import re
+from typing import List, Tuple
+
+# pairs of tokenized code for the tests
+# a copy of benchmarks.corpus, so that the tests do not depend on the benchmarks (not installed with the package)
+
+# lines which appear many times in real code (the case that triggers autojunk of SequenceMatcher)
+REPEATED_LINES = [
+    "{",
+    "}",
+    "",
+    "print ( )",
+    "    return",
+    "    pass",
+]
+
+IDENTIFIERS = [ "a", "b", "c", "i", "j", "n", "ans", "count", "total", "value", "items", "result" ]
+OPERATORS = [ "+", "-", "*", "//", "%", "==", "<", ">=" ]
+
+
+def tokenize(code: str) -> List[List[str]]:
+    # same as sample.py
+    return [ re.split(r"(\s)", line) for line in code.split("\n") ]
+
+
+# Generate a pair of tokenized code (before, after)
+# lines: the number of lines of before
+# edit_rate: ratio of the edited lines
+# repeat_ratio: ratio of the repeated lines (REPEATED_LINES)
+# replace_mix: ratio of the replaces whose number of lines are the same (LINE_REPLACE) among the replaces
+#              the others change the number of lines (BULK_REPLACE)
+def generate_pair(
+    lines: int,
+    edit_rate: float = 0.05,
+    repeat_ratio: float = 0.1,
+    replace_mix: float = 0.5,
+    seed: int = 0) -> Tuple[List[List[str]], List[List[str]]]:
+
+    generator = random.Random(seed)
+    before = [ __line(generator, repeat_ratio) for _ in range(lines) ]
+    after: List[str] = []
+
+    index = 0
+    while index < len(before):
+        if generator.random() >= edit_rate:
+            after.append(before[index])
+            index += 1
+            continue
+
+        edit = generator.random()
+        if edit < 0.25:
+            # insert
+            after.append(__line(generator, repeat_ratio))
+            after.append(before[index])
+            index += 1
+        elif edit < 0.5:
+            # delete
+            index += 1
+        else:
+            # replace a block of 1-3 lines
+            block = min(generator.randint(1, 3), len(before) - index)
+            if generator.random() < replace_mix:
+                # same number of lines (a token in each line is changed)
+                after += [ __edit_line(generator, line) for line in before[index:index + block] ]
+            else:
+                # different number of lines
+                after += [ __line(generator, repeat_ratio) for _ in range(block + generator.choice([ -1, 1 ]) if block > 1 else block + 1) ]
+            index += block
+
+    return (tokenize("\n".join(before)), tokenize("\n".join(after)))
+
+
+def __line(generator: random.Random, repeat_ratio: float) -> str:
+    if generator.random() < repeat_ratio:
+        return generator.choice(REPEATED_LINES)
+    indent = "    " * generator.randint(0, 3)
+    template = generator.randrange(4)
+    x, y, z = generator.choice(IDENTIFIERS), generator.choice(IDENTIFIERS), generator.choice(IDENTIFIERS)
+    operator = generator.choice(OPERATORS)
+    number = generator.randint(0, 100)
+    if template == 0:
+        return f"{indent}{x} = {y} {operator} {number}"
+    elif template == 1:
+        return f"{indent}for {x} in range ( {y} , {z} {operator} {number} ) :"
+    elif template == 2:
+        return f"{indent}if {x} {operator} {y} == {number} :"
+    else:
+        return f"{indent}print ( {x} , {y} {operator} {z} )"
+
+
+def __edit_line(generator: random.Random, line: str) -> str:
+    words = line.split(" ")
+    candidates = [ index for index, word in enumerate(words) if word != "" ]
+    if not candidates:
+        return generator.choice(IDENTIFIERS)
+    words[generator.choice(candidates)] = generator.choice(IDENTIFIERS + OPERATORS)
+    return " ".join(words)
@@ -0,0 +1,110 @@
+import random
+
+import pytest
+
+from differ_for_code import DiffType, algorithm, differ
+from differ_for_code.algorithm import ALGORITHMS, get_opcodes
+from pairs import generate_pair
+
+
+def longest_common_subsequence(a, b):
+    lengths = [ [ 0 ] * (len(b) + 1) for _ in range(len(a) + 1) ]
+    for i in range(len(a)):
+        for j in range(len(b)):
+            lengths[i + 1][j + 1] = lengths[i][j] + 1 if a[i] == b[j] else max(lengths[i][j + 1], lengths[i + 1][j])
+    return lengths[len(a)][len(b)]
+
+
+def check_opcodes(a, b, opcodes):
+    # the opcodes cover both sequences in order, and the equal blocks are equal
+    i = j = 0
+    for (tag, i1, i2, j1, j2), next_opcode in zip(opcodes, opcodes[1:] + [ None ]):
+        assert (i1, j1) == (i, j)
+        assert next_opcode is None or next_opcode[0] != tag
+        if tag == "equal":
+            assert a[i1:i2] == b[j1:j2]
+        i, j = i2, j2
+    assert (i, j) == (len(a), len(b))
+    return sum(i2 - i1 for tag, i1, i2, _, _ in opcodes if tag == "equal")
+
+
+def random_sequences(generator):
+    alphabet = generator.randint(1, 8)
+    a = [ generator.randint(0, alphabet) for _ in range(generator.randint(0, 30)) ]
+    b = [ generator.randint(0, alphabet) for _ in range(generator.randint(0, 30)) ]
+    return (a, b)
+
+
+@pytest.mark.parametrize("name", ALGORITHMS)
+def test_opcodes_are_valid(name):
+    generator = random.Random(1)
+    for _ in range(500):
+        a, b = random_sequences(generator)
+        check_opcodes(a, b, get_opcodes(a, b, name))
+
+
+def test_myers_is_minimal():
+    generator = random.Random(2)
+    for _ in range(500):
+        a, b = random_sequences(generator)
+        assert check_opcodes(a, b, get_opcodes(a, b, "myers")) == longest_common_subsequence(a, b)
+
+
+def test_patience_is_minimal_for_unique_lines():
+    generator = random.Random(3)
+    for _ in range(200):
+        a = generator.sample(range(40), generator.randint(0, 30))
+        b = generator.sample(range(40), generator.randint(0, 30))
+        assert check_opcodes(a, b, get_opcodes(a, b, "patience")) == longest_common_subsequence(a, b)
+
+
+def test_myers_cost_limit(monkeypatch):
+    # the regions over the limit are split heuristically, and the opcodes are still valid
+    monkeypatch.setattr(algorithm, "MYERS_MAX_COST", 2)
+    generator = random.Random(4)
+    for _ in range(500):
+        a, b = random_sequences(generator)
+        for name in ALGORITHMS:
+            check_opcodes(a, b, get_opcodes(a, b, name))
+    a = list(range(400))
+    b = a[200:] + a[:200]
+    assert check_opcodes(a, b, get_opcodes(a, b, "myers")) == 200
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_algorithms_agree_on_small_edits(seed):
+    before, after = generate_pair(300, edit_rate=0.01, repeat_ratio=0., seed=seed)
+    distances = { differ.count_distance(before, after, algorithm=name) for name in ALGORITHMS }
+    assert len(distances) == 1
+
+
+def reconstruct(diff):
+    # (before, after) lined tokens from the diffs
+    before, after = [], []
+    for line_diff in diff.diffs:
+        if line_diff.label == DiffType.BULK_REPLACE:
+            before += line_diff.before
+            after += line_diff.after
+        elif line_diff.label == DiffType.LINE_REPLACE:
+            before.append([ token_diff.before for token_diff in line_diff.before ])
+            after.append([ token_diff.after for token_diff in line_diff.after ])
+        else:
+            if line_diff.before is not None:
+                before.append(line_diff.before)
+            if line_diff.after is not None:
+                after.append(line_diff.after)
+    return (before, after)
+
+
+@pytest.mark.parametrize("name", ALGORITHMS)
+def test_diff_reconstructs_files(name):
+    for seed in range(10):
+        before, after = generate_pair(100, edit_rate=0.2, seed=seed)
+        diff = differ.diff(before, after, algorithm=name)
+        assert reconstruct(diff) == (before, after)
+        assert diff.get_distance() == differ.distance(before, after, algorithm=name)
+
+
+def test_unknown_algorithm():
+    with pytest.raises(ValueError):
+        get_opcodes([], [], "unknown")
@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+# the benchmarks are not installed with the package
+benchmarks_main = pytest.importorskip("benchmarks.__main__")
+
+
+def result(**metrics):
+    case = { "name": "lines=10", "diff_seconds": 1., "peak_memory_bytes": 1000 }
+    case.update(metrics)
+    return { "cases": [ case ] }
+
+
+def test_compare_threshold():
+    baseline = result()
+    assert benchmarks_main.compare(baseline, result(), 0.2) == []
+    # at most threshold worse than the baseline
+    assert benchmarks_main.compare(baseline, result(diff_seconds=1.2, peak_memory_bytes=1100), 0.2) == []
+    assert benchmarks_main.compare(baseline, result(diff_seconds=0.5), 0.2) == []
+    regressions = benchmarks_main.compare(baseline, result(diff_seconds=1.25), 0.2)
+    assert len(regressions) == 1
+    assert "diff_seconds" in regressions[0]
+    assert len(benchmarks_main.compare(baseline, result(diff_seconds=1.25, peak_memory_bytes=1300), 0.2)) == 2
+    assert benchmarks_main.compare(baseline, result(diff_seconds=1.25), 0.3) == []
+
+
+def test_compare_skips_missing_cases_and_metrics():
+    baseline = { "cases": [ { "name": "lines=10", "diff_seconds": 1. } ] }
+    assert benchmarks_main.compare(baseline, result(name="lines=100", diff_seconds=9.), 0.2) == []
+    # peak_memory_bytes is not in the baseline
+    assert benchmarks_main.compare(baseline, result(peak_memory_bytes=10 ** 9), 0.2) == []
+
+
+def test_main_fails_on_regression(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    output = tmp_path / "result.json"
+    args = [ "--lines", "10", "--repeat", "1", "--output", str(output) ]
+    assert benchmarks_main.main(args) == 0
+    # a baseline which takes no time
+    data = json.loads(output.read_text())
+    data["cases"][0]["diff_seconds"] = 0.
+    baseline.write_text(json.dumps(data))
+    assert benchmarks_main.main(args + [ "--baseline", str(baseline) ]) == 1
@@ -0,0 +1,95 @@
+import sqlite3
+import time
+
+from differ_for_code import CompactDiffs, differ
+from differ_for_code.cache import DiffCache
+from pairs import generate_pair
+
+
+def test_memory_cache():
+    before, after = generate_pair(50, edit_rate=0.2, seed=1)
+    with DiffCache(maxsize=1) as cache:
+        diff = cache.diff(before, after)
+        assert cache.diff(before, after) == diff
+        assert cache.diff(before, after, algorithm="myers") == differ.diff(before, after, algorithm="myers")
+        assert cache.cache_info() == (1, 0, 2, 1, 0)
+    assert diff == differ.diff(before, after)
+
+
+def test_hits_are_copies():
+    before = [ [ f"line {index}" ] for index in range(30) ]
+    # a moved block
+    after = before[:5] + before[20:25] + before[5:20] + before[25:]
+    with DiffCache() as cache:
+        diff = cache.diff(before, after, moves=True, stats=True)
+        diff.diffs.pop()
+        diff.moves.clear()
+        diff.get_similarity()
+        score_seconds = diff.stats.phase_seconds["score"]
+        hit = cache.diff(before, after, moves=True, stats=True)
+        assert hit is not diff
+        expected = differ.diff(before, after, moves=True)
+        assert hit == expected
+        assert len(hit.moves) == 1
+        assert hit.moves == expected.moves
+        assert hit.stats.phase_seconds["score"] <= score_seconds
+
+
+def test_disk_cache_round_trip(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    before, after = generate_pair(50, edit_rate=0.2, seed=2)
+    with DiffCache(path=path) as cache:
+        cache.diff(before, after, moves=True)
+        cache.diff(before, after, compact=True)
+    with DiffCache(path=path) as cache:
+        assert cache.diff(before, after, moves=True) == differ.diff(before, after, moves=True)
+        compact = cache.diff(before, after, compact=True)
+        assert isinstance(compact.diffs, CompactDiffs)
+        assert compact == differ.diff(before, after)
+        assert cache.cache_info().disk_hits == 2
+        assert cache.cache_info().misses == 0
+
+
+def test_expired_entries_are_not_loaded(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    before, after = generate_pair(50, edit_rate=0.2, seed=3)
+    with DiffCache(path=path) as cache:
+        cache.diff(before, after)
+    connection = sqlite3.connect(path)
+    connection.execute("UPDATE diffs SET accessed = ?", (time.time() - 3600,))
+    connection.commit()
+    connection.close()
+
+    with DiffCache(path=path, max_age=3600 * 2) as cache:
+        cache.diff(before, after)
+        assert cache.cache_info().disk_hits == 1
+    connection = sqlite3.connect(path)
+    connection.execute("UPDATE diffs SET accessed = ?", (time.time() - 3600,))
+    connection.commit()
+    connection.close()
+    with DiffCache(path=path, max_age=60) as cache:
+        assert cache.diff(before, after) == differ.diff(before, after)
+        assert cache.cache_info().disk_hits == 0
+        assert cache.cache_info().misses == 1
+
+
+def test_disk_size_limit(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    with DiffCache(path=path, max_disk_bytes=1) as cache:
+        for seed in range(3):
+            cache.diff(*generate_pair(20, seed=seed))
+        # every entry is larger than the limit
+        assert cache.cache_info().disk_size == 0
+
+
+def test_file_of_another_version_is_cleared(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE diffs (key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)")
+    before, after = generate_pair(20, seed=4)
+    connection.execute("INSERT INTO diffs VALUES (?, ?, ?, ?)", (DiffCache.key(before, after), b"\x80\x05", 2, time.time()))
+    connection.commit()
+    connection.close()
+    with DiffCache(path=path) as cache:
+        assert cache.cache_info().disk_size == 0
+        assert cache.diff(before, after) == differ.diff(before, after)
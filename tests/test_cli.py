@@ -0,0 +1,95 @@
+import io
+import json
+import threading
+import urllib.request
+
+import pytest
+
+from differ_for_code import cli, differ, serialize
+from pairs import generate_pair
+
+
+def requests(size: int = 6):
+    res = []
+    for seed in range(size):
+        before, after = generate_pair(30, edit_rate=0.2, seed=seed)
+        res.append(json.dumps({ "id": seed, "before": before, "after": after, "diff": seed == 0 }))
+    return res
+
+
+def check_response(line: str, request: str):
+    response = json.loads(line)
+    request_data = json.loads(request)
+    diff = differ.diff(request_data["before"], request_data["after"])
+    assert response["id"] == request_data["id"]
+    assert response["distance"] == diff.get_distance()
+    assert response["similarity"] == diff.get_similarity()
+    if request_data["diff"]:
+        assert serialize.from_json(response["diff"]) == diff
+    else:
+        assert "diff" not in response
+
+
+@pytest.mark.parametrize("unordered", [ False, True ])
+def test_batch(unordered):
+    lines = requests()
+    output = io.StringIO()
+    with cli.InlineExecutor() as executor:
+        cli.run_batch(io.StringIO("\n".join(lines + [ "" ])), output, executor, 2, unordered)
+    responses = output.getvalue().splitlines()
+    if unordered:
+        responses.sort(key=lambda line: json.loads(line)["id"])
+    assert len(responses) == len(lines)
+    for response, request in zip(responses, lines):
+        check_response(response, request)
+
+
+def test_unordered_batch_writes_finished_results():
+    lines = requests(3)
+    output = io.StringIO()
+
+    def input_lines():
+        for index, line in enumerate(lines):
+            # the results of the finished requests are written before the next line is read
+            assert len(output.getvalue().splitlines()) == index
+            yield line
+
+    with cli.InlineExecutor() as executor:
+        cli.run_batch(input_lines(), output, executor, 16, unordered=True)
+    assert len(output.getvalue().splitlines()) == len(lines)
+
+
+def test_invalid_request():
+    assert json.loads(cli.process_line("{"))["error"].startswith("JSONDecodeError")
+    assert json.loads(cli.process_line('{"id": 1}')) == { "id": 1, "error": "KeyError: 'before'" }
+
+
+def test_main_batch(tmp_path):
+    lines = requests(3)
+    input_path = tmp_path / "pairs.jsonl"
+    output_path = tmp_path / "results.jsonl"
+    input_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    assert cli.main([ "batch", "--input", str(input_path), "--output", str(output_path), "--workers", "1" ]) == 0
+    for response, request in zip(output_path.read_text(encoding="utf-8").splitlines(), lines):
+        check_response(response, request)
+
+
+def test_http_server():
+    lines = requests(3)
+    with cli.InlineExecutor() as executor:
+        server = cli.make_server(cli.DiffService(executor, 4), port=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}"
+            with urllib.request.urlopen(f"{url}/health") as response:
+                assert response.read() == b"ok\n"
+            request = urllib.request.Request(f"{url}/diff", data="\n".join(lines).encode("utf-8"), method="POST")
+            with urllib.request.urlopen(request) as response:
+                responses = response.read().decode("utf-8").splitlines()
+        finally:
+            server.shutdown()
+            server.server_close()
+    assert len(responses) == len(lines)
+    for response, request in zip(responses, lines):
+        check_response(response, request)
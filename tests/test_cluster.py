@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+from differ_for_code import differ
+from differ_for_code.cluster import cluster
+from pairs import generate_pair
+
+
+def families(seed: int = 0):
+    # near-duplicates of a few base files
+    generator = random.Random(seed)
+    items = []
+    for family in range(8):
+        for variant in range(generator.randint(1, 5)):
+            _, after = generate_pair(generator.randint(5, 20), edit_rate=0.2, seed=family * 100 + variant)
+            items.append(after)
+    generator.shuffle(items)
+    return items
+
+
+def similarities(items):
+    return { (index, other_index): differ.similarity(items[index], items[other_index])
+        for index in range(len(items)) for other_index in range(index + 1, len(items)) }
+
+
+def canonical(labels):
+    res = {}
+    return [ res.setdefault(label, len(res)) for label in labels ]
+
+
+@pytest.mark.parametrize("threshold", [ 0.5, 0.7, 0.85 ])
+def test_single_linkage_is_same_as_brute_force(threshold):
+    items = families()
+    parents = list(range(len(items)))
+
+    def find(index):
+        while parents[index] != index:
+            index = parents[index]
+        return index
+
+    for (index, other_index), similarity in similarities(items).items():
+        if similarity >= threshold:
+            parents[find(index)] = find(other_index)
+
+    result = cluster(items, threshold)
+    assert result.labels == canonical([ find(index) for index in range(len(items)) ])
+    assert len(result.pairs) < len(items) * (len(items) - 1) // 2
+
+
+@pytest.mark.parametrize("threshold", [ 0.5, 0.7, 0.85 ])
+def test_complete_linkage_is_valid_and_maximal(threshold):
+    items = families()
+    pair_similarities = similarities(items)
+
+    def is_similar(index, other_index):
+        return pair_similarities[min(index, other_index), max(index, other_index)] >= threshold
+
+    clusters = cluster(items, threshold, linkage="complete").clusters()
+    for indexes in clusters:
+        assert all(is_similar(index, other_index) for index in indexes for other_index in indexes if index < other_index)
+    for position, indexes in enumerate(clusters):
+        for other_indexes in clusters[position + 1:]:
+            assert not all(is_similar(index, other_index) for index in indexes for other_index in other_indexes)
+
+
+def test_pairs_are_exact_similarities():
+    items = families(1)
+    pair_similarities = similarities(items)
+    for index, other_index, similarity in cluster(items, 0.7).pairs:
+        assert similarity == pytest.approx(pair_similarities[index, other_index])
+
+
+def test_small_inputs():
+    assert cluster([], 0.5).labels == []
+    assert cluster([ [ [ "a" ] ] ], 0.5).labels == [ 0 ]
+    assert cluster([ [], [], [ [ "x" ] ] ], 0.5).labels == [ 0, 0, 1 ]
+    with pytest.raises(ValueError):
+        cluster([], 0.5, linkage="average")
@@ -0,0 +1,32 @@
+import pytest
+
+from differ_for_code import CompactDiffs, LineDiff, TokenDiff, differ
+from pairs import generate_pair
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_compact_is_same_as_list(seed):
+    before, after = generate_pair(100, edit_rate=0.2, seed=seed)
+    diff = differ.diff(before, after)
+    compact = differ.diff(before, after, compact=True)
+    assert isinstance(compact.diffs, CompactDiffs)
+    assert len(compact.diffs) == len(diff.diffs)
+    assert list(compact.diffs) == list(diff.diffs)
+    assert compact.diffs[-1] == diff.diffs[-1]
+    assert compact == diff
+    assert compact.get_distance() == diff.get_distance()
+    assert compact.get_similarity() == diff.get_similarity()
+    assert str(compact) == str(diff)
+
+
+def test_hash_is_consistent_with_eq():
+    before, after = generate_pair(100, edit_rate=0.2, seed=1)
+    diff = differ.diff(before, after, moves=True)
+    compact = differ.diff(before, after, compact=True, moves=True)
+    assert hash(compact) == hash(diff)
+    assert len({ diff, compact }) == 1
+    assert set(diff.diffs) == set(compact.diffs)
+
+    assert hash(TokenDiff.equal_token("a", 0, 1)) == hash(TokenDiff.equal_token("a", 0, 1))
+    assert LineDiff.equal_line([ "a" ], 0, 0) != LineDiff.insert_line([ "a" ], 0, 0)
+    assert { LineDiff.equal_line([ "a", "b" ], 0, 0): 1 }[LineDiff.equal_line([ "a", "b" ], 0, 0)] == 1
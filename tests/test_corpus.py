@@ -0,0 +1,83 @@
+import pickle
+
+import pytest
+
+from differ_for_code import differ
+from differ_for_code.corpus import Corpus
+from pairs import generate_pair
+
+
+def lined_tokens_list():
+    res = []
+    for seed in range(3):
+        before, after = generate_pair(40, edit_rate=0.2, seed=seed)
+        res += [ before, after ]
+    res.append([])
+    res.append([ [], [ "é", "\U0001f600", "\0" ], [] ])
+    return res
+
+
+def test_corpus_is_same_as_lists(tmp_path):
+    items = lined_tokens_list()
+    with Corpus.create(str(tmp_path / "corpus.bin"), items) as corpus:
+        assert len(corpus) == len(items)
+        assert [ list(item) for item in corpus ] == items
+        assert corpus[-1][1] == items[-1][1]
+        assert corpus[0][2:5] == items[0][2:5]
+        assert len(corpus[1]) == len(items[1])
+        assert differ.diff(corpus[0], corpus[1]) == differ.diff(items[0], items[1])
+        assert differ.similarity(corpus[2], corpus[3], vocabulary=corpus.vocabulary()) == differ.similarity(items[2], items[3])
+        assert differ.count_distance(corpus[-1], corpus[-2]) == differ.count_distance(items[-1], items[-2])
+        with pytest.raises(IndexError):
+            corpus[len(items)]
+        with pytest.raises(IndexError):
+            corpus[0][len(items[0])]
+
+
+def test_line_ids(tmp_path):
+    items = lined_tokens_list()
+    with Corpus.create(str(tmp_path / "corpus.bin"), items) as corpus:
+        # lines are identified by the joined string
+        assert corpus[-1].line_ids[0] == corpus[-1].line_ids[2]
+        assert corpus[-1].line_lengths == [ 0, 3, 0 ]
+        vocabulary = corpus.vocabulary()
+        assert vocabulary is corpus[0].vocabulary
+        assert vocabulary.encode(items[4]).line_ids.tolist() == corpus[4].line_ids.tolist()
+        assert vocabulary.encode_lines(corpus[5]) == corpus[5].line_ids.tolist()
+        assert len(vocabulary) == len(set(corpus.line_ids.tolist()))
+        assert differ.top_k(items[0], corpus, 3, vocabulary) == differ.top_k(items[0], items, 3)
+
+
+def test_only_changed_lines_are_decoded(tmp_path):
+    items = lined_tokens_list()
+    with Corpus.create(str(tmp_path / "corpus.bin"), items) as corpus:
+        decoded = []
+        line_tokens = corpus.line_tokens
+        corpus.line_tokens = lambda line_number: decoded.append(line_number) or line_tokens(line_number)
+        assert differ.similarity(corpus[0], corpus[1]) == differ.similarity(items[0], items[1])
+        assert 0 < len(decoded) < (len(items[0]) + len(items[1])) // 2
+
+
+def test_pickled_as_path(tmp_path):
+    items = lined_tokens_list()
+    path = str(tmp_path / "corpus.bin")
+    Corpus.create(path, items).close()
+    corpus = Corpus(path)
+    data = pickle.dumps(corpus[2])
+    assert len(data) < 200 + len(path)
+    assert list(pickle.loads(data)) == items[2]
+    corpus.close()
+
+
+def test_similarity_matrix(tmp_path):
+    numpy = pytest.importorskip("numpy")
+    items = lined_tokens_list()[:4]
+    with Corpus.create(str(tmp_path / "corpus.bin"), items) as corpus:
+        assert numpy.array_equal(differ.similarity_matrix(corpus, workers=2), differ.similarity_matrix(items, workers=1))
+
+
+def test_not_a_corpus(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        Corpus(str(path))
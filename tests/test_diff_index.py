@@ -0,0 +1,40 @@
+import pytest
+
+from differ_for_code import differ
+from differ_for_code.diff_index import DiffIndex
+from differ_for_code.vocabulary import Vocabulary
+from pairs import generate_pair
+
+
+def submissions(size: int = 6):
+    answer, _ = generate_pair(60, seed=0)
+    return answer, [ generate_pair(60, edit_rate=0.1 * index, seed=0)[1] for index in range(size) ]
+
+
+@pytest.mark.parametrize("side", [ "after", "before" ])
+@pytest.mark.parametrize("algorithm", [ "ratcliff", "histogram" ])
+def test_index_is_same_as_diff(side, algorithm):
+    answer, items = submissions()
+    index = DiffIndex(answer, side=side, algorithm=algorithm)
+    for item in items:
+        before, after = (item, answer) if side == "after" else (answer, item)
+        expected = differ.diff(before, after, algorithm=algorithm)
+        assert index.diff(item) == expected
+        assert index.diff(item, compact=True) == expected
+        assert list(index.iter_diff(item)) == list(expected.diffs)
+        assert index.distance(item) == expected.get_distance()
+        assert index.similarity(item) == expected.get_similarity()
+
+
+def test_diff_many():
+    answer, items = submissions()
+    index = DiffIndex(answer, vocabulary=Vocabulary())
+    expected = [ differ.diff(item, answer) for item in items ]
+    assert index.diff_many(items, workers=1) == expected
+    assert index.diff_many(items, workers=2, chunk_size=2) == expected
+    assert index.diff_many(items, workers=1, score_only=True) == [ diff.get_similarity() for diff in expected ]
+
+
+def test_unknown_side():
+    with pytest.raises(ValueError):
+        DiffIndex([], side="left")
@@ -0,0 +1,106 @@
+import pytest
+
+from differ_for_code import DiffResult, DiffType, differ
+from differ_for_code.differ import Alignment
+from differ_for_code.stats import DiffStats
+from differ_for_code.vocabulary import Vocabulary
+from pairs import generate_pair
+from test_algorithm import reconstruct
+
+
+def corpus(size: int = 8):
+    res = []
+    for seed in range(size // 2):
+        before, after = generate_pair(20, edit_rate=0.2, seed=seed)
+        res += [ before, after ]
+    return res
+
+
+def test_similarity_matrix_is_not_mirrored_by_default():
+    numpy = pytest.importorskip("numpy")
+    items = corpus()
+    matrix = differ.similarity_matrix(items, workers=1, chunk_size=5)
+    expected = numpy.array([ [ 1. if row == column else differ.similarity(items[row], items[column])
+        for column in range(len(items)) ] for row in range(len(items)) ])
+    assert numpy.array_equal(matrix, expected)
+
+
+def test_similarity_matrix_workers_and_threshold():
+    numpy = pytest.importorskip("numpy")
+    pytest.importorskip("scipy")
+    items = corpus()
+    dense = differ.similarity_matrix(items, workers=1)
+    assert numpy.array_equal(differ.similarity_matrix(items, workers=2, chunk_size=3), dense)
+    sparse = differ.similarity_matrix(items, workers=1, threshold=0.5)
+    assert numpy.array_equal(sparse.toarray(), numpy.where(dense >= 0.5, dense, 0.))
+
+
+def test_symmetric_similarity_matrix_mirrors_upper_triangle():
+    numpy = pytest.importorskip("numpy")
+    items = corpus()
+    matrix = differ.similarity_matrix(items, workers=1, symmetric=True)
+    assert numpy.array_equal(matrix, matrix.T)
+    for row in range(len(items)):
+        for column in range(row + 1, len(items)):
+            assert matrix[row, column] == differ.similarity(items[row], items[column])
+
+
+@pytest.mark.parametrize("algorithm", [ "ratcliff", "myers" ])
+@pytest.mark.parametrize("seed", range(5))
+def test_count_distance_is_same_as_diff(algorithm, seed):
+    before, after = generate_pair(100, edit_rate=0.3, replace_mix=0.5, seed=seed)
+    diff = differ.diff(before, after, algorithm=algorithm)
+    assert differ.count_distance(before, after, algorithm=algorithm) == diff.count_distance(diff.diffs)
+    assert differ.distance(before, after, algorithm=algorithm) == diff.get_distance()
+    assert differ.similarity(before, after, algorithm=algorithm) == diff.get_similarity()
+    assert differ.similarity([], []) == 1
+
+
+@pytest.mark.parametrize("options", [ {}, { "algorithm": "patience" }, { "align": True }, { "stats": True } ])
+def test_iter_diff_is_same_as_diff(options):
+    before, after = generate_pair(100, edit_rate=0.3, seed=1)
+    stream_options = dict(options)
+    if stream_options.pop("stats", False):
+        stream_options["stats"] = DiffStats()
+    diffs = list(differ.iter_diff(before, after, **stream_options))
+    assert diffs == list(differ.diff(before, after, **options).diffs)
+    assert DiffResult.count_distance(differ.iter_diff(before, after)) == differ.count_distance(before, after)
+
+
+@pytest.mark.parametrize("k", [ 1, 3, 20 ])
+def test_top_k_is_same_as_brute_force(k):
+    items = corpus(12)
+    query = items[0]
+    similarities = sorted(((-differ.similarity(query, item), index) for index, item in enumerate(items)))
+    expected = [ (index, -negative_similarity) for negative_similarity, index in similarities[:k] ]
+    assert differ.top_k(query, items, k) == expected
+    assert differ.top_k(query, items, k, vocabulary=Vocabulary()) == expected
+    assert differ.top_k(query, items, 0) == []
+
+
+@pytest.mark.parametrize("threshold", [ 0., 0.3, 0.6, 0.9, 1. ])
+def test_similarity_at_least(threshold):
+    items = corpus()
+    for item in items:
+        assert differ.similarity_at_least(items[0], item, threshold) == (differ.similarity(items[0], item) >= threshold)
+    assert differ.similarity_at_least(items[0], [ [ "x" * 1000 ] ], threshold) == (threshold <= differ.similarity(items[0], [ [ "x" * 1000 ] ]))
+
+
+def test_align_bulk_replace():
+    before = [ [ "x", " ", "=", " ", "1" ], [ "y", " ", "=", " ", "2" ] ]
+    after = [ [ "x", " ", "=", " ", "3" ], [ "z", "(", ")" ], [ "y", " ", "=", " ", "4" ] ]
+    assert [ line_diff.label for line_diff in differ.diff(before, after).diffs ] == [ DiffType.BULK_REPLACE ]
+    diff = differ.diff(before, after, align=True)
+    assert [ line_diff.label for line_diff in diff.diffs ] == [ DiffType.LINE_REPLACE, DiffType.INSERT, DiffType.LINE_REPLACE ]
+    assert diff.get_distance() == 2 + 3 + 2
+    assert differ.diff(before, after, align=Alignment(max_lines=2)).diffs == differ.diff(before, after).diffs
+    assert differ.diff(before, after, align=Alignment(cutoff=0.9)).diffs == differ.diff(before, after).diffs
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_align_reduces_distance(seed):
+    before, after = generate_pair(100, edit_rate=0.3, replace_mix=0.8, seed=seed)
+    diff = differ.diff(before, after, align=True)
+    assert diff.get_distance() <= differ.diff(before, after).get_distance()
+    assert differ.count_distance(before, after, align=True) == diff.count_distance(diff.diffs)
+    assert reconstruct(diff) == (before, after)
@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+from differ_for_code import DiffType, differ
+from differ_for_code.incremental import IncrementalDiffer
+from pairs import generate_pair
+from test_algorithm import reconstruct
+
+
+def random_edits(incremental, before, seed, steps=30):
+    rand = random.Random(seed)
+    for _ in range(steps):
+        size = len(incremental.after_lined_tokens)
+        start = rand.randrange(size + 1)
+        end = min(size, start + rand.randrange(3))
+        kind = rand.random()
+        if kind < 0.3:
+            lined_tokens = []
+        elif kind < 0.6:
+            lined_tokens = [ list(incremental.after_lined_tokens[max(0, start - 1)]) + [ "x" ] ] if size else [ [ "y" ] ]
+        else:
+            position = rand.randrange(len(before))
+            lined_tokens = [ list(line_tokens) for line_tokens in before[position:position + rand.randrange(3)] ]
+        yield incremental.replace_lines(start, end, lined_tokens)
+
+
+@pytest.mark.parametrize("algorithm", [ "ratcliff", "myers", "patience", "histogram" ])
+@pytest.mark.parametrize("seed", range(3))
+def test_edits_are_same_as_full_diff(algorithm, seed):
+    before, after = generate_pair(200, edit_rate=0.1, seed=seed)
+    incremental = IncrementalDiffer(before, after, algorithm=algorithm)
+    for diff in random_edits(incremental, before, seed):
+        assert diff == differ.diff(before, incremental.after_lined_tokens, algorithm=algorithm)
+
+
+def test_unchanged_diffs_are_reused():
+    before, after = generate_pair(300, edit_rate=0.05, seed=1)
+    incremental = IncrementalDiffer(before, after)
+    diffs = list(incremental.result.diffs)
+    start = len(after) // 2
+    incremental.replace_lines(start, start + 1, [ [ "edited" ] ])
+    assert incremental.result == differ.diff(before, incremental.after_lined_tokens)
+    assert all(diff is previous for diff, previous in zip(incremental.result.diffs[:start // 2], diffs))
+    # the same TokenDiffs after the edit
+    previous_token_diffs = { id(token_diff) for diff in diffs[start + 10:] if diff.label == DiffType.LINE_REPLACE for token_diff in diff.before }
+    token_diffs = [ id(token_diff) for diff in incremental.result.diffs[start + 10:] if diff.label == DiffType.LINE_REPLACE for token_diff in diff.before ]
+    assert token_diffs and all(token_diff in previous_token_diffs for token_diff in token_diffs)
+
+
+@pytest.mark.parametrize("algorithm", [ "ratcliff", "myers", "patience", "histogram" ])
+@pytest.mark.parametrize("seed", range(3))
+def test_window_edits_give_valid_diff(algorithm, seed):
+    before, after = generate_pair(200, edit_rate=0.1, seed=seed)
+    incremental = IncrementalDiffer(before, after, algorithm=algorithm, exact=False)
+    for diff in random_edits(incremental, before, seed):
+        assert reconstruct(diff) == (before, incremental.after_lined_tokens)
+    assert incremental.rediff() == differ.diff(before, incremental.after_lined_tokens, algorithm=algorithm)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_local_window_edit_is_same_as_full_diff(seed):
+    # an edit whose alignment does not change far lines
+    before, after = generate_pair(300, edit_rate=0.05, seed=seed)
+    incremental = IncrementalDiffer(before, after, exact=False)
+    assert incremental.result == differ.diff(before, after)
+    diffs = list(incremental.result.diffs)
+
+    start = len(after) // 2
+    incremental.replace_lines(start, start + 1, [ [ "edited", " ", f"line{seed}" ] ])
+    assert incremental.result == differ.diff(before, incremental.after_lined_tokens)
+    incremental.insert_lines(start, [ [ "inserted" ], [ "lines" ] ])
+    assert incremental.result == differ.diff(before, incremental.after_lined_tokens)
+    incremental.delete_lines(start, start + 3)
+    assert incremental.result == differ.diff(before, incremental.after_lined_tokens)
+    assert incremental.result.diffs[:start // 2] == diffs[:start // 2]
+    # the diffs before the edit are reused
+    assert all(diff is previous for diff, previous in zip(incremental.result.diffs[:start // 2], diffs))
+
+
+@pytest.mark.parametrize("exact", [ True, False ])
+def test_edit_of_empty_lines(exact):
+    incremental = IncrementalDiffer([], [], exact=exact)
+    incremental.insert_lines(0, [ [ "a" ], [ "b" ] ])
+    assert incremental.result == differ.diff([], [ [ "a" ], [ "b" ] ])
+    incremental.delete_lines(0, 2)
+    assert incremental.result == differ.diff([], [])
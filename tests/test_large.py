@@ -0,0 +1,37 @@
+import pytest
+
+from differ_for_code import differ, large
+from pairs import generate_pair
+from test_algorithm import reconstruct
+
+
+def test_small_files_are_same_as_diff():
+    before, after = generate_pair(500, edit_rate=0.1, seed=1)
+    expected = differ.diff(before, after)
+    assert large.diff(before, after) == expected
+    assert large.diff(before, after, compact=False) == expected
+    assert list(large.iter_diff(before, after)) == list(expected.diffs)
+    assert large.count_distance(before, after) == differ.count_distance(before, after)
+
+
+@pytest.mark.parametrize("algorithm", [ "ratcliff", "myers" ])
+def test_regions(algorithm):
+    before, after = generate_pair(3000, edit_rate=0.05, seed=2)
+    diff = large.diff(before, after, algorithm=algorithm, region_lines=200, max_memory_bytes=large.OPCODE_BYTES * 8)
+    assert reconstruct(diff) == (before, after)
+    assert large.count_distance(before, after, algorithm=algorithm, region_lines=200) == diff.count_distance(diff.diffs)
+    assert large.diff(before, after, algorithm=algorithm, region_lines=200, workers=2) == diff
+    # close to the whole diff
+    assert diff.get_distance() <= differ.diff(before, after, algorithm=algorithm).get_distance() * 1.1
+
+
+def test_opcode_spool():
+    opcodes = [ ("equal", 0, 1, 0, 1), ("equal", 1, 2, 1, 2), ("insert", 2, 2, 2, 5), ("delete", 2, 4, 5, 5), ("equal", 4, 5, 5, 6) ]
+    with large.OpcodeSpool(max_memory_bytes=1) as spool:
+        for opcode in opcodes:
+            spool.append(opcode)
+        assert spool.file is not None
+        assert len(spool) == 4
+        assert list(spool) == [ ("equal", 0, 2, 0, 2) ] + opcodes[2:]
+        # iterated again
+        assert list(spool) == [ ("equal", 0, 2, 0, 2) ] + opcodes[2:]
@@ -0,0 +1,44 @@
+from differ_for_code import DiffType, differ
+from differ_for_code.memo import InlineMemo
+from differ_for_code.normalize import Normalizer
+from pairs import generate_pair
+
+
+def test_memo_gives_same_results():
+    memo = InlineMemo()
+    for seed in range(4):
+        before, after = generate_pair(100, edit_rate=0.3, seed=seed)
+        assert differ.diff(before, after, memo=memo) == differ.diff(before, after)
+        assert differ.diff(before, after, memo=memo, align=True) == differ.diff(before, after, align=True)
+        normalizer = Normalizer(identifiers=True)
+        assert differ.diff(before, after, memo=memo, normalizer=normalizer) == differ.diff(before, after, normalizer=normalizer)
+    info = memo.memo_info()
+    assert info.hits > 0 and info.misses > 0
+    assert 0 < info.hit_rate() < 1
+
+
+def test_repeated_pairs_hit():
+    before, after = generate_pair(100, edit_rate=0.3, seed=1)
+    memo = InlineMemo()
+    first = differ.diff(before, after, memo=memo)
+    misses = memo.misses
+    second = differ.diff(before, after, memo=memo)
+    assert first == second
+    assert memo.misses == misses
+    assert memo.hits == misses
+    # each LineReplace has its own lists
+    assert all(first_diff.before is not second_diff.before for first_diff, second_diff in zip(first.diffs, second.diffs) if first_diff.label == DiffType.LINE_REPLACE)
+
+
+def test_lru():
+    memo = InlineMemo(maxsize=2)
+    memo.store("a", ([], []))
+    memo.store("b", ([], []))
+    assert memo.lookup("a") is not None
+    memo.store("c", ([], []))
+    assert memo.lookup("b") is None
+    assert memo.lookup("a") is not None
+    assert memo.memo_info() == (2, 1, 2)
+    memo.clear()
+    assert memo.memo_info() == (0, 0, 0)
+    assert memo.memo_info().hit_rate() == 0.
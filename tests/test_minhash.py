@@ -0,0 +1,81 @@
+import pytest
+
+from differ_for_code import differ
+from differ_for_code.minhash import MinHashIndex
+from pairs import generate_pair
+
+
+def make_corpus():
+    corpus = {}
+    for seed in range(10):
+        before, after = generate_pair(60, edit_rate=0.1, seed=seed)
+        corpus[("file", seed, "before")] = before
+        corpus[("file", seed, "after")] = after
+    return corpus
+
+
+def test_near_duplicate_is_candidate():
+    corpus = make_corpus()
+    index = MinHashIndex()
+    for key, lined_tokens in corpus.items():
+        index.add(key, lined_tokens)
+    assert len(index) == len(corpus)
+    assert ("file", 3, "after") in index.query(corpus[("file", 3, "before")])
+    index.remove(("file", 3, "after"))
+    assert ("file", 3, "after") not in index
+    assert ("file", 3, "after") not in index.query(corpus[("file", 3, "before")])
+
+
+@pytest.mark.parametrize("threshold", [ 0., 0.5, 0.9 ])
+def test_search_is_same_as_verifying_candidates(threshold):
+    corpus = make_corpus()
+    index = MinHashIndex()
+    for key, lined_tokens in corpus.items():
+        index.add(key, lined_tokens)
+    query = corpus[("file", 0, "before")]
+    expected = sorted(
+        ((key, differ.similarity(query, corpus[key])) for key in index.query(query)
+         if differ.similarity(query, corpus[key]) >= threshold),
+        key=lambda item: (-item[1], list(corpus).index(item[0])))
+    assert index.search(query, corpus.__getitem__, threshold) == expected
+    assert index.search(query, corpus.__getitem__, threshold, algorithm="myers") == [
+        (key, similarity) for key, similarity in
+        sorted(((key, differ.similarity(query, corpus[key], algorithm="myers")) for key in index.query(query)), key=lambda item: (-item[1], list(corpus).index(item[0])))
+        if similarity >= threshold
+    ]
+
+
+def test_ties_are_in_the_order_of_addition():
+    before, after = generate_pair(60, edit_rate=0.1, seed=1)
+    keys = [ "x", 3, ("y", 1), "a", 0, "b" ]
+    corpus = { key: before for key in keys }
+    corpus["near"] = after
+    index = MinHashIndex()
+    index.add("near", after)
+    for key in keys:
+        index.add(key, before)
+    # re-added keys are moved to the end
+    index.add("x", before)
+    expected = keys[1:] + [ "x" ]
+    assert [ key for key, _ in index.search(before, corpus.__getitem__, 0.) ] == expected + [ "near" ]
+
+
+def test_save_and_load_keep_keys(tmp_path):
+    corpus = make_corpus()
+    index = MinHashIndex(num_perm=64, bands=16)
+    for key, lined_tokens in corpus.items():
+        index.add(key, lined_tokens)
+    index.add("name", corpus[("file", 0, "before")])
+    index.add(7, corpus[("file", 1, "before")])
+    index.add(("nested", ("key", 1)), corpus[("file", 2, "before")])
+    path = str(tmp_path / "index.json")
+    index.save(path)
+
+    loaded = MinHashIndex.load(path)
+    assert loaded.signatures == index.signatures
+    assert sorted(loaded.orders, key=loaded.orders.__getitem__) == sorted(index.orders, key=index.orders.__getitem__)
+    assert ("nested", ("key", 1)) in loaded
+    for lined_tokens in corpus.values():
+        assert loaded.query(lined_tokens) == index.query(lined_tokens)
+    loaded.remove(("file", 0, "after"))
+    assert ("file", 0, "after") not in loaded
@@ -0,0 +1,47 @@
+from differ_for_code import DiffType, differ
+from differ_for_code.moves import detect_moves
+from pairs import generate_pair
+
+
+def moved_pair():
+    before, _ = generate_pair(60, edit_rate=0, repeat_ratio=0, seed=3)
+    # lines 10-20 are moved after line 40
+    after = before[:10] + before[20:40] + before[10:20] + before[40:]
+    return before, after
+
+
+def test_moved_block():
+    before, after = moved_pair()
+    diff = differ.diff(before, after, moves=True)
+    assert len(diff.moves) == 1
+    move = diff.moves[0]
+    assert move.label == DiffType.MOVE
+    assert move.before == after[move.after_line_start_number:move.after_line_end_number]
+    assert move.before == before[move.before_line_start_number:move.before_line_end_number]
+    assert move.before_line_end_number - move.before_line_start_number == 10
+    assert diff.diffs == differ.diff(before, after).diffs
+
+    moved = 2 * sum(len("".join(line_tokens)) for line_tokens in move.before)
+    assert diff.get_distance(exclude_moves=True) == diff.get_distance() - moved
+    assert diff.get_similarity(exclude_moves=True) > diff.get_similarity()
+
+
+def test_min_lines():
+    before, after = moved_pair()
+    diffs = differ.diff(before, after).diffs
+    assert detect_moves(diffs, min_lines=11) == []
+    assert len(detect_moves(diffs, min_lines=10)) == 1
+    assert detect_moves(differ.diff(before, before).diffs) == []
+
+
+def test_moves_are_consistent():
+    count = 0
+    for seed in range(5):
+        before, after = generate_pair(200, edit_rate=0.3, seed=seed)
+        after = after[100:] + after[:100]
+        for move in differ.diff(before, after, moves=True).moves:
+            count += 1
+            assert move.before == before[move.before_line_start_number:move.before_line_end_number]
+            assert move.after == after[move.after_line_start_number:move.after_line_end_number]
+            assert [ "".join(line_tokens) for line_tokens in move.before ] == [ "".join(line_tokens) for line_tokens in move.after ]
+    assert count > 0
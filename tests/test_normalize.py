@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from differ_for_code import DiffType, LineReplace, differ
+from differ_for_code.normalize import Normalizer
+from pairs import generate_pair
+from test_algorithm import reconstruct
+
+NORMALIZERS = [
+    Normalizer(),
+    Normalizer(identifiers=True, literals=True),
+    Normalizer(ignore_whitespace=False, casefold=True),
+]
+
+
+def reindent(lined_tokens, seed):
+    rand = random.Random(seed)
+    res = []
+    for line_tokens in lined_tokens:
+        line_tokens = list(line_tokens)
+        if line_tokens and rand.random() < 0.3:
+            if line_tokens[0].strip() == "":
+                line_tokens[0] += "  "
+            else:
+                line_tokens.insert(0, "    ")
+        res.append(line_tokens)
+    return res
+
+
+def test_indentation_is_ignored():
+    before = [ [ "def", " ", "f", "(", ")", ":" ], [ "    ", "return", " ", "1" ] ]
+    after = [ [ "def", " ", "f", "(", ")", ":" ], [ "        ", "return", " ", "1" ] ]
+    diff = differ.diff(before, after, normalizer=Normalizer())
+    assert [ line_diff.label for line_diff in diff.diffs ] == [ DiffType.EQUAL, DiffType.EQUAL ]
+    assert diff.diffs[1].before == before[1] and diff.diffs[1].after == after[1]
+    assert diff.get_distance() == 0
+    assert differ.diff(before, after).get_distance() > 0
+
+
+def test_identifiers_and_literals():
+    before = [ [ "x", " ", "=", " ", "f", "(", "1", ")" ] ]
+    after = [ [ "y", " ", "=", " ", "g", "(", "2", ")" ] ]
+    assert differ.diff(before, after, normalizer=Normalizer(identifiers=True, literals=True)).get_distance() == 0
+    assert differ.diff(before, after, normalizer=Normalizer(identifiers=True)).get_distance() == 2
+
+
+@pytest.mark.parametrize("normalizer", NORMALIZERS, ids=repr)
+@pytest.mark.parametrize("seed", range(5))
+def test_token_diffs_refer_to_original_columns(normalizer, seed):
+    before, after = generate_pair(80, edit_rate=0.3, seed=seed)
+    after = reindent(after, seed)
+    diff = differ.diff(before, after, normalizer=normalizer)
+    assert reconstruct(diff) == (before, after)
+    for line_diff in diff.diffs:
+        if type(line_diff) != LineReplace:
+            continue
+        before_text = "".join(token_diff.before for token_diff in line_diff.before)
+        after_text = "".join(token_diff.after for token_diff in line_diff.after)
+        for token_diff in line_diff.before + line_diff.after:
+            if token_diff.label in [ DiffType.EQUAL, DiffType.DELETE ]:
+                start = token_diff.before_column_start_number
+                assert before_text[start:start + len(token_diff.before)] == token_diff.before
+            if token_diff.label in [ DiffType.EQUAL, DiffType.INSERT ]:
+                start = token_diff.after_column_start_number
+                assert after_text[start:start + len(token_diff.after)] == token_diff.after
+        # every EQUAL token has its partner on the other side
+        before_equals = [ (token_diff.before, token_diff.after) for token_diff in line_diff.before if token_diff.label == DiffType.EQUAL ]
+        after_equals = [ (token_diff.before, token_diff.after) for token_diff in line_diff.after if token_diff.label == DiffType.EQUAL ]
+        assert before_equals == after_equals
+
+
+@pytest.mark.parametrize("normalizer", NORMALIZERS, ids=repr)
+@pytest.mark.parametrize("align", [ False, True ])
+def test_count_distance_and_compact(normalizer, align):
+    for seed in range(5):
+        before, after = generate_pair(80, edit_rate=0.3, seed=seed)
+        after = reindent(after, seed)
+        diff = differ.diff(before, after, normalizer=normalizer, align=align)
+        assert differ.diff(before, after, normalizer=normalizer, align=align, compact=True) == diff
+        distance, total = differ.count_distance(before, after, normalizer=normalizer, align=align)
+        assert (distance, total) == diff.count_distance(diff.diffs)
@@ -0,0 +1,44 @@
+import io
+
+import pytest
+
+from differ_for_code import differ, renderer
+from pairs import generate_pair
+
+
+def test_plain():
+    before = [ [ "a", " ", "=", " ", "1" ], [ "b" ], [ "c" ] ]
+    after = [ [ "a", " ", "=", " ", "2" ], [ "c" ], [ "d" ] ]
+    # BULK_REPLACE (before, then after), EQUAL and INSERT
+    assert differ.diff(before, after).render(format="plain") == "a = 1\nb\na = 2\nc\nd\n"
+
+
+def test_html_is_escaped():
+    diff = differ.diff([ [ "<", "a", ">" ] ], [ [ "<", "b", ">" ] ])
+    text = diff.render(format="html")
+    assert text.startswith(renderer.HTML_STYLE)
+    assert '<span class="delete">&lt;</span><span class="replace">a</span><span class="delete">&gt;</span>' in text
+    assert "<a>" not in text
+
+
+@pytest.mark.parametrize("format", renderer.FORMATS)
+def test_stream_is_same_as_string(format):
+    before, after = generate_pair(200, edit_rate=0.3, seed=1)
+    diff = differ.diff(before, after)
+    stream = io.StringIO()
+    writer = renderer.Renderer(stream, format, buffer_size=64)
+    writer.render(diff.diffs)
+    assert writer.close() is None
+    assert stream.getvalue() == diff.render(format=format)
+
+
+def test_visualize(capsys):
+    before, after = generate_pair(50, edit_rate=0.3, seed=2)
+    diff = differ.diff(before, after)
+    diff.visualize()
+    assert capsys.readouterr().out == diff.render(format="ansi")
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        renderer.Renderer(format="pdf")
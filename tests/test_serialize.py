@@ -0,0 +1,61 @@
+import io
+
+import pytest
+
+from differ_for_code import differ, serialize
+from differ_for_code.normalize import Normalizer
+from pairs import generate_pair
+
+
+def results():
+    res = []
+    for seed in range(3):
+        before, after = generate_pair(80, edit_rate=0.3, seed=seed)
+        res.append(differ.diff(before, after))
+        res.append(differ.diff(before, after, moves=True, align=True))
+        res.append(differ.diff(before, [ [ "    " ] + line_tokens for line_tokens in after ], normalizer=Normalizer()))
+    res.append(differ.diff([], []))
+    res.append(differ.diff([ [ "é", "\U0001f600" ] ], [ [ "" ], [ "\n" ] ]))
+    # lone surrogates
+    res.append(differ.diff([ [ "a", "\ud800" ] ], [ [ "a", "\udfff", "\ud83d" ] ]))
+    return res
+
+
+@pytest.mark.parametrize("format", serialize.FORMATS)
+def test_round_trip(format):
+    for result in results():
+        loaded = serialize.loads(serialize.dumps(result, format), format)
+        assert loaded == result
+        assert loaded.moves == result.moves
+        assert loaded.get_distance() == result.get_distance()
+
+
+@pytest.mark.parametrize("format", serialize.FORMATS)
+def test_file_and_archive(format, tmp_path):
+    items = results()
+    path = tmp_path / f"diffs.{format}"
+    with open(path, "wb") as f:
+        for result in items:
+            result.dump(f, format)
+    with open(path, "rb") as f:
+        assert list(serialize.load_all(f, format)) == items
+    with serialize.DiffArchive(str(path), format) as archive:
+        assert len(archive) == len(items)
+        assert archive[3] == items[3]
+        assert list(archive) == items
+
+
+def test_empty_archive_and_truncated_file(tmp_path):
+    path = tmp_path / "empty.bin"
+    path.write_bytes(b"")
+    with serialize.DiffArchive(str(path)) as archive:
+        assert len(archive) == 0
+    stream = io.BytesIO()
+    results()[0].dump(stream)
+    with pytest.raises(ValueError):
+        serialize.load(io.BytesIO(stream.getvalue()[:-1]))
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        serialize.dumps(differ.diff([], []), "xml")
@@ -0,0 +1,61 @@
+from differ_for_code import DiffType, LineReplace, differ, stats
+from differ_for_code.cache import DiffCache
+from differ_for_code.memo import InlineMemo
+from pairs import generate_pair
+
+
+def test_stats():
+    before, after = generate_pair(100, edit_rate=0.3, seed=1)
+    diff = differ.diff(before, after, stats=True)
+    assert diff == differ.diff(before, after)
+    assert diff.stats is not None
+    diff.get_similarity()
+    assert set(diff.stats.phase_seconds) == set(stats.PHASES)
+
+    line_replaces = [ line_diff for line_diff in diff.diffs if type(line_diff) == LineReplace ]
+    assert diff.stats.opcode_counts.get(DiffType.LINE_REPLACE.value, 0) <= len(line_replaces)
+    assert diff.stats.inline_matcher_calls == len(line_replaces)
+    assert diff.stats.tokens_compared == sum(len(line_diff.before) + len(line_diff.after) for line_diff in line_replaces)
+    assert diff.stats.objects_allocated == len(diff.diffs) + diff.stats.tokens_compared
+    assert differ.diff(before, after).stats is None
+
+
+def test_memo_hits():
+    before, after = generate_pair(100, edit_rate=0.3, seed=1)
+    memo = InlineMemo()
+    differ.diff(before, after, memo=memo)
+    diff = differ.diff(before, after, memo=memo, stats=True)
+    assert diff.stats.inline_matcher_calls == 0
+    assert diff.stats.inline_memo_hits == memo.hits > 0
+
+
+def test_hooks():
+    collected = []
+    stats.add_hook(collected.append)
+    try:
+        diff = differ.diff([ [ "a" ] ], [ [ "b" ] ])
+    finally:
+        stats.remove_hook(collected.append)
+    assert len(collected) == 1
+    assert collected[0].to_dict()["opcode_counts"] == { DiffType.LINE_REPLACE.value: 1 }
+    # the hook sees every phase, and the later scores do not change it
+    assert set(collected[0].phase_seconds) == set(stats.PHASES)
+    score_seconds = collected[0].phase_seconds["score"]
+    diff.get_similarity()
+    assert collected[0].phase_seconds["score"] == score_seconds
+    assert diff.stats.phase_seconds["score"] >= score_seconds
+    differ.diff([ [ "a" ] ], [ [ "b" ] ])
+    assert len(collected) == 1
+
+
+def test_cache_hits_do_not_call_hooks():
+    collected = []
+    stats.add_hook(collected.append)
+    try:
+        with DiffCache() as cache:
+            cache.diff([ [ "a" ] ], [ [ "b" ] ])
+            cache.diff([ [ "a" ] ], [ [ "b" ] ])
+            assert cache.cache_info().hits == 1
+    finally:
+        stats.remove_hook(collected.append)
+    assert len(collected) == 1
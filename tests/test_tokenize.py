@@ -0,0 +1,62 @@
+import pytest
+
+from differ_for_code.tokenize import (TokenizeCache, iter_tokens, language_for,
+                                      tokenize, tokenize_many)
+
+PYTHON_CODE = '''def f(x, y=1.5e3):
+    """doc
+    string"""
+    return x ** 2 >= y  # comment
+'''
+
+C_CODE = '''int main() {
+    /* block
+       comment */
+    printf("%d\\n", a >>= 0x1F);  // end
+}'''
+
+
+@pytest.mark.parametrize("code, language", [ (PYTHON_CODE, "python"), (C_CODE, "c"), ("", "python"), ("\n\n", "c") ])
+def test_lossless(code, language):
+    lined_tokens = tokenize(code, language)
+    assert "\n".join("".join(line_tokens) for line_tokens in lined_tokens) == code
+    assert all(token != "" and "\n" not in token for line_tokens in lined_tokens for token in line_tokens)
+
+
+def test_tokens():
+    lined_tokens = tokenize(PYTHON_CODE)
+    assert lined_tokens[0] == [ "def", " ", "f", "(", "x", ",", " ", "y", "=", "1.5e3", ")", ":" ]
+    assert lined_tokens[1] == [ "    ", '"""doc' ]
+    assert lined_tokens[3] == [ "    ", "return", " ", "x", " ", "**", " ", "2", " ", ">=", " ", "y", "  ", "# comment" ]
+    lined_tokens = tokenize(C_CODE, "c")
+    assert lined_tokens[1:3] == [ [ "    ", "/* block" ], [ "       comment */" ] ]
+    assert lined_tokens[3] == [ "    ", "printf", "(", '"%d\\n"', ",", " ", "a", " ", ">>=", " ", "0x1F", ")", ";", "  ", "// end" ]
+
+
+def test_iter_tokens():
+    lines = PYTHON_CODE.split("\n")
+    for line_number, column_number, token in iter_tokens(PYTHON_CODE):
+        assert lines[line_number][column_number:column_number + len(token)] == token
+
+
+def test_language_for():
+    assert language_for("a/b.PY") == "python"
+    assert language_for("main.cpp") == "c"
+    assert language_for("README", "c") == "c"
+    with pytest.raises(ValueError):
+        tokenize("", "cobol")
+
+
+@pytest.mark.parametrize("workers", [ 1, 2 ])
+def test_tokenize_many_and_cache(workers):
+    codes = [ PYTHON_CODE, "x = 1\n", PYTHON_CODE, "y = 2\n" ]
+    cache = TokenizeCache(maxsize=2)
+    results = tokenize_many(codes, workers=workers, cache=cache, chunk_size=1)
+    assert results == [ tokenize(code) for code in codes ]
+    assert results[0] is results[2]
+    assert cache.cache_info() == (0, 4, 2)
+    assert tokenize_many([ "y = 2\n" ], cache=cache) == [ tokenize("y = 2\n") ]
+    assert cache.cache_info().hits == 1
+    assert cache.tokenize("x = 1\n") == tokenize("x = 1\n")
+    cache.clear()
+    assert cache.cache_info() == (0, 0, 0)
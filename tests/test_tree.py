@@ -0,0 +1,131 @@
+import shutil
+import subprocess
+
+import pytest
+
+from differ_for_code import differ, tree
+from differ_for_code.tokenize import tokenize
+
+BASE = "".join(f"def function{index}(value):\n    return value + {index}\n\n" for index in range(20))
+
+
+def write(root, files):
+    for path, text in files.items():
+        file_path = root / path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(text if isinstance(text, bytes) else text.encode("utf-8"))
+
+
+def make_trees(tmp_path):
+    before = tmp_path / "before"
+    after = tmp_path / "after"
+    write(before, {
+        "same.py": BASE,
+        "modified.py": BASE,
+        "deleted.py": "print('deleted')\n",
+        "old/renamed.py": BASE.replace("value", "x"),
+        "exact.py": BASE.replace("def", "async def"),
+        "binary.bin": b"\0\1\2",
+    })
+    write(after, {
+        "same.py": BASE,
+        "modified.py": BASE.replace("+ 3", "- 3"),
+        "added.py": "print('added')\n",
+        "new/renamed.py": BASE.replace("value", "x").replace("+ 5", "* 5"),
+        "moved.py": BASE.replace("def", "async def"),
+        "binary.bin": b"\0\1\3",
+    })
+    return before, after
+
+
+def test_diff_trees(tmp_path):
+    before, after = make_trees(tmp_path)
+    result = tree.diff_trees(str(before), str(after), workers=1)
+    statuses = { (file.status, file.before_path, file.after_path) for file in result.files }
+    assert statuses == {
+        ("modified", "modified.py", "modified.py"),
+        ("added", None, "added.py"),
+        ("deleted", "deleted.py", None),
+        ("renamed", "old/renamed.py", "new/renamed.py"),
+        ("renamed", "exact.py", "moved.py"),
+        ("modified", "binary.bin", "binary.bin"),
+    }
+    assert result.unchanged == 1
+
+    modified = next(file for file in result.files if file.after_path == "modified.py")
+    expected = differ.diff(tokenize(BASE, "python"), tokenize(BASE.replace("+ 3", "- 3"), "python"))
+    assert modified.result == expected
+    assert (modified.distance, modified.total) == expected.count_distance(expected.diffs)
+    renamed = next(file for file in result.files if file.after_path == "new/renamed.py")
+    assert renamed.get_similarity() >= tree.THRESHOLD
+    exact = next(file for file in result.files if file.after_path == "moved.py")
+    assert exact.result is None and exact.distance == 0
+
+
+def test_copies(tmp_path):
+    before, after = make_trees(tmp_path)
+    write(after, { "copy.py": BASE.replace("+ 3", "- 3") + "print('copy')\n" })
+    result = tree.diff_trees(str(before), str(after), workers=1, copies=True)
+    assert ("copied", "modified.py", "copy.py") in { (file.status, file.before_path, file.after_path) for file in result.files }
+
+
+def test_sources_are_tokenized_once(tmp_path, monkeypatch):
+    before = tmp_path / "before"
+    after = tmp_path / "after"
+    write(before, { f"source{index}.py": BASE + f"print({index})\n" for index in range(3) })
+    write(after, { f"added{index}.py": BASE + f"print({index}, 'added')\n" for index in range(4) })
+    texts = []
+
+    def counted_tokenize(text, language):
+        texts.append(text)
+        return tokenize(text, language)
+
+    monkeypatch.setattr(tree, "tokenize", counted_tokenize)
+    result = tree.diff_trees(str(before), str(after), workers=1)
+    assert sorted(file.status for file in result.files) == [ "added", "renamed", "renamed", "renamed" ]
+    # once for matching, and once for the diff of the rename
+    for index in range(3):
+        assert texts.count(BASE + f"print({index})\n") == 2
+
+
+def test_added_files_compete_for_one_source(tmp_path):
+    # b.py takes x.py, so a.py is renamed from y.py (less similar to a.py than x.py)
+    other = "".join(f"class Item{index}:\n    size = {index * 7}\n\n" for index in range(10))
+    before = tmp_path / "before"
+    after = tmp_path / "after"
+    write(before, { "x.py": BASE[:len(BASE) // 2], "y.py": other })
+    write(after, {
+        "a.py": BASE[:int(len(BASE) // 2 * 0.8)] + other[:len(other) // 2],
+        "b.py": BASE[:len(BASE) // 2].replace("+ 3", "- 3"),
+    })
+    result = tree.diff_trees(str(before), str(after), workers=1, threshold=0.3)
+    assert { (file.status, file.before_path, file.after_path) for file in result.files } == {
+        ("renamed", "x.py", "b.py"),
+        ("renamed", "y.py", "a.py"),
+    }
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_directory_is_same_as_revision(tmp_path):
+    before, after = make_trees(tmp_path)
+    repository = tmp_path / "repository"
+    shutil.copytree(before, repository)
+
+    def git(*args):
+        subprocess.run([ "git", "-C", str(repository), "-c", "user.name=test", "-c", "user.email=test@example.com" ] + list(args),
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    git("init", "-q")
+    git("add", "-A")
+    git("commit", "-q", "-m", "before")
+    for path in repository.iterdir():
+        if path.name != ".git":
+            shutil.rmtree(path) if path.is_dir() else path.unlink()
+    shutil.copytree(after, repository, dirs_exist_ok=True)
+    git("add", "-A")
+    git("commit", "-q", "-m", "after")
+
+    expected = tree.diff_trees(str(before), str(after), workers=1)
+    result = tree.diff_revisions(str(repository), "HEAD~1", "HEAD", workers=1)
+    assert str(result) == str(expected)
+    assert tree.diff_trees(str(before), tree.GitSource(str(repository), "HEAD~1"), workers=1).files == []
@@ -0,0 +1,59 @@
+import pickle
+
+import pytest
+
+from differ_for_code import differ
+from differ_for_code.vocabulary import EncodedDocument, Vocabulary
+from pairs import generate_pair
+
+
+@pytest.mark.parametrize("algorithm", [ "ratcliff", "myers", "patience", "histogram" ])
+def test_encoded_documents_give_same_results(algorithm):
+    vocabulary = Vocabulary()
+    for seed in range(10):
+        before, after = generate_pair(40, edit_rate=0.2, seed=seed)
+        encoded_before, encoded_after = vocabulary.encode(before), vocabulary.encode(after)
+        expected = differ.diff(before, after, algorithm=algorithm)
+        assert differ.diff(encoded_before, encoded_after, vocabulary, algorithm) == expected
+        assert differ.count_distance(encoded_before, encoded_after, vocabulary, algorithm) == differ.count_distance(before, after, algorithm=algorithm)
+        # only one side encoded, or encoded by another vocabulary
+        assert differ.similarity(encoded_before, after, vocabulary, algorithm) == expected.get_similarity()
+        assert differ.similarity(encoded_before, encoded_after, Vocabulary(), algorithm) == expected.get_similarity()
+
+
+def test_top_k_encodes_query_only_for_encoded_items(monkeypatch):
+    vocabulary = Vocabulary()
+    corpus = [ generate_pair(30, edit_rate=0.2, seed=seed)[0] for seed in range(4) ]
+    query = generate_pair(30, edit_rate=0.2, seed=0)[1]
+    expected = differ.top_k(query, corpus, 2)
+    encode = vocabulary.encode
+    encoded = []
+    monkeypatch.setattr(vocabulary, "encode", lambda lined_tokens: encoded.append(lined_tokens) or encode(lined_tokens))
+    assert differ.top_k(query, corpus, 2, vocabulary) == expected
+    assert encoded == []
+    encoded_corpus = [ encode(lined_tokens) for lined_tokens in corpus ]
+    assert differ.top_k(query, encoded_corpus, 2, vocabulary) == expected
+    assert encoded == [ query ]
+
+
+def test_encode():
+    vocabulary = Vocabulary()
+    document = vocabulary.encode([ [ "a", " ", "b" ], [ "c" ], [ "a ", "b" ] ])
+    assert isinstance(document, EncodedDocument)
+    assert document == [ [ "a", " ", "b" ], [ "c" ], [ "a ", "b" ] ]
+    # lines are identified by the joined string
+    assert document.line_ids.tolist() == [ 0, 1, 0 ]
+    assert document.line_lengths.tolist() == [ 3, 1, 3 ]
+    assert document.lines[0] is document.lines[2]
+    assert vocabulary.encode_lines(document) == [ 0, 1, 0 ]
+    assert vocabulary.encode_lines([ [ "c" ], [ "d" ] ]) == [ 1, 2 ]
+    assert vocabulary.line_length(2) == 1
+    assert len(vocabulary) == 3
+
+
+def test_pickle():
+    vocabulary = Vocabulary()
+    document = pickle.loads(pickle.dumps(vocabulary.encode([ [ "x", "=", "1" ] ])))
+    assert document == [ [ "x", "=", "1" ] ]
+    assert document.line_ids.tolist() == [ 0 ]
+    assert document.lines == [ "x=1" ]